@@ -1,9 +1,10 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, send_file
 import os
+import gc
 from dotenv import load_dotenv
 import time
-from transformers import pipeline
-import psutil
+import threading
+from concurrent.futures import Future
 import json
 from pathlib import Path
 
@@ -15,644 +16,742 @@ from pathlib import Path
 
 load_dotenv()
 
-app = Flask(__name__)
+# Local modules read their settings from the environment on import
+from batching import QueueFullError, GEN_MAX_NEW_TOKENS, INTERACTIVE, BULK
+from model_config import MODEL_LIST, CURRENT_MODEL, GENERATION_PRESETS
+from model_registry import ModelRegistry
+from translation_cache import TranslationCache, make_key
+from segmentation import split_text, segments, join_pieces, estimate_tokens
+from feedback_store import FeedbackStore
+from translation_memory import TranslationMemory
+from inference_pool import INFERENCE_SOCKET, InferenceClient, RemoteRegistry
+import metrics
+from system_stats import SystemSampler
+from rate_limit import TokenBucketLimiter, RateLimited
+from routing import PairRouter
+from single_flight import SingleFlight
+from file_jobs import JobManager, JOB_CHUNK_UNITS
+from web_assets import AssetBundle
+import wire_format
+from wire_format import read_payload, respond
+from ws_transport import Sock, PipelinedConnection, WS_MAX_CONNECTIONS
+
+app = Flask(__name__, static_folder=None)
+
+# Optional transports: the app runs without them, but clients relying on them won't get them
+if Sock is None:
+    print("Пакет flask-sock не установлен: эндпоинт /ws отключён")
+if wire_format.msgpack is None:
+    print("Пакет msgpack не установлен: MessagePack отключён, только JSON")
+if wire_format.zstandard is None:
+    print("Пакет zstandard не установлен: ответы сжимаются только gzip")
 
 HISTORY_FILE = Path('translation_history.json')
-CURRENT_MODEL = "Helsinki-NLP/opus-mt-de-en"
-
-MODEL_LIST = [
-   {"name": "Helsinki-NLP/opus-mt-de-en", "value": "Helsinki-NLP/opus-mt-de-en", "description": "German-English", "from": "de", "to": "en", "icon": "🇩🇪🇬🇧"},
-#    {"name": "Helsinki-NLP/opus-mt-en-de", "value": "Helsinki-NLP/opus-mt-en-de", "description": "English-German", "from": "en", "to": "de", "icon": "🇬🇧🇩🇪"},
-#    {"name": "Helsinki-NLP/opus-mt-fr-en", "value": "Helsinki-NLP/opus-mt-fr-en", "description": "French-English", "from": "fr", "to": "en", "icon": "🇫🇷🇧"},
-#    {"name": "Helsinki-NLP/opus-mt-ru-en", "value": "Helsinki-NLP/opus-mt-ru-en", "description": "Russian-English", "from": "ru", "to": "en", "icon": "🇷🇺🇬🇧"},
-#    {"name": "Helsinki-NLP/opus-mt-en-ru", "value": "Helsinki-NLP/opus-mt-en-ru", "description": "English-Russian", "from": "en", "to": "ru", "icon": "🇬🇧🇷🇺"}
-]
-
-# for each model in MODEL_LIST
-for model in MODEL_LIST:
-    try:
-        model["pipe"] = pipeline("translation", model=model["value"])
-    except Exception as e:
-        print(f"Ошибка загрузки модели {model['value']}: {str(e)}")
-        continue
+
+# Models are loaded on first request; only PRELOAD_MODELS are loaded at startup.
+# With INFERENCE_SOCKET set they live in the inference processes instead (inference_pool.py)
+if INFERENCE_SOCKET:
+    registry = RemoteRegistry(MODEL_LIST, InferenceClient(INFERENCE_SOCKET))
+else:
+    registry = ModelRegistry(MODEL_LIST)
+PRELOAD_MODELS = [value.strip() for value in os.environ.get("PRELOAD_MODELS", CURRENT_MODEL).split(",") if value.strip()]
+# Only the weights are loaded here; warm_up() runs in every serving process
+# (gunicorn's post_worker_init), since kernel initialization doesn't survive fork
+registry.preload(PRELOAD_MODELS, warm=False)
+
+# With gunicorn preload_app the preloaded models are loaded once in the master and
+# shared copy-on-write with the workers. Freezing moves everything allocated so
+# far out of the GC's reach, so collections in workers don't write to (and copy)
+# the shared pages.
+gc.freeze()
+
+
+
+def warm_up(notify=None):
+    registry.warm_up(notify=notify)
+    # File jobs interrupted by a restart are picked up again by a serving process
+    jobs.ensure_started()
+    # One worker on the host compacts the feedback log now and then
+    feedback_store.ensure_compactor()
+
+
+MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", 1000))
+# Per-request deadline in seconds (clients may ask for less with "timeout"); below gunicorn's timeout
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", 110))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", 1))
+
+translation_cache = TranslationCache()
+# Identical requests in flight at the same time (in this worker or another) share one translation
+single_flight = SingleFlight()
+
+# Requests up to this many (estimated) input tokens are scheduled in the interactive lane
+INTERACTIVE_MAX_TOKENS = int(os.environ.get("INTERACTIVE_MAX_TOKENS", 256))
+# Per-client limits (API key or IP) on the translation endpoints, see rate_limit.py
+RATE_LIMITED_ENDPOINTS = {'screen_translator', 'translate', 'translate_stream', 'translate_batch_endpoint', 'translator'}
+limiter = TokenBucketLimiter()
+# Only these keys get their own bucket; any other X-API-Key is limited by IP, so fresh
+# random keys neither reset a client's limit nor push other buckets out of the LRU
+API_KEYS = frozenset(key.strip() for key in os.environ.get("API_KEYS", "").split(",") if key.strip())
+# Pairs without a direct model are served through pivot languages (fr→en→de)
+router = PairRouter(registry, translation_cache)
+
+
+# Preset for /screen_translator when the request doesn't pick one ("" = model defaults)
+SCREEN_TRANSLATOR_MODE = os.environ.get("SCREEN_TRANSLATOR_MODE", "fast")
+MAX_NUM_BEAMS = int(os.environ.get("MAX_NUM_BEAMS", 8))
+
+
+def parse_bool(value):
+    # Query and form values arrive as strings: "0", "false", "no", "off" and "" are False
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "0", "false", "no", "off")
+    return bool(value)
+
+
+def generation_params(selected_model, data, mode=None):
+    # Model defaults < preset ("mode") < explicit request options
+    params = dict(selected_model.get("generation", {}))
+    mode = data.get('mode', mode)
+    if mode:
+        if mode not in GENERATION_PRESETS:
+            raise ValueError(f"Unknown mode: {mode}")
+        params.update(GENERATION_PRESETS[mode])
+    if 'num_beams' in data:
+        params['num_beams'] = int(data['num_beams'])
+    if 'max_new_tokens' in data:
+        params['max_new_tokens'] = int(data['max_new_tokens'])
+    if 'early_stopping' in data:
+        params['early_stopping'] = parse_bool(data['early_stopping'])
+
+    if not 1 <= params.get('num_beams', 1) <= MAX_NUM_BEAMS:
+        raise ValueError(f"num_beams must be between 1 and {MAX_NUM_BEAMS}")
+    if 'max_new_tokens' in params and not 1 <= params['max_new_tokens'] <= GEN_MAX_NEW_TOKENS:
+        raise ValueError(f"max_new_tokens must be between 1 and {GEN_MAX_NEW_TOKENS}")
+    return params
+
+
+def request_deadline(data):
+    timeout = REQUEST_TIMEOUT
+    try:
+        timeout = min(float(data.get('timeout', REQUEST_TIMEOUT)), REQUEST_TIMEOUT)
+    except (TypeError, ValueError):
+        pass
+    return time.time() + timeout
 
 
-def load_history():
+def wait_result(future, deadline):
+    timeout = None if deadline is None else max(0.0, deadline - time.time())
+    return future.result(timeout)
+
+
+def resolve_pair(source_lang, target_lang, store=True):
+    # Direct model if there is one, otherwise a pivot chain; None if the pair is unreachable.
+    # store=False: the chain doesn't write its hop results to the shared cache
+    model_value = f"Helsinki-NLP/opus-mt-{source_lang}-{target_lang}"
+    if registry.find(model_value):
+        return registry.get(model_value)
+    route = router.route(source_lang, target_lang)
+    return router.chain_model(route, store) if route else None
+
+
+def select_model(data, store=True):
+    # "model" from MODEL_LIST, or a "source"/"target" pair (possibly via a pivot)
+    if 'model' not in data and 'source' in data and 'target' in data:
+        return resolve_pair(data['source'], data['target'], store)
+    model_value = data.get('model', CURRENT_MODEL)
+    return registry.get(model_value) if registry.find(model_value) else None
+
+
+def request_lane(texts):
+    # Short requests go first; long documents wait behind them in the bulk lane
+    return INTERACTIVE if sum(map(estimate_tokens, texts)) <= INTERACTIVE_MAX_TOKENS else BULK
+
+
+def error_payload(e):
+    # Full queue or no inference server -> 503 with Retry-After, missed deadline -> 504, anything else -> 400
+    if isinstance(e, (QueueFullError, ConnectionError)):
+        return {"error": str(e)}, 503, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+    if isinstance(e, TimeoutError):
+        return {"error": str(e) or "Deadline exceeded"}, 504, {}
+    return {"error": str(e)}, 400, {}
+
+
+def error_response(e):
+    return respond(*error_payload(e))
+
+
+def lookup_segment(selected_model, text, params=None):
+    # Cache first, then the translation memory (near-duplicates of earlier translations)
+    cached = translation_cache.get(selected_model["value"], text, params)
+    if cached is None:
+        cached, _ = translation_memory.lookup(selected_model["value"], text, params)
+    return cached
+
+
+def remember(selected_model, text, translation, params=None):
+    translation_cache.set(selected_model["value"], text, translation, params)
+    translation_memory.add(selected_model["value"], text, translation, params=params)
+
+
+def translate_segments(selected_model, texts, deadline=None, params=None):
+    # Uncached segments go to the micro-batcher together, so they run as one batch.
+    # Returns (translations, cached): cached when no segment needed the model
+    results = {}
+    futures = {}
+    lane = request_lane(texts)
+    for text in dict.fromkeys(texts):
+        cached = lookup_segment(selected_model, text, params) if len(texts) > 1 else None
+        if cached is not None:
+            results[text] = cached
+        else:
+            futures[text] = selected_model["batcher"].submit(text, deadline, params, lane)
+    for text, future in futures.items():
+        results[text] = wait_result(future, deadline)
+        remember(selected_model, text, results[text], params)
+    return [results[text] for text in texts], not futures
+
+
+def translate_text(selected_model, text, deadline=None, params=None):
+    # Returns (translation, cached); a result shared with an identical in-flight request counts as cached
+    cached = lookup_segment(selected_model, text, params)
+    if cached is not None:
+        return cached, True
+
+    def compute():
+        # Long texts are split into sentences/chunks so nothing is cut off at 512 tokens
+        pieces = split_text(text, selected_model.get("encoder"))
+        translations, cached = translate_segments(selected_model, segments(pieces), deadline, params)
+        translation = join_pieces(pieces, translations)
+        translation_cache.set(selected_model["value"], text, translation, params)
+        return [translation, cached]
+
+    (translation, cached), coalesced = single_flight.run(make_key(selected_model["value"], text, params), compute, deadline)
+    return translation, cached or coalesced
+
+
+def stream_translation(selected_model, text, deadline=None, params=None):
+    # Yields each translated segment (with the whitespace before it) as soon as it
+    # is ready, then a final summary chunk with the full translation
+    start = last = time.time()
+    cached = lookup_segment(selected_model, text, params)
+    if cached is not None:
+        yield {"index": 0, "text": cached, "seconds": 0.0, "elapsed": 0.0}
+        yield {"done": True, "text": "", "translated_text": cached, "cached": True, "seconds": time.time() - start}
+        return
+
+    # Sentence by sentence even when the text fits, so the first one shows up early
+    pieces = split_text(text, selected_model.get("encoder"), by_sentence=True)
+    futures = {}
+    cached = True
+    lane = request_lane(segments(pieces))
+    for segment in segments(pieces):
+        if segment not in futures:
+            hit = lookup_segment(selected_model, segment, params)
+            if hit is not None:
+                futures[segment] = Future()
+                futures[segment].set_result(hit)
+            else:
+                futures[segment] = selected_model["batcher"].submit(segment, deadline, params, lane)
+                cached = False
+
+    prefix = ""
+    translations = []
+    for is_segment, piece in pieces:
+        if not is_segment:
+            prefix += piece
+            continue
+        translation = wait_result(futures[piece], deadline)
+        remember(selected_model, piece, translation, params)
+        translations.append(translation)
+        now = time.time()
+        yield {"index": len(translations) - 1, "text": prefix + translation, "seconds": now - last, "elapsed": now - start}
+        prefix = ""
+        last = now
+
+    translation = join_pieces(pieces, translations)
+    translation_cache.set(selected_model["value"], text, translation, params)
+    yield {"done": True, "text": prefix, "translated_text": translation, "cached": cached, "seconds": time.time() - start}
+
+
+def batch_results(selected_model, texts, key, deadline=None, params=None, lane=None, store=True):
+    # Per-item results in input order: {key: translation, "cached": bool} or {"error": message}.
+    # Without a lane, small batches go to the interactive lane (see request_lane); with
+    # store=False results are not added to the translation cache and memory
+    if len(texts) > MAX_BATCH_ITEMS:
+        raise ValueError(f"Too many texts: {len(texts)} > {MAX_BATCH_ITEMS}")
+    results = [None] * len(texts)
+    pending = {}
+    for i, text in enumerate(texts):
+        if not isinstance(text, str):
+            results[i] = {"error": "Text must be a string"}
+        elif not text.strip():
+            results[i] = {"error": "Empty text"}
+        else:
+            cached = lookup_segment(selected_model, text, params)
+            if cached is not None:
+                results[i] = {key: cached, "cached": True}
+            else:
+                pending[i] = split_text(text, selected_model.get("encoder"))
+
+    # All segments of all items go through the pipeline in length-sorted batches
+    unique = list(dict.fromkeys(segment for pieces in pending.values() for segment in segments(pieces)))
+    batcher = selected_model["batcher"]
+    translated = dict(zip(unique, batcher.translate_batch(unique, deadline, params, lane or request_lane(unique))))
+    for segment, translation in translated.items():
+        if store and not isinstance(translation, Exception):
+            translation_memory.add(selected_model["value"], segment, translation, params=params)
+    for i, pieces in pending.items():
+        item = [translated[segment] for segment in segments(pieces)]
+        error = next((result for result in item if isinstance(result, Exception)), None)
+        if error is not None:
+            results[i] = {"error": str(error)}
+        else:
+            translation = join_pieces(pieces, item)
+            if store:
+                translation_cache.set(selected_model["value"], texts[i], translation, params)
+            results[i] = {key: translation, "cached": False}
+    return results
+
+
+def request_client():
+    key = request.headers.get('X-API-Key')
+    if key in API_KEYS:
+        return 'key:' + key
+    return request.remote_addr or 'unknown'
+
+def request_cost(data):
+    # Estimated input tokens of a translation request, for the rate limiter
+    texts = data.get('texts', data.get('text')) if isinstance(data, dict) else None
+    if isinstance(texts, str):
+        texts = [texts]
+    elif not isinstance(texts, list):
+        # Malformed bodies cost 1; the endpoint itself answers them with 400
+        return 1
+    return max(1, sum(estimate_tokens(text) for text in texts if isinstance(text, str)))
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def rate_limit():
+    if not limiter.enabled or request.endpoint not in RATE_LIMITED_ENDPOINTS:
+        return None
     try:
-        if not HISTORY_FILE.exists():
-            HISTORY_FILE.write_text('[]', encoding='utf-8')
-        return json.loads(HISTORY_FILE.read_text(encoding='utf-8'))
-    except Exception as e:
-        print(f"Ошибка загрузки истории: {str(e)}")
-        return []
+        limiter.acquire(request_client(), request_cost(read_payload(silent=True)))
+    except RateLimited as e:
+        return respond({"error": str(e)}, 429, {"Retry-After": str(e.retry_after)})
+    return None
+
+@app.after_request
+def record_request(response):
+    if request.endpoint not in (None, 'metrics_endpoint', 'static'):
+        metrics.REQUESTS.inc(endpoint=request.endpoint, status=response.status_code)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=request.endpoint)
+    return response
+
+
+# Feedback goes to an append-only JSON Lines log; the old JSON file is migrated once
+feedback_store = FeedbackStore(legacy_path=HISTORY_FILE)
+# Liked translations from the log plus this worker's model results
+translation_memory = TranslationMemory(feedback_store)
+
+
+def translate_job_chunk(options, texts):
+    # One chunk of a file job: one translation or exception per text. File contents are
+    # rarely requested again, so they don't push interactive entries out of the cache and memory
+    selected_model = select_model(options, store=False)
+    if selected_model is None:
+        raise ValueError("Invalid model")
+    params = generation_params(selected_model, options)
+    # Always bulk, however small the chunk: jobs must not compete with interactive requests
+    results = batch_results(selected_model, texts, "translated_text", None, params, BULK, store=False)
+    return [result["translated_text"] if "translated_text" in result else ValueError(result["error"]) for result in results]
+
+
+# Uploaded files are translated in the background in large batches, see file_jobs.py
+# A full queue or a missing inference server only delays a job: it resumes from its checkpoint
+# Chunks over MAX_BATCH_ITEMS would all be rejected, so JOB_CHUNK_UNITS is capped at it
+if JOB_CHUNK_UNITS > MAX_BATCH_ITEMS:
+    print(f"JOB_CHUNK_UNITS={JOB_CHUNK_UNITS} больше MAX_BATCH_ITEMS, используется {MAX_BATCH_ITEMS}")
+jobs = JobManager(translate_job_chunk, retry_errors=(QueueFullError, ConnectionError),
+                  chunk_units=min(JOB_CHUNK_UNITS, MAX_BATCH_ITEMS))
+
 
 def save_history(history_item):
-    history = load_history()
-    history.append(history_item)
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+    feedback_store.append(history_item)
+    translation_memory.add_feedback(history_item)
 
 
-@app.route("/screen_translator", methods=["POST"])
-def screen_translator():
-    try:
-        data = request.get_json()
-        if not data or 'text' not in data:
-            return jsonify({"error": "No text provided"}), 400
-            
-        text = data.get('text')
-        source_lang = data.get('source', 'de')  # default to German
-        target_lang = data.get('target', 'en')  # default to English
-        
-        # Find the appropriate model based on language pair
-        model_value = f"Helsinki-NLP/opus-mt-{source_lang}-{target_lang}"
-        selected_model = next((model for model in MODEL_LIST if model["value"] == model_value), None)
-        
-        if not selected_model:
-            return jsonify({"error": f"Unsupported language pair: {source_lang}-{target_lang}"}), 400
-            
-        if not text.strip():
-            return jsonify({"error": "Empty text"}), 400
-            
-        translated_text = selected_model["pipe"](text)
-        actual_text = translated_text[0]['translation_text']
-        
-        # Return format matching Google Translate API
-        return jsonify({
-            "text": actual_text,
+def screen_translate_request(data):
+    # /screen_translator (and "screen_translator" messages on /ws): returns (payload, status)
+    if not data or 'text' not in data:
+        return {"error": "No text provided"}, 400
+
+    text = data.get('text')
+    source_lang = data.get('source', 'de')  # default to German
+    target_lang = data.get('target', 'en')  # default to English
+
+    # Find the appropriate model based on language pair (or a chain through a pivot language)
+    selected_model = resolve_pair(source_lang, target_lang)
+    if selected_model is None:
+        return {"error": f"Unsupported language pair: {source_lang}-{target_lang}"}, 400
+    # Short UI strings: the latency preset unless the request asks otherwise
+    params = generation_params(selected_model, data, SCREEN_TRANSLATOR_MODE)
+
+    if isinstance(text, list):
+        return {
+            "results": batch_results(selected_model, text, "text", request_deadline(data), params),
             "source": source_lang,
             "target": target_lang,
+            "via": selected_model.get("via", []),
             "time": time.time()
-        })
+        }, 200
+
+    if not text.strip():
+        return {"error": "Empty text"}, 400
+
+    actual_text, cached = translate_text(selected_model, text, request_deadline(data), params)
+
+    # Return format matching Google Translate API
+    return {
+        "text": actual_text,
+        "source": source_lang,
+        "target": target_lang,
+        "via": selected_model.get("via", []),
+        "cached": cached,
+        "time": time.time()
+    }, 200
+
+
+def translate_request(data):
+    # /translate (and "translate" messages on /ws): returns (payload, status)
+    if not data or 'text' not in data:
+        return {"error": "No text provided"}, 400
+
+    text = data.get('text')
+    # Selected model (or source/target pair) or the default; loaded on first use
+    selected_model = select_model(data)
+    if selected_model is None:
+        return {"error": "Invalid model"}, 400
+    params = generation_params(selected_model, data)
+
+    if isinstance(text, list):
+        return {
+            "results": batch_results(selected_model, text, "translated_text", request_deadline(data), params),
+            "source_language": selected_model["from"],
+            "target_language": selected_model["to"],
+            "time": time.time()
+        }, 200
+
+    if not text.strip():
+        return {"error": "Empty text"}, 400
+
+    actual_text, cached = translate_text(selected_model, text, request_deadline(data), params)
+
+    return {
+        "translated_text": actual_text,
+        "source_language": selected_model["from"],
+        "target_language": selected_model["to"],
+        "cached": cached,
+        "time": time.time()
+    }, 200
+
+
+@app.route("/screen_translator", methods=["POST"])
+def screen_translator():
+    try:
+        return respond(*screen_translate_request(read_payload()))
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
-    
+        return error_response(e)
+
 @app.route("/translate", methods=["POST"])
 def translate():
     try:
-        data = request.get_json()
-        if not data or 'text' not in data:
-            return jsonify({"error": "No text provided"}), 400
-            
-        text = data.get('text')
-        model_value = data.get('model', CURRENT_MODEL)  # Get selected model or use default
-        
-        # Find the model in MODEL_LIST
-        selected_model = next((model for model in MODEL_LIST if model["value"] == model_value), None)
-        if not selected_model:
-            return jsonify({"error": "Invalid model"}), 400
-            
+        data = read_payload()
+        if data and data.get('stream'):
+            return translate_stream()
+        return respond(*translate_request(data))
+    except Exception as e:
+        return error_response(e)
+
+@app.route("/translate/stream", methods=["POST"])
+def translate_stream():
+    # NDJSON by default, Server-Sent Events when the client accepts text/event-stream
+    try:
+        data = read_payload()
+        if not data or not isinstance(data.get('text'), str):
+            return respond({"error": "No text provided"}, 400)
+
+        text = data['text']
         if not text.strip():
-            return jsonify({"error": "Empty text"}), 400
-            
-        translated_text = selected_model["pipe"](text)
-        actual_text = translated_text[0]['translation_text']
-        
-        return jsonify({
-            "translated_text": actual_text, 
-            "source_language": selected_model["from"], 
-            "target_language": selected_model["to"], 
+            return respond({"error": "Empty text"}, 400)
+        selected_model = select_model(data)
+        if selected_model is None:
+            return respond({"error": "Invalid model"}, 400)
+        params = generation_params(selected_model, data)
+        deadline = request_deadline(data)
+    except Exception as e:
+        return error_response(e)
+
+    sse = 'text/event-stream' in request.headers.get('Accept', '')
+
+    def generate():
+        try:
+            for chunk in stream_translation(selected_model, text, deadline, params):
+                line = json.dumps(chunk, ensure_ascii=False)
+                yield f"data: {line}\n\n" if sse else line + "\n"
+        except Exception as e:
+            line = json.dumps({"error": str(e)}, ensure_ascii=False)
+            yield f"data: {line}\n\n" if sse else line + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if sse else 'application/x-ndjson',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/translate/batch", methods=["POST"])
+def translate_batch_endpoint():
+    try:
+        data = read_payload()
+        texts = data.get('texts', data.get('text')) if data else None
+        if not isinstance(texts, list):
+            return respond({"error": "No texts provided"}, 400)
+
+        selected_model = select_model(data)
+        if selected_model is None:
+            return respond({"error": "Invalid model"}, 400)
+        params = generation_params(selected_model, data)
+
+        return respond({
+            "results": batch_results(selected_model, texts, "translated_text", request_deadline(data), params),
+            "source_language": selected_model["from"],
+            "target_language": selected_model["to"],
             "time": time.time()
         })
     except Exception as e:
-        return jsonify({"error": str(e)}), 400
+        return error_response(e)
 
 @app.route("/translator", methods=["POST"])
 def translator():
     return translate()  # переиспользуем существующую функцию
 
+# Co-located clients: one long-lived connection carrying many pipelined requests,
+# each tagged with an "id" (see ws_transport.py); needs flask-sock
+WS_OPERATIONS = {'screen_translator': screen_translate_request, 'translate': translate_request}
+
+def ws_request(client, data):
+    operation = data.get('op', 'screen_translator')
+    start = time.perf_counter()
+    try:
+        if operation not in WS_OPERATIONS:
+            raise ValueError(f"Unknown op: {operation}")
+        limiter.acquire(client, request_cost(data))
+        payload, status = WS_OPERATIONS[operation](data)
+    except RateLimited as e:
+        payload, status = {"error": str(e), "retry_after": e.retry_after}, 429
+    except Exception as e:
+        payload, status, headers = error_payload(e)
+        if "Retry-After" in headers:
+            payload["retry_after"] = int(headers["Retry-After"])
+    payload.pop("time", None)
+    metrics.REQUESTS.inc(endpoint=f"ws_{operation}", status=status)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=f"ws_{operation}")
+    return payload, status
+
+if Sock is not None:
+    sock = Sock(app)
+    # A connection holds a request thread while open; over the limit the upgrade is refused
+    ws_slots = threading.BoundedSemaphore(WS_MAX_CONNECTIONS)
+
+    @app.before_request
+    def limit_websockets():
+        if request.path != "/ws":
+            return None
+        if not ws_slots.acquire(blocking=False):
+            return respond({"error": "Too many WebSocket connections"}, 503, {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        g.ws_slot = True
+        return None
+
+    @app.teardown_request
+    def release_websocket(exc):
+        if g.pop("ws_slot", False):
+            ws_slots.release()
+
+    @sock.route("/ws")
+    def ws_endpoint(ws):
+        client = request_client()
+        PipelinedConnection(ws, lambda data: ws_request(client, data)).run()
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    # Multipart upload ("file" plus form fields) or the raw file as the body with options in the query
+    try:
+        upload = request.files.get('file')
+        options = {**request.args.to_dict(), **request.form.to_dict()}
+        selected_model = select_model(options)
+        if selected_model is None:
+            return jsonify({"error": "Invalid model"}), 400
+        generation_params(selected_model, options)
+        if upload is not None:
+            state = jobs.create(upload.stream, upload.filename, options)
+        else:
+            state = jobs.create(request.stream, options.get('filename', ''), options)
+        return jsonify(state), 202, {"Location": f"/jobs/{state['id']}"}
+    except Exception as e:
+        return error_response(e)
+
+@app.route("/jobs/<job_id>", methods=["GET", "DELETE"])
+def job_status(job_id):
+    try:
+        state = jobs.cancel(job_id) if request.method == 'DELETE' else jobs.get(job_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if state is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(state)
+
+@app.route("/jobs/<job_id>/output")
+def job_output(job_id):
+    # Whatever has been translated so far; complete once the job's status is "done"
+    try:
+        state = jobs.get(job_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if state is None:
+        return jsonify({"error": "Job not found"}), 404
+    name, _ = os.path.splitext(state.get('filename') or 'output')
+    response = send_file(os.path.abspath(jobs.output_path(job_id)), as_attachment=True,
+                         download_name=f"{name}.translated.{state['format']}", max_age=0)
+    response.headers["X-Job-Status"] = state["status"]
+    return response
+
+@app.route("/language_pairs")
+def language_pairs():
+    # Every supported pair with the models it goes through (one for direct pairs)
+    return jsonify(router.pairs())
+
+@app.route("/healthz")
+def healthz():
+    # Liveness: the process is up and serving HTTP
+    return jsonify({"status": "ok", "pid": os.getpid()})
+
+@app.route("/readyz")
+def readyz():
+    # Readiness: every preloaded model is loaded and warmed up in this worker
+    states = registry.model_states()
+    ready = all(states.get(value) == "ready" for value in PRELOAD_MODELS)
+    return jsonify({"ready": ready, "models": states, "pid": os.getpid()}), 200 if ready else 503
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus text format, summed over all gunicorn workers
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# The UI page is rendered once from templates/index.html; static files are bundled
+# locally (no CDNs) and, like the page, kept gzipped in memory with ETags
+assets = AssetBundle(app.jinja_env)
+assets.render_index(registry.model_list)
+
 # add cpu info
+# One background sampler per host; requests only read its latest snapshot. Dashboards
+# poll (responses may be reused until the next sample and revalidate with an ETag)
+# or subscribe to /stats/stream
+sampler = SystemSampler()
+
+
+def sample_response(payload):
+    response = jsonify(payload)
+    response.cache_control.public = True
+    response.cache_control.max_age = max(1, int(sampler.interval))
+    response.add_etag()
+    return response.make_conditional(request)
+
 @app.route("/get_cpu_info")
 def get_cpu_info():
-    return jsonify({"cpu_percent": psutil.cpu_percent(), "memory_percent": psutil.virtual_memory().percent})
-    
+    sample = sampler.snapshot() or {"cpu_percent": 0.0, "memory_percent": 0.0}
+    return sample_response(sample)
+
+@app.route("/stats")
+def stats():
+    coalesced = metrics.collect().get("translation_coalesced_requests_total", {"values": {}})
+    return sample_response({
+        "latest": sampler.snapshot(),
+        "history": sampler.history(),
+        # Requests answered by an identical in-flight request, by where that request ran
+        "coalesced": {scope: int(value) for (scope,), value in coalesced["values"].items()},
+    })
+
+# SSE subscribers each hold a request thread, so there are few of them per worker and
+# every stream ends after STATS_STREAM_MAX_SECONDS (EventSource reconnects by itself)
+STATS_STREAM_MAX_SECONDS = float(os.environ.get("STATS_STREAM_MAX_SECONDS", 300))
+STATS_STREAM_MAX_CONNECTIONS = int(os.environ.get("STATS_STREAM_MAX_CONNECTIONS", 2))
+stats_stream_slots = threading.BoundedSemaphore(STATS_STREAM_MAX_CONNECTIONS)
+
+@app.route("/stats/stream")
+def stats_stream():
+    # One event per new sample of the shared sampler
+    if not stats_stream_slots.acquire(blocking=False):
+        return respond({"error": "Too many stats streams"}, 503, {"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+    def generate():
+        last = None
+        end = time.time() + STATS_STREAM_MAX_SECONDS
+        while time.time() < end:
+            sample = sampler.snapshot()
+            if sample and sample.get("time") != last:
+                last = sample["time"]
+                yield f"data: {json.dumps(sample)}\n\n"
+            time.sleep(sampler.interval)
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Released when the server closes the response, also if the client went away early
+    response.call_on_close(stats_stream_slots.release)
+    return response
 
 @app.route("/")
 def index():
-    return '''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <title>Translation App</title>
-        <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css">
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                margin: 0;
-                padding: 20px;
-                background-color: #f6f7fb;
-            }
-            .container {
-                max-width: 1000px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 12px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-                padding: 24px;
-            }
-            h1 {
-                color: #333;
-                font-size: 24px;
-                margin-bottom: 24px;
-            }
-            .translation-box {
-                display: flex;
-                gap: 24px;
-                margin-bottom: 24px;
-            }
-            .translation-column {
-                flex: 1;
-            }
-            label {
-                display: block;
-                color: #666;
-                margin-bottom: 8px;
-                font-size: 14px;
-            }
-            textarea {
-                width: 100%;
-                padding: 12px;
-                border: 1px solid #e5e5e5;
-                border-radius: 8px;
-                resize: vertical;
-                font-size: 16px;
-                min-height: 150px;
-                box-sizing: border-box;
-            }
-            textarea:focus {
-                outline: none;
-                border-color: #4b73ff;
-            }
-            button {
-                background-color: #4b73ff;
-                color: white;
-                border: none;
-                padding: 12px 24px;
-                border-radius: 8px;
-                cursor: pointer;
-                font-size: 16px;
-                transition: background-color 0.2s;
-            }
-            button:hover {
-                background-color: #3d5ce0;
-            }
-            .language-label {
-                display: inline-block;
-                background-color: #f1f3f4;
-                padding: 4px 12px;
-                border-radius: 16px;
-                font-size: 14px;
-                margin-bottom: 12px;
-            }
-            .system-info {
-                color: #666;
-                font-size: 14px;
-                margin-left: 10px;
-            }
-            .chart-container {
-                margin-top: 20px;
-                padding: 20px;
-                background-color: white;
-                border-radius: 12px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            
-            canvas {
-                width: 100% !important;
-                height: 300px !important;
-            }
-            .cards-container {
-                max-width: 1000px;
-                margin: 0 auto;
-                display: flex;
-                flex-direction: column;
-                gap: 24px;
-            }
-            
-            .card {
-                background-color: white;
-                border-radius: 12px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-                padding: 24px;
-            }
-            
-            .chart-wrapper {
-                position: relative;
-                height: 500px;
-                width: 100%;
-                margin-bottom: 0;
-            }
-            
-            .chart-card {
-                padding: 24px 24px 12px 24px;
-            }
-            
-            .chart-title {
-                color: #333;
-                font-size: 20px;
-                margin-bottom: 20px;
-            }
-            
-            .model-select {
-                margin-bottom: 16px;
-                padding: 8px;
-                border-radius: 8px;
-                border: 1px solid #e5e5e5;
-                width: 100%;
-                font-size: 14px;
-            }
-            
-            .feedback-buttons {
-                margin-top: 12px;
-                display: flex;
-                gap: 12px;
-            }
-            
-            .feedback-button {
-                width: 40px;
-                height: 40px;
-                border-radius: 50%;
-                border: none;
-                background-color: #f1f3f4;
-                cursor: pointer;
-                transition: background-color 0.2s;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-            }
-            
-            .feedback-button:hover {
-                background-color: #e5e5e5;
-            }
-            
-            .feedback-button.like {
-                color: #4CAF50;
-            }
-            
-            .feedback-button.dislike {
-                color: #f44336;
-            }
-            
-            .translation-controls {
-                display: flex;
-                align-items: center;
-                justify-content: space-between;
-                margin-top: 16px;
-            }
-            
-            .feedback-buttons {
-                display: flex;
-                align-items: center;
-                gap: 8px;
-            }
-            
-            .feedback-button {
-                width: 36px;
-                height: 36px;
-                border-radius: 50%;
-                border: none;
-                background-color: #f1f3f4;
-                cursor: pointer;
-                transition: all 0.2s;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-            }
-            
-            .feedback-button:hover {
-                background-color: #e5e5e5;
-                transform: scale(1.1);
-            }
-            
-            .feedback-button.like {
-                color: #4CAF50;
-            }
-            
-            .feedback-button.dislike {
-                color: #f44336;
-            }
-            
-            .feedback-hint {
-                color: #666;
-                font-size: 12px;
-            }
-
-            .chart-wrapper {
-                position: relative;
-                height: 500px;
-                width: 100%;
-                margin-bottom: 0;
-            }
-            
-            .chart-card {
-                padding: 24px 24px 12px 24px;
-            }
-
-            .model-select {
-                display: flex;
-                align-items: center;
-                padding: 8px 12px;
-                border: 1px solid #e5e5e5;
-                border-radius: 8px;
-                font-size: 14px;
-                margin-bottom: 16px;
-                width: 100%;
-            }
-
-            .model-option {
-                display: flex;
-                align-items: center;
-                gap: 8px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="cards-container">
-            <div class="card">
-                <h1>Translation App <span class="system-info" id="system-info"></span></h1>
-                <select class="model-select" id="model-select" onchange="updateLanguageLabels()">
-                    ''' + ''.join([f'<option value="{model["value"]}" data-from="{model["from"]}" data-to="{model["to"]}" data-from-full="{model["description"].split("-")[0]}" data-to-full="{model["description"].split("-")[1]}">{model["icon"]} {model["description"]} ({model["value"]})</option>' for model in MODEL_LIST]) + '''
-                </select>
-                <div class="translation-box">
-                    <div class="translation-column">
-                        <div class="language-label" id="from-label">German (Deutschland)</div>
-                        <textarea id="de-text" placeholder="Enter text to translate"></textarea>
-                    </div>
-                    <div class="translation-column">
-                        <div class="language-label" id="to-label">English (United Kingdom) <span id="translation-time"></span></div>
-                        <textarea id="en-text" readonly placeholder="Translation"></textarea>
-                    </div>
-                </div>
-                <div class="translation-controls">
-                    <button onclick="translateText()">Translate</button>
-                    <div class="feedback-buttons">
-                        <button class="feedback-button like" onclick="saveFeedback(true)" title="Like (← Left Arrow)">
-                            <i class="fas fa-thumbs-up"></i>
-                        </button>
-                        <button class="feedback-button dislike" onclick="saveFeedback(false)" title="Dislike (→ Right Arrow)">
-                            <i class="fas fa-thumbs-down"></i>
-                        </button>
-                        <span class="feedback-hint">Use arrow up and down for feedback</span>
-                    </div>
-                </div>
-            </div>
-
-            <div class="card chart-card">
-                <h2 class="chart-title">Translation Performance History</h2>
-                <div class="chart-wrapper">
-                    <canvas id="historyChart"></canvas>
-                </div>
-            </div>
-        </div>
-
-        <script>
-            let startTime;
-            let translationHistory = [];
-            let historyChart;
-
-            // Инициализация графика
-            function initChart() {
-                const ctx = document.getElementById('historyChart').getContext('2d');
-                historyChart = new Chart(ctx, {
-                    type: 'scatter',
-                    data: {
-                        datasets: [{
-                            label: 'Translation Speed',
-                            data: [],
-                            backgroundColor: 'rgba(75, 115, 255, 0.6)',
-                            borderColor: 'rgba(75, 115, 255, 1)',
-                            pointRadius: 6,
-                            pointHoverRadius: 8
-                        }]
-                    },
-                    options: {
-                        responsive: true,
-                        maintainAspectRatio: false,  // Важно для контроля высоты
-                        scales: {
-                            x: {
-                                title: {
-                                    display: true,
-                                    text: 'Text Length (symbols)'
-                                }
-                            },
-                            y: {
-                                title: {
-                                    display: true,
-                                    text: 'Time per Symbol (seconds)'
-                                }
-                            }
-                        },
-                        plugins: {
-                            tooltip: {
-                                callbacks: {
-                                    label: function(context) {
-                                        return `Length: ${context.parsed.x} symbols, Time/Symbol: ${context.parsed.y.toFixed(3)}s`;
-                                    }
-                                }
-                            }
-                        }
-                    }
-                });
-            }
-
-            // Обновление графика
-            function updateChart(textLength, timePerSymbol) {
-                translationHistory.push({
-                    x: textLength,
-                    y: timePerSymbol
-                });
-
-                historyChart.data.datasets[0].data = translationHistory;
-                historyChart.update();
-            }
-
-            let lastTranslation = null;
-
-            function translateText() {
-                const deText = document.getElementById('de-text').value;
-                if (!deText.trim()) return;
-                
-                const select = document.getElementById('model-select');
-                const option = select.options[select.selectedIndex];
-                const fromLang = option.getAttribute('data-from');
-                const toLang = option.getAttribute('data-to');
-                
-                startTime = Date.now();
-                document.getElementById('translation-time').innerText = '';
-                
-                fetch('/translate', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({
-                        text: deText,
-                        source_language: fromLang,
-                        target_language: toLang,
-                        model: select.value
-                    })
-                })
-                .then(response => response.json())
-                .then(data => {
-                    const translatedText = data.translated_text;
-                    document.getElementById('en-text').value = translatedText;
-                    
-                    const endTime = Date.now();
-                    const seconds = ((endTime - startTime) / 1000).toFixed(2);
-                    const inputSymbols = deText.length;
-                    const outputSymbols = translatedText.length;
-                    const timePerSymbol = seconds / outputSymbols;
-                    
-                    const timeInfo = `(${seconds}s | ${timePerSymbol.toFixed(3)}s per symbol | ` +
-                        `in: ${inputSymbols} symbols | out: ${outputSymbols} symbols)`;
-                    document.getElementById('translation-time').innerText = timeInfo;
-                    
-                    // Сохраняем данные последнего перевода
-                    lastTranslation = {
-                        model: document.getElementById('model-select').value,
-                        input_text: deText,
-                        translated_text: translatedText,
-                        seconds: parseFloat(seconds),
-                        time_per_symbol: timePerSymbol,
-                        input_symbols: inputSymbols,
-                        output_symbols: outputSymbols,
-                        timestamp: new Date().toISOString()
-                    };
-                    
-                    updateChart(outputSymbols, timePerSymbol);
-                })
-                .catch(error => {
-                    console.error('Error:', error);
-                    alert('An error occurred during translation');
-                    document.getElementById('translation-time').innerText = '';
-                });
-            }
-
-            function saveFeedback(isLike) {
-                if (!lastTranslation) {
-                    alert('Please translate something first');
-                    return;
-                }
-
-                const feedbackData = {
-                    ...lastTranslation,
-                    feedback: isLike ? 'like' : 'dislike'
-                };
-
-                fetch('/save_feedback', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(feedbackData)
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.error) {
-                        throw new Error(data.error);
-                    }
-                    alert(isLike ? 'Thanks for the like!' : 'Thanks for the feedback!');
-                })
-                .catch(error => {
-                    console.error('Error:', error);
-                    alert('Failed to save feedback');
-                });
-            }
-
-            // Добавляем обработчик события keydown для текстового поля
-            document.getElementById('de-text').addEventListener('keydown', function(e) {
-                // Проверяем, была ли нажата клавиша Enter без Shift
-                if (e.key === 'Enter' && !e.shiftKey) {
-                    e.preventDefault(); // Предотвращаем добавление новой строки
-                    translateText(); // Вызываем функцию перевода
-                }
-            });
-
-            // Функция обновления системной информации
-            function updateSystemInfo() {
-                fetch('/get_cpu_info')
-                    .then(response => response.json())
-                    .then(data => {
-                        const systemInfo = document.getElementById('system-info');
-                        systemInfo.textContent = `CPU: ${data.cpu_percent.toFixed(1)}% | RAM: ${data.memory_percent.toFixed(1)}%`;
-                        document.title = `Translation App (CPU: ${data.cpu_percent.toFixed(1)}% | RAM: ${data.memory_percent.toFixed(1)}%)`;
-                    })
-                    .catch(error => console.error('Error:', error));
-            }
-
-            // Обновление каждые 200мс
-            setInterval(updateSystemInfo, 200);
-            
-            // Начальное обновление
-            updateSystemInfo();
-
-            // Инициализирум график при загрузке страницы
-            document.addEventListener('DOMContentLoaded', initChart);
-
-            // Обработчик клавиш
-            document.addEventListener('keydown', function(e) {
-                if (lastTranslation) {
-                    if (e.key === 'ArrowUp') {
-                        e.preventDefault();
-                        saveFeedback(true);
-                    } else if (e.key === 'ArrowDown') {
-                        e.preventDefault();
-                        saveFeedback(false);
-                    }
-                }
-            });
-
-            const COUNTRY_NAMES = {
-                'de': 'German (Deutschland)',
-                'en': 'English (United Kingdom)',
-                'fr': 'French (France)',
-                'ru': 'Russian (Россия)'
-            };
-
-            function updateLanguageLabels() {
-                const select = document.getElementById('model-select');
-                const option = select.options[select.selectedIndex];
-                const fromLang = option.getAttribute('data-from');
-                const toLang = option.getAttribute('data-to');
-                
-                document.getElementById('from-label').textContent = COUNTRY_NAMES[fromLang];
-                document.getElementById('to-label').innerHTML = 
-                    `${COUNTRY_NAMES[toLang]} <span id="translation-time"></span>`;
-                
-                // Update placeholders
-                document.getElementById('de-text').placeholder = 
-                    `Enter text in ${COUNTRY_NAMES[fromLang]}`;
-                document.getElementById('en-text').placeholder = 
-                    `Translation in ${COUNTRY_NAMES[toLang]}`;
-            }
-
-            // Initialize labels on page load
-            document.addEventListener('DOMContentLoaded', function() {
-                updateLanguageLabels();
-                initChart();
-            });
-        </script>
-    </body>
-    </html>
-    '''
+    return assets.index.response(request)
+
+@app.route("/static/<path:name>", endpoint="static")
+def static_asset(name):
+    asset = assets.get(name)
+    if asset is None:
+        return jsonify({"error": "Not found"}), 404
+    return asset.response(request)
 
 @app.route("/save_feedback", methods=["POST"])
 def save_feedback():
     data = request.get_json()
     try:
+        model = registry.find(data.get("model")) if isinstance(data, dict) else None
+        if model is not None:
+            # UI feedback is on translations made with the model's default generation options
+            data.setdefault("params", dict(model.get("generation", {})))
         save_history(data)
         return jsonify({"status": "success"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/history")
+def history():
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = min(int(request.args.get('limit', 50)), 500)
+        items, total = feedback_store.read(offset, limit)
+        return jsonify({"items": items, "total": total, "offset": offset, "limit": limit})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 if __name__ == "__main__":
     import torch
     print(torch.__version__)
     
     # Используем Gunicorn в продакшене, Flask для разработки
     if os.environ.get('FLASK_ENV') == 'development':
+        warm_up()
         app.run(host="0.0.0.0", port=8003, debug=True)
     else:
         # В продакшене используем Gunicorn через командную строку:
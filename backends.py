@@ -0,0 +1,141 @@
+import difflib
+import os
+import sys
+
+import torch
+from transformers import pipeline
+
+# Бэкенд инференса по умолчанию; у модели в MODEL_LIST можно задать свой ключом "backend":
+#   "torch" — обычный fp32, "int8" — динамическая int8-квантизация Linear-слоёв,
+#   "onnx" — ONNX Runtime (encoder/decoder с KV-кэшем, нужен пакет optimum[onnxruntime])
+DEFAULT_BACKEND = os.environ.get("MODEL_BACKEND", "torch")
+PARITY_CHECK = os.environ.get("PARITY_CHECK", "1") == "1"
+PARITY_MIN_SIMILARITY = float(os.environ.get("PARITY_MIN_SIMILARITY", 0.8))
+# Локальные снапшоты моделей (python backends.py snapshot): загрузка без обращения к хабу.
+# MODEL_OFFLINE=1 — модели без снапшота не загружаются вовсе
+MODEL_SNAPSHOT_DIR = os.environ.get("MODEL_SNAPSHOT_DIR", "")
+MODEL_OFFLINE = os.environ.get("MODEL_OFFLINE", "0") == "1"
+
+PARITY_TEXTS = {
+    "de": ["Guten Morgen, wie geht es Ihnen?", "Die Datei wurde erfolgreich gespeichert."],
+    "en": ["Good morning, how are you?", "The file was saved successfully."],
+    "fr": ["Bonjour, comment allez-vous ?", "Le fichier a été enregistré avec succès."],
+    "ru": ["Доброе утро, как у вас дела?", "Файл успешно сохранён."],
+}
+
+
+def snapshot_path(entry, directory=MODEL_SNAPSHOT_DIR):
+    return os.path.join(directory, entry["value"].replace("/", "--")) if directory else ""
+
+
+def _model_source(entry):
+    # Local snapshot directory if there is one, otherwise the hub id
+    path = snapshot_path(entry)
+    if path and os.path.isdir(path):
+        return path
+    if MODEL_OFFLINE:
+        raise FileNotFoundError(f"No snapshot for {entry['value']} in {MODEL_SNAPSHOT_DIR!r}")
+    return entry["value"]
+
+
+def _translate(pipe, texts):
+    return [output["translation_text"] for output in pipe(texts, batch_size=len(texts))]
+
+
+def _similarity(expected, actual):
+    ratios = [difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(expected, actual)]
+    return sum(ratios) / len(ratios) if ratios else 1.0
+
+
+def _int8_pipeline(entry, reference):
+    model = torch.ao.quantization.quantize_dynamic(reference.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline("translation", model=model, tokenizer=reference.tokenizer)
+
+
+def _onnx_pipeline(entry, reference):
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    # The snapshot keeps the exported graphs, so the slow export runs only once
+    onnx_path = os.path.join(snapshot_path(entry), "onnx") if snapshot_path(entry) else ""
+    if onnx_path and os.path.isdir(onnx_path):
+        model = ORTModelForSeq2SeqLM.from_pretrained(onnx_path, use_cache=True)
+    else:
+        model = ORTModelForSeq2SeqLM.from_pretrained(_model_source(entry), export=True, use_cache=True)
+    return pipeline("translation", model=model, tokenizer=reference.tokenizer)
+
+
+_BACKENDS = {
+    "int8": _int8_pipeline,
+    "onnx": _onnx_pipeline,
+}
+
+
+def load_pipeline(entry):
+    """Builds the translation pipeline for a MODEL_LIST entry with its configured backend.
+
+    Non-fp32 backends are checked against the fp32 output on a few sentences and
+    fall back to fp32 if they fail to load or drift too far from it.
+    """
+    source = _model_source(entry)
+    reference = pipeline("translation", model=source)
+    entry["source"] = source
+    backend = entry.get("backend", DEFAULT_BACKEND)
+    entry["active_backend"] = "torch"
+    if backend == "torch":
+        return reference
+    if backend not in _BACKENDS:
+        print(f"Неизвестный бэкенд {backend} для {entry['value']}, используем torch")
+        return reference
+
+    try:
+        pipe = _BACKENDS[backend](entry, reference)
+    except ImportError as e:
+        print(f"Бэкенд {backend} для {entry['value']} недоступен ({str(e)}; см. requirements-extra.txt), используем torch")
+        return reference
+    except Exception as e:
+        print(f"Ошибка загрузки бэкенда {backend} для {entry['value']}: {str(e)}, используем torch")
+        return reference
+
+    if PARITY_CHECK:
+        texts = PARITY_TEXTS.get(entry.get("from"), PARITY_TEXTS["en"])
+        similarity = _similarity(_translate(reference, texts), _translate(pipe, texts))
+        entry["parity_similarity"] = similarity
+        if similarity < PARITY_MIN_SIMILARITY:
+            print(f"Бэкенд {backend} для {entry['value']} расходится с fp32 ({similarity:.2f}), используем torch")
+            return reference
+        print(f"Бэкенд {backend} для {entry['value']}: совпадение с fp32 {similarity:.2f}")
+
+    entry["active_backend"] = backend
+    return pipe
+
+
+def save_snapshot(entry, directory=MODEL_SNAPSHOT_DIR):
+    """Saves model, tokenizer and generation config (plus the ONNX export for
+    "onnx" models) to the snapshot directory, converting weights to safetensors."""
+    path = snapshot_path(entry, directory)
+    if not path:
+        raise ValueError("MODEL_SNAPSHOT_DIR is not set")
+    reference = pipeline("translation", model=entry["value"])
+    reference.model.save_pretrained(path, safe_serialization=True)
+    reference.tokenizer.save_pretrained(path)
+    if entry.get("backend", DEFAULT_BACKEND) == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+        ORTModelForSeq2SeqLM.from_pretrained(path, export=True, use_cache=True).save_pretrained(os.path.join(path, "onnx"))
+    print(f"Снапшот {entry['value']} сохранён в {path}")
+    return path
+
+
+if __name__ == "__main__":
+    # python backends.py snapshot [model ...]  (all of MODEL_LIST by default)
+    if len(sys.argv) < 2 or sys.argv[1] != "snapshot":
+        raise SystemExit("usage: python backends.py snapshot [model ...]")
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from model_config import MODEL_LIST
+
+    wanted = sys.argv[2:]
+    for entry in MODEL_LIST:
+        if not wanted or entry["value"] in wanted:
+            save_snapshot(entry, os.environ.get("MODEL_SNAPSHOT_DIR", ""))
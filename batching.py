@@ -0,0 +1,271 @@
+import os
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import Future
+
+import torch
+
+import metrics
+from tokenization import TokenCache
+from translation_cache import params_key
+
+# Настройки микробатчинга (можно переопределить через .env)
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 10))
+# Сколько интерактивных запросов может ждать в очереди модели, прежде чем отвечать 503
+BATCH_QUEUE_MAX = int(os.environ.get("BATCH_QUEUE_MAX", 256))
+# Сколько bulk-сегментов может ждать в очереди модели; следующие ждут места, а не получают 503
+BATCH_BULK_QUEUE_MAX = int(os.environ.get("BATCH_BULK_QUEUE_MAX", 64))
+# Бюджет генерации по умолчанию: max_new_tokens = входные токены * RATIO + EXTRA (не больше CAP)
+GEN_LENGTH_RATIO = float(os.environ.get("GEN_LENGTH_RATIO", 2.0))
+GEN_LENGTH_EXTRA = int(os.environ.get("GEN_LENGTH_EXTRA", 16))
+GEN_MAX_NEW_TOKENS = int(os.environ.get("GEN_MAX_NEW_TOKENS", 512))
+# Полосы приоритета: интерактивные запросы идут первыми, но после BATCH_INTERACTIVE_WEIGHT
+# интерактивных батчей подряд ждущий bulk-батч всё же получает очередь.
+# Bulk-батчи меньше, чтобы интерактивный запрос не ждал за ними долго
+INTERACTIVE, BULK = "interactive", "bulk"
+BATCH_INTERACTIVE_WEIGHT = int(os.environ.get("BATCH_INTERACTIVE_WEIGHT", 4))
+BATCH_BULK_MAX_SIZE = int(os.environ.get("BATCH_BULK_MAX_SIZE", 8))
+
+_start_lock = threading.Lock()
+
+_Item = namedtuple("_Item", "text future deadline enqueued params lane")
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is full; the client should retry later."""
+
+
+def generation_kwargs(pipe, params, input_length):
+    """model.generate() arguments for one batch.
+
+    params may set num_beams, early_stopping, max_new_tokens, or length_ratio /
+    length_extra for the budget derived from the longest input in the batch.
+    """
+    params = params or {}
+    kwargs = {}
+    # Same generation defaults the pipeline itself would use
+    if getattr(pipe, "generation_config", None) is not None:
+        kwargs["generation_config"] = pipe.generation_config
+    if "num_beams" in params:
+        kwargs["num_beams"] = params["num_beams"]
+        if params["num_beams"] == 1:
+            kwargs["early_stopping"] = False
+    if "early_stopping" in params:
+        kwargs["early_stopping"] = params["early_stopping"]
+    if "max_new_tokens" in params:
+        kwargs["max_new_tokens"] = params["max_new_tokens"]
+    else:
+        ratio = params.get("length_ratio", GEN_LENGTH_RATIO)
+        extra = params.get("length_extra", GEN_LENGTH_EXTRA)
+        kwargs["max_new_tokens"] = min(GEN_MAX_NEW_TOKENS, int(input_length * ratio) + extra)
+    return kwargs
+
+
+def generate_batch(pipe, texts, name="", params=None, encoder=None):
+    """Runs texts through the model as one padded batch: tokenize -> generate -> detokenize.
+
+    The stages are called directly (not through pipe(...)) so each one can be timed.
+    With an encoder (TokenCache) previously seen segments skip the tokenizer.
+    """
+    tokenizer, model = pipe.tokenizer, pipe.model
+    with metrics.timer(metrics.TOKENIZE_SECONDS, model=name):
+        if encoder is not None:
+            inputs = encoder.encode_batch(texts)
+        else:
+            inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
+    generate_kwargs = generation_kwargs(pipe, params, inputs["input_ids"].shape[1])
+    with metrics.timer(metrics.GENERATE_SECONDS, model=name):
+        with torch.inference_mode():
+            output_ids = model.generate(**inputs, **generate_kwargs)
+    with metrics.timer(metrics.DETOKENIZE_SECONDS, model=name):
+        outputs = tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+
+    metrics.BATCH_SIZE.observe(len(texts), model=name)
+    metrics.MODEL_REQUESTS.inc(len(texts), model=name)
+    metrics.INPUT_TOKENS.inc(int(inputs["attention_mask"].sum()), model=name)
+    if tokenizer.pad_token_id is not None:
+        metrics.OUTPUT_TOKENS.inc(int((output_ids != tokenizer.pad_token_id).sum()), model=name)
+    return outputs
+
+
+class MicroBatcher:
+    """Collects concurrent requests for one pipeline and runs them as one padded batch."""
+
+    def __init__(self, pipe, name="", max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, queue_max=BATCH_QUEUE_MAX,
+                 bulk_queue_max=BATCH_BULK_QUEUE_MAX):
+        self.pipe = pipe
+        self.name = name
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.queue_max = queue_max
+        self.bulk_queue_max = bulk_queue_max
+        self.encoder = TokenCache(pipe.tokenizer, name=name)
+        self._interactive_streak = 0
+        self._pid = None
+        self._closed = False
+
+    def _start(self):
+        # Threads do not survive fork, so every gunicorn worker starts its own loop
+        with _start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = []
+            self._depth = Counter()  # queued items per lane
+            self._cond = threading.Condition()
+            thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, text, deadline=None, params=None, lane=INTERACTIVE):
+        # deadline: time.time() after which the item is dropped instead of translated;
+        # params: generation options, only items with equal params share a batch;
+        # lane: INTERACTIVE or BULK. Each lane has its own queue limit: interactive
+        # items over it raise QueueFullError, bulk items wait for room (until the
+        # deadline), so a large job never crowds interactive requests out
+        if self._pid != os.getpid():
+            self._start()
+        future = Future()
+        with self._cond:
+            if lane == INTERACTIVE:
+                if self.queue_max and self._depth[INTERACTIVE] >= self.queue_max:
+                    raise QueueFullError("Translation queue is full")
+            else:
+                while self.bulk_queue_max and self._depth[lane] >= self.bulk_queue_max and not self._closed:
+                    timeout = None if deadline is None else deadline - time.time()
+                    if timeout is not None and timeout <= 0:
+                        future.set_exception(TimeoutError("Deadline exceeded"))
+                        return future
+                    self._cond.wait(timeout)
+            if self._closed:
+                future.set_exception(RuntimeError("Model was unloaded"))
+                return future
+            self._queue.append(_Item(text, future, deadline, time.perf_counter(), params or {}, lane))
+            self._depth[lane] += 1
+            metrics.QUEUE_DEPTH.set(len(self._queue), model=self.name)
+            self._cond.notify_all()
+        return future
+
+    def translate_batch(self, texts, deadline=None, params=None, lane=BULK):
+        """Translates a list of texts through the queue in the bulk lane, so
+        interactive requests keep priority over the job.
+
+        Returns one item per input, in input order: the translated string, or an
+        exception for items that could not be translated.
+        """
+        if deadline is not None and time.time() > deadline:
+            raise TimeoutError("Deadline exceeded")
+        results, valid = _validate(texts, self.encoder)
+        # Submitted in length order, so neighbouring items in the lane batch well
+        futures = [(i, self.submit(texts[i], deadline, params, lane)) for i in valid]
+        for i, future in futures:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                results[i] = future.result(timeout)
+            except Exception as e:
+                results[i] = e
+        return results
+
+    def close(self):
+        # Loop finishes what is already queued and exits, releasing the pipeline
+        self._closed = True
+        if self._pid == os.getpid():
+            with self._cond:
+                self._cond.notify_all()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            # Ждём попутчиков, пока не наберётся батч или не выйдет время
+            deadline = time.monotonic() + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            lane = self._pick_lane()
+            # Батч из запросов той же полосы и с теми же параметрами генерации, что и у самого старого
+            first = next(item for item in self._queue if item.lane == lane)
+            key = params_key(first.params)
+            size = self.max_batch_size if lane == INTERACTIVE else min(self.max_batch_size, BATCH_BULK_MAX_SIZE)
+            batch, rest = [], []
+            for item in self._queue:
+                if len(batch) < size and item.lane == lane and params_key(item.params) == key:
+                    batch.append(item)
+                else:
+                    rest.append(item)
+            self._queue = rest
+            self._depth[lane] -= len(batch)
+            metrics.QUEUE_DEPTH.set(len(self._queue), model=self.name)
+            # Bulk submitters may be waiting for room
+            self._cond.notify_all()
+
+        # Просроченные запросы не переводим — клиент уже не ждёт
+        now = time.time()
+        started = time.perf_counter()
+        live = []
+        for item in batch:
+            metrics.QUEUE_WAIT_SECONDS.observe(started - item.enqueued, model=self.name)
+            if item.deadline is not None and item.deadline < now:
+                item.future.set_exception(TimeoutError("Deadline exceeded"))
+            else:
+                live.append(item)
+        return live
+
+    def _pick_lane(self):
+        # Caller holds the condition
+        lanes = {item.lane for item in self._queue}
+        if INTERACTIVE in lanes and (len(lanes) == 1 or self._interactive_streak < BATCH_INTERACTIVE_WEIGHT):
+            self._interactive_streak += 1
+            return INTERACTIVE
+        self._interactive_streak = 0
+        return BULK if BULK in lanes else next(iter(lanes))
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                self.pipe = None
+                return
+            if batch:
+                self._run(batch)
+
+    def _run(self, batch):
+        texts = [item.text for item in batch]
+        try:
+            outputs = generate_batch(self.pipe, texts, self.name, batch[0].params, self.encoder)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            # Батч упал — переводим по одному, чтобы ошибка досталась только виновнику
+            for item in batch:
+                self._run([item])
+            return
+        for item, output in zip(batch, outputs):
+            item.future.set_result(output)
+
+
+def _validate(texts, encoder=None):
+    # (results with errors for invalid items, indexes of valid items sorted by length)
+    results = [None] * len(texts)
+    valid = []
+    for i, text in enumerate(texts):
+        if not isinstance(text, str):
+            results[i] = ValueError("Text must be a string")
+        elif not text.strip():
+            results[i] = ValueError("Empty text")
+        else:
+            valid.append(i)
+
+    # Похожие по длине тексты в одном батче — меньше паддинга (по токенам, если есть кэш)
+    if encoder is not None and valid:
+        lengths = dict(zip(valid, map(len, encoder.encode([texts[i] for i in valid]))))
+        valid.sort(key=lengths.get)
+    else:
+        valid.sort(key=lambda i: len(texts[i]))
+    return results, valid
@@ -0,0 +1,395 @@
+"""Benchmark harness for the translation endpoints and model pipelines.
+
+Runs reproducible synthetic corpora (short UI strings, sentences, multi-sentence
+paragraphs, with a configurable share of repeated texts) at several concurrency
+levels and prints a JSON report with throughput, p50/p95/p99 latency, tokens/s
+and peak RSS per scenario.
+
+Targets:
+  translate, screen_translator  the HTTP endpoints, in-process through the Flask
+                                test client or against a running server (--url)
+  batcher                       MicroBatcher.submit, i.e. batching without HTTP and cache
+  pipeline                      generate_batch per text, no batching and no cache
+
+The corpus varies only the numbers in a few sentences, which the translation
+memory answers without the model, so in-process runs disable it; start a
+server under test (--url) with TM_ENABLED=0 as well.
+
+Examples:
+  python benchmark.py --targets pipeline,batcher --concurrency 1,8 --output base.json
+  python benchmark.py --url http://127.0.0.1:8003 --baseline base.json --max-regression 10
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import psutil
+
+from model_config import MODEL_LIST, CURRENT_MODEL
+
+# {n} is replaced with a number so texts are unique unless deliberately repeated
+SENTENCES = {
+    "de": [
+        "Die Bestellung {n} wurde heute Morgen verschickt.",
+        "Bitte melden Sie sich mit Ihrer Kundennummer {n} an.",
+        "Der Zug nach Berlin hat {n} Minuten Verspätung.",
+        "Wir haben Ihre Anfrage erhalten und melden uns innerhalb von {n} Stunden.",
+        "Das Dokument enthält {n} Seiten und muss bis Freitag unterschrieben werden.",
+        "In der Stadt leben ungefähr {n} Menschen, die meisten davon arbeiten im Zentrum.",
+        "Die neue Version der Anwendung behebt {n} Fehler und verbessert die Leistung.",
+        "Nach dem Regen war der Himmel klar, und wir sind {n} Kilometer gewandert.",
+    ],
+    "en": [
+        "Order {n} was shipped this morning.",
+        "Please sign in with your customer number {n}.",
+        "The train to Berlin is {n} minutes late.",
+        "We have received your request and will reply within {n} hours.",
+        "The document has {n} pages and must be signed by Friday.",
+        "About {n} people live in the city, most of them work downtown.",
+        "The new version of the application fixes {n} bugs and improves performance.",
+        "After the rain the sky was clear, and we hiked {n} kilometers.",
+    ],
+    "fr": [
+        "La commande {n} a été expédiée ce matin.",
+        "Veuillez vous connecter avec votre numéro client {n}.",
+        "Le train pour Berlin a {n} minutes de retard.",
+        "Nous avons bien reçu votre demande et répondrons sous {n} heures.",
+        "Le document compte {n} pages et doit être signé avant vendredi.",
+        "Environ {n} personnes vivent dans la ville, la plupart travaillent au centre.",
+        "La nouvelle version de l'application corrige {n} erreurs et améliore les performances.",
+        "Après la pluie, le ciel était dégagé et nous avons marché {n} kilomètres.",
+    ],
+    "ru": [
+        "Заказ {n} был отправлен сегодня утром.",
+        "Пожалуйста, войдите с номером клиента {n}.",
+        "Поезд в Берлин опаздывает на {n} минут.",
+        "Мы получили ваш запрос и ответим в течение {n} часов.",
+        "В документе {n} страниц, его нужно подписать до пятницы.",
+        "В городе живёт около {n} человек, большинство работает в центре.",
+        "Новая версия приложения исправляет {n} ошибок и ускоряет работу.",
+        "После дождя небо прояснилось, и мы прошли {n} километров.",
+    ],
+}
+
+SHORT = {
+    "de": ["Seite {n}", "Datei {n} speichern", "Einstellungen ({n})", "{n} neue Nachrichten", "Schritt {n} von 10"],
+    "en": ["Page {n}", "Save file {n}", "Settings ({n})", "{n} new messages", "Step {n} of 10"],
+    "fr": ["Page {n}", "Enregistrer le fichier {n}", "Paramètres ({n})", "{n} nouveaux messages", "Étape {n} sur 10"],
+    "ru": ["Страница {n}", "Сохранить файл {n}", "Настройки ({n})", "{n} новых сообщений", "Шаг {n} из 10"],
+}
+
+# Sentences per text for each length class
+LENGTHS = {
+    "short": (0, 0),
+    "medium": (1, 2),
+    "long": (6, 12),
+}
+
+
+def make_corpus(lang, length, size, repeat, seed, salt=0):
+    """Reproducible list of texts: `repeat` is the share of items that repeat an earlier one.
+
+    The structure (lengths, repeat positions) depends only on the seed; salt only
+    changes the numbers, so a rerun against a server with a warm cache stays cold.
+    """
+    rng = random.Random(f"{seed}-{lang}-{length}-{repeat}")
+    numbers = random.Random(f"{seed}-{lang}-{length}-{repeat}-{salt}")
+    sentences = SENTENCES.get(lang, SENTENCES["en"])
+    short = SHORT.get(lang, SHORT["en"])
+    low, high = LENGTHS[length]
+    texts = []
+    for _ in range(size):
+        if texts and rng.random() < repeat:
+            texts.append(rng.choice(texts))
+            continue
+        if high == 0:
+            templates = [rng.choice(short)]
+        else:
+            templates = [rng.choice(sentences) for _ in range(rng.randint(low, high))]
+        texts.append(" ".join(t.format(n=numbers.randint(2, 999999)) for t in templates))
+    return texts
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    # nearest-rank
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+# ---------------------------------------------------------------- targets
+
+class HttpTarget:
+    """Sends requests to a running server; token counts and RSS come from /metrics and /stats."""
+
+    def __init__(self, url, endpoint, model):
+        self.url = url.rstrip("/")
+        self.endpoint = endpoint
+        self.model = model
+
+    def _body(self, text):
+        if self.endpoint == "screen_translator":
+            return {"text": text, "source": self.model["from"], "target": self.model["to"]}
+        return {"text": text, "model": self.model["value"]}
+
+    def call(self, text):
+        data = json.dumps(self._body(text)).encode("utf-8")
+        req = urllib.request.Request(f"{self.url}/{self.endpoint}", data=data,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=300) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def tokens(self):
+        try:
+            with urllib.request.urlopen(f"{self.url}/metrics", timeout=30) as response:
+                text = response.read().decode("utf-8")
+        except (OSError, ValueError):
+            return None
+        totals = {"input": 0.0, "output": 0.0}
+        for line in text.splitlines():
+            for kind in totals:
+                if line.startswith(f"translation_{kind}_tokens_total"):
+                    totals[kind] += float(line.rsplit(" ", 1)[1])
+        return totals
+
+    def rss_mb(self):
+        try:
+            with urllib.request.urlopen(f"{self.url}/stats", timeout=30) as response:
+                latest = json.loads(response.read()).get("latest") or {}
+        except (OSError, ValueError):
+            return None
+        workers = latest.get("workers") or []
+        return sum(worker["rss_mb"] for worker in workers) if workers else None
+
+
+class LocalTarget:
+    """Runs in this process: the Flask app via the test client, the batcher or the raw pipeline."""
+
+    def __init__(self, kind, model_value):
+        self.kind = kind
+        if kind in ("translate", "screen_translator"):
+            # Cold numbers must measure inference, not translation memory hits
+            os.environ["TM_ENABLED"] = "0"
+            import app
+            self.model = app.registry.get(model_value)
+            self.http = HttpTarget("", kind, self.model)
+            self.client = threading.local()
+            self.app = app.app
+        else:
+            from model_registry import ModelRegistry
+            self.model = ModelRegistry(MODEL_LIST).get(model_value)
+
+    def call(self, text):
+        if self.kind == "pipeline":
+            from batching import generate_batch
+            generate_batch(self.model["pipe"], [text], self.model["value"])
+            return 200
+        if self.kind == "batcher":
+            self.model["batcher"].submit(text).result()
+            return 200
+        if not hasattr(self.client, "value"):
+            self.client.value = self.app.test_client()
+        return self.client.value.post(f"/{self.kind}", json=self.http._body(text)).status_code
+
+    def tokens(self):
+        import metrics
+        return {
+            "input": sum(value for _, value in metrics.INPUT_TOKENS.snapshot()["values"]),
+            "output": sum(value for _, value in metrics.OUTPUT_TOKENS.snapshot()["values"]),
+        }
+
+    def rss_mb(self):
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+# ---------------------------------------------------------------- runner
+
+def run_scenario(target, texts, concurrency, warmup=()):
+    for text in warmup:
+        target.call(text)
+
+    peak = {"rss_mb": target.rss_mb()}
+    done = threading.Event()
+
+    def sample_rss():
+        while not done.wait(0.5):
+            rss = target.rss_mb()
+            if rss is not None and (peak["rss_mb"] is None or rss > peak["rss_mb"]):
+                peak["rss_mb"] = rss
+
+    def timed(text):
+        start = time.perf_counter()
+        try:
+            status = target.call(text)
+        except Exception as e:
+            print(f"Ошибка запроса: {str(e)}", file=sys.stderr)
+            status = None
+        return status, time.perf_counter() - start
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    tokens_before = target.tokens()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, texts))
+    wall = time.perf_counter() - start
+    tokens_after = target.tokens()
+    done.set()
+    sampler.join()
+
+    latencies = [seconds for status, seconds in results if status == 200]
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    report = {
+        "requests": len(texts),
+        "ok": len(latencies),
+        "statuses": statuses,
+        "seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else None,
+        "chars_per_second": round(sum(len(text) for text in texts) / wall, 1) if wall else None,
+        "latency_mean": round(sum(latencies) / len(latencies), 4) if latencies else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "peak_rss_mb": round(peak["rss_mb"], 1) if peak["rss_mb"] is not None else None,
+    }
+    if tokens_before is not None and tokens_after is not None:
+        for kind in ("input", "output"):
+            count = tokens_after[kind] - tokens_before[kind]
+            report[f"{kind}_tokens"] = int(count)
+            report[f"{kind}_tokens_per_second"] = round(count / wall, 1) if wall else None
+    for key in ("latency_p50", "latency_p95", "latency_p99"):
+        if report[key] is not None:
+            report[key] = round(report[key], 4)
+    return report
+
+
+# Metric -> True if higher is better
+COMPARED = {
+    "throughput_rps": True,
+    "output_tokens_per_second": True,
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "peak_rss_mb": False,
+}
+
+
+def compare(results, baseline):
+    """Per scenario and metric: baseline, current and change in percent (positive = better)."""
+    comparison = {}
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        entry = {}
+        for metric, higher_is_better in COMPARED.items():
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            entry[metric] = {"baseline": before, "current": after,
+                             "change_percent": round(change if higher_is_better else -change, 1)}
+        comparison[name] = entry
+    return comparison
+
+
+def regressions(comparison, max_regression):
+    return [f"{name} {metric}: {values['change_percent']}%"
+            for name, metrics in comparison.items()
+            for metric, values in metrics.items()
+            if values["change_percent"] < -max_regression]
+
+
+def _csv(value, cast=str):
+    return [cast(item.strip()) for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the translation service")
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process app")
+    parser.add_argument("--model", default=CURRENT_MODEL)
+    parser.add_argument("--targets", default="translate,screen_translator,batcher,pipeline")
+    parser.add_argument("--lengths", default="short,medium,long")
+    parser.add_argument("--repeat", default="0,0.5", help="shares of repeated texts, e.g. 0,0.5")
+    parser.add_argument("--concurrency", default="1,4")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="unrecorded requests per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--salt", type=int, default=None,
+                        help="number salt; defaults to the current time so server caches start cold")
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="exit with status 1 if any compared metric is worse by more than this percent")
+    args = parser.parse_args(argv)
+
+    model = next((m for m in MODEL_LIST if m["value"] == args.model), None)
+    if model is None:
+        parser.error(f"Unknown model: {args.model}")
+    salt = int(time.time()) if args.salt is None else args.salt
+
+    results = {}
+    # Model loading and the app print to stdout; keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        for kind in _csv(args.targets):
+            if args.url and kind in ("batcher", "pipeline"):
+                print(f"Пропускаем {kind}: с --url доступны только HTTP-эндпоинты", file=sys.stderr)
+                continue
+            target = HttpTarget(args.url, kind, model) if args.url else LocalTarget(kind, args.model)
+            for length in _csv(args.lengths):
+                for repeat in _csv(args.repeat, float):
+                    warmup = make_corpus(model["from"], length, args.warmup, 0, args.seed + 1, salt)
+                    for concurrency in _csv(args.concurrency, int):
+                        # Fresh numbers per concurrency level so earlier levels don't warm the cache
+                        texts = make_corpus(model["from"], length, args.requests, repeat, args.seed, f"{salt}-{concurrency}")
+                        name = f"{kind}/{length}/repeat={repeat}/c={concurrency}"
+                        print(f"{name} ...", file=sys.stderr)
+                        results[name] = run_scenario(target, texts, concurrency, warmup)
+
+    report = {
+        "time": time.time(),
+        "model": args.model,
+        "url": args.url,
+        "cpu_count": psutil.cpu_count(),
+        "settings": {key: getattr(args, key) for key in ("targets", "lengths", "repeat", "concurrency",
+                                                         "requests", "warmup", "seed")},
+        "results": results,
+    }
+    failed = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(results, json.load(f).get("results", {}))
+        if args.max_regression is not None:
+            failed = regressions(report["comparison"], args.max_regression)
+            report["regressions"] = failed
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""CPU partitioning for the processes that run models.
+
+Every model process (gunicorn worker, or inference process with
+INFERENCE_SOCKET) gets a disjoint set of cores and a torch intra-op thread pool
+of the same size, so N processes with default thread counts don't oversubscribe
+the machine.
+
+    python cpu_affinity.py autotune --profile interactive
+
+measures the workers x threads splits of this machine's cores on a synthetic
+load profile and prints the best one as environment settings.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+# Привязка процессов с моделями к своим ядрам (CPU_AFFINITY=0 отключает привязку)
+CPU_AFFINITY = os.environ.get("CPU_AFFINITY", "1") == "1"
+# Потоков torch на процесс: 0 = по числу ядер процесса
+TORCH_THREADS = int(os.environ.get("TORCH_THREADS", 0))
+TORCH_INTEROP_THREADS = int(os.environ.get("TORCH_INTEROP_THREADS", 1))
+
+
+def available_cpus():
+    # The cores this process may use (respects cgroup/taskset limits), not just the count
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
+def partition(cpus, parts):
+    """Splits cpus into `parts` disjoint, contiguous, nearly equal sets.
+
+    With more parts than cpus the sets can't be disjoint: each part gets one cpu,
+    round-robin.
+    """
+    parts = max(1, parts)
+    if parts >= len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(parts)]
+    size, extra = divmod(len(cpus), parts)
+    sets, start = [], 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(cpus[start:end])
+        start = end
+    return sets
+
+
+def apply(index, parts, cpus=None, threads=None):
+    """Pins this process to its share (index of parts) and sizes torch's thread pools to it.
+
+    Returns (cores, torch threads).
+    """
+    import torch
+
+    cores = partition(cpus or available_cpus(), parts)[index % max(1, parts)]
+    if CPU_AFFINITY and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    if threads is None:
+        threads = TORCH_THREADS or len(cores)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+    except RuntimeError:
+        # Only possible before the first inter-op parallel work in the process
+        pass
+    return cores, threads
+
+
+# ---------------------------------------------------------------- autotune
+
+# Load profiles: text lengths (benchmark.LENGTHS), concurrent clients per core and what to optimize
+PROFILES = {
+    "interactive": {"lengths": ["short", "medium"], "clients_per_core": 1, "goal": "latency_p95"},
+    "bulk": {"lengths": ["long"], "clients_per_core": 4, "goal": "chars_per_second"},
+    "mixed": {"lengths": ["short", "medium", "long"], "clients_per_core": 2, "goal": "chars_per_second"},
+}
+
+
+def candidate_splits(cpu_count):
+    # Every worker count that divides the cores evenly, plus the current default of 4 workers
+    counts = {workers for workers in range(1, cpu_count + 1) if cpu_count % workers == 0}
+    counts.add(min(4, cpu_count))
+    return sorted(counts)
+
+
+def _run_worker(index, workers, cpus, model, texts, clients, barrier, results):
+    # Child process of the autotune run: one "gunicorn worker" with its share of clients
+    from concurrent.futures import ThreadPoolExecutor
+
+    # TORCH_THREADS from the environment must not skew the comparison
+    cores, threads = apply(index, workers, cpus, threads=len(partition(cpus, workers)[index]))
+    batcher = model["batcher"]
+    for text in texts[:2]:
+        batcher.submit(text).result()
+    barrier.wait()
+
+    def timed(text):
+        start = time.perf_counter()
+        batcher.submit(text).result()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = list(pool.map(timed, texts))
+    results.put({
+        "index": index,
+        "cores": cores,
+        "threads": threads,
+        "seconds": time.perf_counter() - start,
+        "latencies": latencies,
+        "chars": sum(len(text) for text in texts),
+    })
+
+
+def measure(model, workers, cpus, texts, clients):
+    """Runs texts through `workers` forked processes pinned like gunicorn workers; returns a report."""
+    from benchmark import percentile
+
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    shares = [texts[i::workers] for i in range(workers)]
+    per_worker = max(1, round(clients / workers))
+    processes = [
+        context.Process(target=_run_worker, args=(i, workers, cpus, model, shares[i], per_worker, barrier, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    wall = max(report["seconds"] for report in reports)
+    latencies = [seconds for report in reports for seconds in report["latencies"]]
+    return {
+        "workers": workers,
+        "threads": reports[0]["threads"],
+        "clients_per_worker": per_worker,
+        "seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "chars_per_second": round(sum(report["chars"] for report in reports) / wall, 1),
+        "latency_p50": round(percentile(latencies, 50), 4),
+        "latency_p95": round(percentile(latencies, 95), 4),
+    }
+
+
+def autotune(argv=None):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from benchmark import make_corpus
+    from model_config import MODEL_LIST, CURRENT_MODEL
+    from model_registry import ModelRegistry
+
+    parser = argparse.ArgumentParser(prog="cpu_affinity.py autotune",
+                                     description="Find the best workers x threads split for a load profile")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="interactive")
+    parser.add_argument("--model", default=CURRENT_MODEL)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", help="worker counts to try, e.g. 1,2,4 (default: divisors of the core count)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    profile = PROFILES[args.profile]
+    cpus = available_cpus()
+    counts = [int(n) for n in args.workers.split(",")] if args.workers else candidate_splits(len(cpus))
+    entry = next((m for m in MODEL_LIST if m["value"] == args.model), None)
+    if entry is None:
+        parser.error(f"Unknown model: {args.model}")
+    size = max(1, args.requests // len(profile["lengths"]))
+    texts = [text for length in profile["lengths"]
+             for text in make_corpus(entry["from"], length, size, 0, args.seed)]
+
+    results = []
+    # Model loading prints to stdout; keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        # Loaded once and inherited by the forked workers, as with gunicorn's preload_app
+        model = ModelRegistry(MODEL_LIST).get(args.model, warm=False)
+        for workers in counts:
+            print(f"{workers} workers ...", file=sys.stderr)
+            results.append(measure(model, workers, cpus, texts, len(cpus) * profile["clients_per_core"]))
+
+    goal = profile["goal"]
+    best = (min if goal.startswith("latency") else max)(results, key=lambda result: result[goal])
+    print(json.dumps({
+        "profile": args.profile,
+        "goal": goal,
+        "model": args.model,
+        "cpus": len(cpus),
+        "results": results,
+        "best": best,
+        "environment": {"GUNICORN_WORKERS": best["workers"], "TORCH_THREADS": best["threads"]},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    # python cpu_affinity.py autotune [--profile interactive|bulk|mixed] [--workers 1,2,4]
+    if len(sys.argv) < 2 or sys.argv[1] != "autotune":
+        raise SystemExit("usage: python cpu_affinity.py autotune [options]")
+    autotune(sys.argv[2:])
@@ -0,0 +1,209 @@
+import fcntl
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# История отзывов: JSON Lines, только дозапись; рядом индекс смещений строк для постраничного чтения.
+# Сжатие выполняет один воркер на машину (по flock), раз в FEEDBACK_COMPACT_SECONDS, если с прошлого
+# сжатия добавилось не меньше FEEDBACK_COMPACT_MIN_NEW записей; вручную: python feedback_store.py compact
+FEEDBACK_FILE = Path(os.environ.get("FEEDBACK_FILE", "translation_history.jsonl"))
+FEEDBACK_COMPACT_SECONDS = float(os.environ.get("FEEDBACK_COMPACT_SECONDS", 3600))
+FEEDBACK_COMPACT_MIN_NEW = int(os.environ.get("FEEDBACK_COMPACT_MIN_NEW", 1000))
+
+_OFFSET = struct.Struct("<Q")
+
+
+class FeedbackStore:
+    """Append-only JSON Lines feedback log, safe for concurrent gunicorn workers.
+
+    Every record is one line; a sidecar ``.idx`` file holds the byte offset of
+    each line so pages can be read without scanning the whole log. All writers
+    serialize on an flock'd ``.lock`` file. Rewriting the log (migration,
+    compaction) renumbers the records and bumps the ``.gen`` generation, so a
+    reader that remembers how many records it has seen knows when to start over.
+    """
+
+    def __init__(self, path=FEEDBACK_FILE, legacy_path=None):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.generation_path = self.path.with_name(self.path.name + ".gen")
+        self._compactor_pid = None
+        self._compactor_lock = threading.Lock()
+        if legacy_path is not None:
+            self._migrate(Path(legacy_path))
+
+    @contextmanager
+    def _locked(self, mode):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _migrate(self, legacy_path):
+        # Переносим старый translation_history.json один раз
+        with self._locked(fcntl.LOCK_EX):
+            if self.path.exists() or not legacy_path.exists():
+                return
+            try:
+                items = json.loads(legacy_path.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"Ошибка загрузки истории: {str(e)}")
+                return
+            self._rewrite(items)
+            legacy_path.rename(legacy_path.with_name(legacy_path.name + ".migrated"))
+            print(f"История перенесена в {self.path} ({len(items)} записей)")
+
+    def append(self, item):
+        line = (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._locked(fcntl.LOCK_EX):
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                offset = os.lseek(fd, 0, os.SEEK_END)
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+            with open(self.index_path, "ab") as index:
+                index.write(_OFFSET.pack(offset))
+
+    def count(self):
+        try:
+            return self.index_path.stat().st_size // _OFFSET.size
+        except FileNotFoundError:
+            return 0
+
+    def generation(self):
+        try:
+            return int(self.generation_path.read_text() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def read(self, offset=0, limit=50):
+        """Returns (items, total) for records [offset, offset + limit)."""
+        with self._locked(fcntl.LOCK_SH):
+            return self._read(offset, limit)
+
+    def read_new(self, generation, seen):
+        """Returns (items, generation, total): the records after the first `seen`
+        of `generation`, or all records if the log has been rewritten since."""
+        with self._locked(fcntl.LOCK_SH):
+            current = self.generation()
+            if current != generation:
+                seen = 0
+            items, total = self._read(seen, self.count() - seen)
+            return items, current, total
+
+    def _read(self, offset, limit):
+        # Caller holds the lock
+        total = self.count()
+        offset = max(0, offset)
+        limit = max(0, min(limit, total - offset))
+        if not limit:
+            return [], total
+        with open(self.index_path, "rb") as index:
+            index.seek(offset * _OFFSET.size)
+            start = _OFFSET.unpack(index.read(_OFFSET.size))[0]
+        items = []
+        with open(self.path, "rb") as log:
+            log.seek(start)
+            for _ in range(limit):
+                line = log.readline()
+                if not line:
+                    break
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    continue
+        return items, total
+
+    def compact(self):
+        """Drops truncated lines and repeated feedback on the same translation
+        (the latest one wins), then rebuilds the offset index.
+
+        Reads and rewrites the whole log under the exclusive lock, so appends
+        wait for it; it runs from one elected worker (see ensure_compactor) or
+        offline (python feedback_store.py compact).
+        """
+        with self._locked(fcntl.LOCK_EX):
+            if not self.path.exists():
+                return
+            latest = {}
+            with open(self.path, "rb") as log:
+                for line_no, line in enumerate(log):
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(item, dict):
+                        key = (item.get("model"), item.get("input_text"), item.get("translated_text"))
+                    else:
+                        key = line_no
+                    latest.pop(key, None)
+                    latest[key] = item
+            self._rewrite(latest.values())
+
+    def ensure_compactor(self, interval=FEEDBACK_COMPACT_SECONDS, min_new=FEEDBACK_COMPACT_MIN_NEW):
+        # One compactor thread per process (threads don't survive fork); of those, the one
+        # holding the .compact.lock flock does the work, the others take over if it goes away
+        if interval <= 0 or self._compactor_pid == os.getpid():
+            return
+        with self._compactor_lock:
+            if self._compactor_pid != os.getpid():
+                self._compactor_pid = os.getpid()
+                threading.Thread(target=self._run_compactor, args=(interval, min_new),
+                                 name="feedback-compactor", daemon=True).start()
+
+    def _run_compactor(self, interval, min_new):
+        lock = open(self.path.with_name(self.path.name + ".compact.lock"), "a")
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                time.sleep(interval)
+                continue
+            compacted = 0
+            while True:
+                time.sleep(interval)
+                try:
+                    # Only when enough records were added, so an idle log isn't rewritten every time
+                    if self.count() - compacted >= min_new:
+                        self.compact()
+                        compacted = self.count()
+                except Exception as e:
+                    print(f"Ошибка сжатия истории: {str(e)}")
+
+    def _rewrite(self, items):
+        # Caller holds the exclusive lock
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_index = self.index_path.with_name(self.index_path.name + ".tmp")
+        offset = 0
+        with open(tmp_path, "wb") as log, open(tmp_index, "wb") as index:
+            for item in items:
+                line = (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+                log.write(line)
+                index.write(_OFFSET.pack(offset))
+                offset += len(line)
+            log.flush()
+            os.fsync(log.fileno())
+        os.replace(tmp_path, self.path)
+        os.replace(tmp_index, self.index_path)
+        tmp_generation = self.generation_path.with_name(self.generation_path.name + ".tmp")
+        tmp_generation.write_text(str(self.generation() + 1))
+        os.replace(tmp_generation, self.generation_path)
+
+
+if __name__ == "__main__":
+    # python feedback_store.py compact [path]
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        raise SystemExit("usage: python feedback_store.py compact [path]")
+    store = FeedbackStore(sys.argv[2] if len(sys.argv) > 2 else FEEDBACK_FILE)
+    before = store.count()
+    store.compact()
+    print(f"{store.path}: {before} -> {store.count()} записей")
@@ -0,0 +1,412 @@
+"""Background translation of uploaded files.
+
+A job is a directory in JOBS_DIR with the uploaded input, the output written so
+far and a job.json checkpoint. Input is read from disk unit by unit (a line, a
+JSONL record, a subtitle block or a CSV row) and translated in chunks; after
+every chunk the output is fsync'ed and the checkpoint records the input and
+output offsets, so a restarted server resumes exactly where it stopped and
+memory use doesn't depend on the file size.
+
+Any worker process may run a job: a job is claimed by flock'ing its lock file,
+and at most JOBS_MAX_RUNNING jobs run at once on the host. Jobs that ended more
+than JOBS_RETENTION_SECONDS ago are deleted by the runner.
+"""
+import csv
+import fcntl
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+# Задания на перевод файлов: каталог на диске, размер чанка, число одновременных заданий
+JOBS_DIR = os.environ.get("JOBS_DIR", "translation_jobs")
+JOB_CHUNK_UNITS = int(os.environ.get("JOB_CHUNK_UNITS", 256))
+JOB_CHUNK_CHARS = int(os.environ.get("JOB_CHUNK_CHARS", 100000))
+JOBS_MAX_RUNNING = int(os.environ.get("JOBS_MAX_RUNNING", 1))
+JOBS_POLL_SECONDS = float(os.environ.get("JOBS_POLL_SECONDS", 5))
+# Finished jobs (input, output and checkpoint) are deleted this long after they ended
+JOBS_RETENTION_SECONDS = float(os.environ.get("JOBS_RETENTION_SECONDS", 7 * 24 * 3600))
+
+FORMATS = ("txt", "jsonl", "srt", "csv")
+_EXTENSIONS = {".txt": "txt", ".text": "txt", ".jsonl": "jsonl", ".ndjson": "jsonl", ".srt": "srt", ".csv": "csv"}
+# Errors kept in job.json; the rest are only counted
+_MAX_ERRORS = 20
+
+
+def detect_format(filename):
+    return _EXTENSIONS.get(os.path.splitext(filename or "")[1].lower())
+
+
+class _Lines:
+    """Decoded lines of a binary file with the byte offset after the last line read."""
+
+    def __init__(self, f):
+        self.f = f
+        self.offset = f.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode("utf-8", errors="replace")
+
+
+# Readers yield (text, render): text is None for units that are copied as is, an
+# exception for units that can't be read (copied as is and reported as failed);
+# render(translation) returns the output for the unit
+
+def _read_txt(lines, options):
+    for line in lines:
+        body = line.rstrip("\r\n")
+        ending = line[len(body):]
+        if body.strip():
+            yield body, lambda translation, ending=ending: translation + ending
+        else:
+            yield None, lambda translation, line=line: line
+
+
+def _read_jsonl(lines, options):
+    field = options.get("field", "text")
+    output_field = options.get("output_field", "translated_text")
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            error = ValueError(f"Invalid JSON line: {line[:100]!r}") if line.strip() else None
+            yield error, lambda translation, line=line: line
+            continue
+        text = record.get(field) if isinstance(record, dict) else None
+        if not isinstance(text, str) or not text.strip():
+            yield None, lambda translation, line=line: line
+            continue
+
+        def render(translation, record=record):
+            record[output_field] = translation
+            return json.dumps(record, ensure_ascii=False) + "\n"
+
+        yield text, render
+
+
+def _read_srt(lines, options):
+    # Blocks: index, timing, text lines, blank line. Lines of one cue are translated
+    # together (a sentence often spans both) and written back as one line
+    block = []
+    for line in lines:
+        if line.strip():
+            block.append(line.rstrip("\r\n"))
+            continue
+        if block:
+            yield from _srt_block(block)
+            block = []
+        else:
+            yield None, lambda translation, line=line: line
+    if block:
+        yield from _srt_block(block)
+
+
+def _srt_block(block):
+    head = block[:2] if len(block) >= 2 and "-->" in block[1] else block[:1] if "-->" in block[0] else []
+    text = " ".join(line.strip() for line in block[len(head):])
+    if not text:
+        yield None, lambda translation: "\n".join(block) + "\n\n"
+    else:
+        yield text, lambda translation: "\n".join(head + [translation]) + "\n\n"
+
+
+def _read_csv(lines, options, header):
+    field = options.get("field", "text")
+    if field not in header:
+        raise ValueError(f"CSV has no column {field!r}")
+    column = header.index(field)
+    for row in csv.reader(lines):
+        text = row[column] if column < len(row) else ""
+
+        def render(translation, row=row):
+            out = io.StringIO()
+            csv.writer(out).writerow(row + [translation])
+            return out.getvalue()
+
+        yield (text if text.strip() else None), render
+
+
+def _csv_header(path, options):
+    with open(path, "rb") as f:
+        lines = _Lines(f)
+        header = next(csv.reader(lines), None)
+        if header is None:
+            raise ValueError("Empty CSV file")
+        return header, lines.offset
+
+
+class JobManager:
+    """Creates jobs, reports their state and runs them in a background thread.
+
+    translate(options, texts) does the actual work: it gets the job options
+    (model, source/target, mode, ...) and a chunk of non-empty texts and
+    returns one translation or exception per text. If it raises one of
+    retry_errors, the job stays running and resumes from its last checkpoint
+    on the next poll instead of failing.
+    """
+
+    def __init__(self, translate, directory=JOBS_DIR, max_running=JOBS_MAX_RUNNING, retry_errors=(),
+                 retention=JOBS_RETENTION_SECONDS, chunk_units=JOB_CHUNK_UNITS):
+        self.translate = translate
+        self.chunk_units = max(1, chunk_units)
+        self.retention = retention
+        self.retry_errors = tuple(retry_errors)
+        self.directory = directory
+        self.max_running = max_running
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    # ------------------------------------------------------------ job files
+
+    def _path(self, job_id, name=""):
+        if not job_id or not all(c.isalnum() or c == "-" for c in job_id):
+            raise ValueError("Invalid job id")
+        return os.path.join(self.directory, job_id, name)
+
+    def _write_state(self, job_id, state):
+        path = self._path(job_id, "job.json")
+        # Per writer, so a concurrent writer never replaces (or loses) our temp file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get(self, job_id):
+        try:
+            with open(self._path(job_id, "job.json"), encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        if state["status"] in ("queued", "running") and os.path.exists(self._path(job_id, "cancel")):
+            state["status"] = "cancelling"
+        return state
+
+    def output_path(self, job_id):
+        return self._path(job_id, "output")
+
+    def create(self, stream, filename, options):
+        """Streams the upload to disk and queues the job; returns its state."""
+        fmt = options.get("format") or detect_format(filename)
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format, expected one of {', '.join(FORMATS)}")
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._path(job_id), exist_ok=True)
+        with open(self._path(job_id, "input"), "wb") as f:
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+        open(self._path(job_id, "output"), "wb").close()
+        state = {
+            "id": job_id,
+            "format": fmt,
+            "filename": filename,
+            "options": options,
+            "status": "queued",
+            "input_bytes": os.path.getsize(self._path(job_id, "input")),
+            "input_offset": 0,
+            "output_bytes": 0,
+            "done_units": 0,
+            "translated_units": 0,
+            "failed_units": 0,
+            "errors": [],
+            "created": time.time(),
+            "updated": time.time(),
+        }
+        self._write_state(job_id, state)
+        self.ensure_started()
+        self._wake.set()
+        return state
+
+    def cancel(self, job_id):
+        state = self.get(job_id)
+        if state is None:
+            return None
+        if state["status"] in ("queued", "running"):
+            open(self._path(job_id, "cancel"), "w").close()
+            self._wake.set()
+        return self.get(job_id)
+
+    # ------------------------------------------------------------ runner
+
+    def ensure_started(self):
+        # One runner thread per process (threads don't survive fork)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                os.makedirs(self.directory, exist_ok=True)
+                threading.Thread(target=self._run, name="file-jobs", daemon=True).start()
+
+    def _try_lock(self, path):
+        f = open(path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return f
+        except BlockingIOError:
+            f.close()
+            return None
+
+    def _run(self):
+        while True:
+            try:
+                self._run_pending()
+                self._sweep()
+            except Exception as e:
+                print(f"Ошибка обработки заданий: {str(e)}")
+            self._wake.wait(JOBS_POLL_SECONDS)
+            self._wake.clear()
+
+    def _run_pending(self):
+        # Queued jobs and jobs whose worker died (their lock is free again), oldest first
+        for job_id in sorted(os.listdir(self.directory), key=lambda name: self._created(name)):
+            state = self.get(job_id) if os.path.isdir(os.path.join(self.directory, job_id)) else None
+            if state is None or state["status"] not in ("queued", "running", "cancelling"):
+                continue
+            slot = next(filter(None, (self._try_lock(os.path.join(self.directory, f".slot-{i}.lock"))
+                                      for i in range(max(1, self.max_running)))), None)
+            if slot is None:
+                return
+            try:
+                lock = self._try_lock(self._path(job_id, "lock"))
+                if lock is None:
+                    continue
+                try:
+                    self._process(job_id)
+                finally:
+                    lock.close()
+            finally:
+                slot.close()
+
+    def _sweep(self):
+        # Deletes jobs that ended more than `retention` seconds ago, and uploads that never
+        # got a checkpoint (the worker died while receiving them)
+        now = time.time()
+        for job_id in os.listdir(self.directory):
+            path = os.path.join(self.directory, job_id)
+            if not os.path.isdir(path):
+                continue
+            state = self.get(job_id)
+            if state is None:
+                expired = now - os.path.getmtime(path) > self.retention
+            else:
+                expired = (state["status"] in ("done", "failed", "cancelled")
+                           and now - state.get("finished", state["updated"]) > self.retention)
+            if expired:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _created(self, job_id):
+        try:
+            return os.path.getmtime(os.path.join(self.directory, job_id, "input"))
+        except OSError:
+            return 0
+
+    def _process(self, job_id):
+        state = self.get(job_id)
+        if state is None or state["status"] not in ("queued", "running", "cancelling"):
+            return
+        try:
+            self._translate_file(job_id, state)
+            state.pop("retry_error", None)
+        except self.retry_errors as e:
+            state["retry_error"] = str(e)
+            print(f"Задание {job_id} будет продолжено позже: {str(e)}")
+        except Exception as e:
+            state["status"] = "failed"
+            state["error"] = str(e)
+            print(f"Задание {job_id} завершилось с ошибкой: {str(e)}")
+        state["updated"] = time.time()
+        self._write_state(job_id, state)
+
+    def _units(self, state, f):
+        fmt, options = state["format"], state["options"]
+        if fmt == "csv":
+            header, header_end = _csv_header(self._path(state["id"], "input"), options)
+            f.seek(max(state["input_offset"], header_end))
+            lines = _Lines(f)
+            return lines, header, _read_csv(lines, options, header)
+        f.seek(state["input_offset"])
+        lines = _Lines(f)
+        reader = {"txt": _read_txt, "jsonl": _read_jsonl, "srt": _read_srt}[fmt]
+        return lines, None, reader(lines, options)
+
+    def _translate_file(self, job_id, state):
+        # Cancelled while queued: also when the file has no chunk to check the cancel file at
+        if os.path.exists(self._path(job_id, "cancel")):
+            state["status"] = "cancelled"
+            return
+        state["status"] = "running"
+        state.setdefault("started", time.time())
+        with open(self._path(job_id, "input"), "rb") as source, open(self.output_path(job_id), "r+b") as output:
+            # Anything written after the last checkpoint is dropped and redone
+            output.truncate(state["output_bytes"])
+            output.seek(state["output_bytes"])
+            lines, header, units = self._units(state, source)
+            if header is not None and state["output_bytes"] == 0:
+                out = io.StringIO()
+                csv.writer(out).writerow(header + [state["options"].get("output_field", "translated_text")])
+                self._write(output, state, out.getvalue(), source_offset=None)
+            self._write_state(job_id, state)
+
+            chunk, chars = [], 0
+            for unit in units:
+                chunk.append(unit)
+                chars += len(unit[0]) if isinstance(unit[0], str) else 0
+                if len(chunk) >= self.chunk_units or chars >= JOB_CHUNK_CHARS:
+                    if not self._flush_chunk(job_id, state, chunk, output, lines.offset):
+                        return
+                    chunk, chars = [], 0
+            if chunk and not self._flush_chunk(job_id, state, chunk, output, lines.offset):
+                return
+        state["status"] = "done"
+        state["finished"] = time.time()
+
+    def _flush_chunk(self, job_id, state, chunk, output, input_offset):
+        # Translates and writes one chunk, then checkpoints; False if the job was cancelled
+        if os.path.exists(self._path(job_id, "cancel")):
+            state["status"] = "cancelled"
+            return False
+        texts = [text for text, _ in chunk if isinstance(text, str)]
+        translations = iter(self.translate(state["options"], texts) if texts else [])
+        parts = []
+        for text, render in chunk:
+            if text is None:
+                parts.append(render(None))
+                continue
+            translation = text if isinstance(text, Exception) else next(translations)
+            if isinstance(translation, Exception):
+                # The source text stays in the output so the file remains complete
+                state["failed_units"] += 1
+                if len(state["errors"]) < _MAX_ERRORS:
+                    state["errors"].append({"unit": state["done_units"] + len(parts), "error": str(translation)})
+                translation = text
+            else:
+                state["translated_units"] += 1
+            parts.append(render(translation))
+        self._write(output, state, "".join(parts), input_offset)
+        state["done_units"] += len(chunk)
+        state["updated"] = time.time()
+        self._write_state(job_id, state)
+        return True
+
+    def _write(self, output, state, text, source_offset):
+        data = text.encode("utf-8")
+        output.write(data)
+        output.flush()
+        os.fsync(output.fileno())
+        state["output_bytes"] += len(data)
+        if source_offset is not None:
+            state["input_offset"] = source_offset
@@ -1,16 +1,41 @@
 # Gunicorn configuration file
 import multiprocessing
+import os
+import subprocess
+import sys
 
 # Server socket
-bind = "0.0.0.0:8003"
+bind = ["0.0.0.0:8003"]
+# Клиенты на той же машине могут ходить через Unix-сокет, минуя TCP: GUNICORN_UDS=/run/translation-app.sock
+uds = os.environ.get('GUNICORN_UDS', '')
+if uds:
+    bind.append(f"unix:{uds}")
 backlog = 2048
 
-# Worker processes
-workers = 4
-worker_class = 'sync'
+# Worker processes (python cpu_affinity.py autotune suggests a workers x threads split)
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+# gthread: несколько запросов на воркер, чтобы микробатчер мог собирать их в батчи.
+# With INFERENCE_SOCKET the workers only do HTTP, so use 'gevent' there and let
+# worker_connections bound the I/O concurrency
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print("Пакет gevent не установлен (см. requirements-extra.txt): используем gthread")
+        worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
 worker_connections = 1000
 timeout = 120
-keepalive = 2
+# gthread parks idle keep-alive connections in its poller, not in a thread, so
+# clients sending a request per string can keep their connection for a while
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 30))
+
+# Load models once in the master and share the weights copy-on-write with the
+# workers instead of keeping a private copy in each one (PRELOAD_APP=0 to disable).
+# Not needed when the models live in the inference processes
+inference_socket = os.environ.get('INFERENCE_SOCKET', '')
+preload_app = os.environ.get('PRELOAD_APP', '0' if inference_socket else '1') == '1'
 
 # Process naming
 proc_name = 'translation-app'
@@ -30,4 +55,48 @@ tmp_upload_dir = None
 
 # SSL
 keyfile = None
-certfile = None 
\ No newline at end of file
+certfile = None
+
+# Inference processes (inference_pool.py), started with the master when INFERENCE_SOCKET is set
+_inference_server = None
+
+
+def on_starting(server):
+    global _inference_server
+    # Drop per-worker metric dumps left over from the previous run
+    import metrics
+    metrics.clear()
+    if inference_socket:
+        _inference_server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inference_pool.py')]
+        )
+        server.log.info("Started inference pool on %s (pid %s)", inference_socket, _inference_server.pid)
+
+
+def pre_fork(server, worker):
+    # Core set index for the new worker; a replacement worker takes its predecessor's free slot
+    used = {getattr(w, 'cpu_slot', None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(used) + 1) if slot not in used)
+
+
+def post_fork(server, worker):
+    # Each worker gets a disjoint share of the cores and as many torch threads (cpu_affinity.py).
+    # With INFERENCE_SOCKET the inference processes are partitioned instead
+    if inference_socket:
+        return
+    import cpu_affinity
+    cores, threads = cpu_affinity.apply(worker.cpu_slot, server.cfg.workers)
+    server.log.info("Worker %s (slot %s): cores %s, torch threads %s", worker.pid, worker.cpu_slot, cores, threads)
+
+
+def post_worker_init(worker):
+    # Warm the models up before this worker accepts connections, so a restarted
+    # worker only gets traffic once it is warm (see also /readyz)
+    import app
+    app.warm_up(notify=worker.notify)
+
+
+def on_exit(server):
+    if _inference_server is not None:
+        _inference_server.terminate()
+        _inference_server.wait(timeout=30)
@@ -0,0 +1,314 @@
+"""Dedicated inference processes behind a local Unix socket.
+
+With INFERENCE_SOCKET set, gunicorn workers (e.g. gevent) only parse HTTP and
+hand translation jobs to these processes, so I/O concurrency and CPU-bound
+inference scale independently. Run standalone with ``python inference_pool.py``
+or let gunicorn start it (see gunicorn_config.py).
+"""
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from batching import BULK, INTERACTIVE, QueueFullError
+
+INFERENCE_SOCKET = os.environ.get("INFERENCE_SOCKET", "")
+INFERENCE_PROCESSES = int(os.environ.get("INFERENCE_PROCESSES", 1))
+# Общий лимит заданий в работе на все процессы; сверх него — 503
+INFERENCE_QUEUE_MAX = int(os.environ.get("INFERENCE_QUEUE_MAX", 64))
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", 32))
+HEALTH_TIMEOUT = 2
+
+_HEADER = struct.Struct(">I")
+
+
+def send_message(sock, message):
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    buf = b""
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return buf
+
+
+def recv_message(sock):
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, _HEADER.unpack(header)[0])
+    return None if data is None else json.loads(data)
+
+
+# ---------------------------------------------------------------- server side
+
+class _Handler(socketserver.BaseRequestHandler):
+    # One connection per gunicorn worker; jobs on it are pipelined and answered out of order
+
+    def handle(self):
+        send_lock = threading.Lock()
+        inflight = self.server.inflight
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ValueError):
+                break
+            if message is None:
+                break
+            if message.get("op") == "health":
+                # Answered right away: a busy process is still healthy
+                self._reply({"id": message.get("id"), "result": self.server.registry.model_states()}, send_lock)
+                continue
+            # Admitted here, before the executor: jobs waiting for a thread count as in flight
+            with inflight.get_lock():
+                busy = inflight.value >= self.server.queue_max
+                if not busy:
+                    inflight.value += 1
+            if busy:
+                self._reply({"id": message.get("id"), "busy": True}, send_lock)
+            else:
+                self.server.jobs.submit(self._process, message, send_lock)
+
+    def _reply(self, reply, send_lock):
+        try:
+            with send_lock:
+                send_message(self.request, reply)
+        except OSError:
+            pass
+
+    def _process(self, message, send_lock):
+        reply = {"id": message.get("id")}
+        try:
+            reply["result"] = self._run(message)
+        except QueueFullError:
+            reply["busy"] = True
+        except Exception as e:
+            reply["error"] = str(e)
+            reply["timeout"] = isinstance(e, TimeoutError)
+        finally:
+            with self.server.inflight.get_lock():
+                self.server.inflight.value -= 1
+        self._reply(reply, send_lock)
+
+    def _run(self, message):
+        deadline = message.get("deadline")
+        if deadline is not None and time.time() > deadline:
+            raise TimeoutError("Deadline exceeded")
+        model = self.server.registry.get(message["model"])
+        if model is None:
+            raise ValueError("Invalid model")
+        batcher = model["batcher"]
+        if message["op"] == "translate":
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            lane = message.get("lane", INTERACTIVE)
+            return batcher.submit(message["text"], deadline, message.get("params"), lane).result(timeout)
+        if message["op"] == "batch":
+            results = batcher.translate_batch(message["texts"], deadline, message.get("params"), message.get("lane", BULK))
+            return [{"error": str(r)} if isinstance(r, Exception) else r for r in results]
+        raise ValueError(f"Unknown op: {message['op']}")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _serve(server, index, processes):
+    # Runs in each inference process: shared listening socket, registry and in-flight counter
+    import cpu_affinity
+    cpu_affinity.apply(index, processes)
+    server.jobs = ThreadPoolExecutor(max_workers=INFERENCE_THREADS)
+    signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+    # Accept jobs only once this process is warm
+    server.registry.warm_up()
+    server.serve_forever()
+
+
+def run_server(address=INFERENCE_SOCKET, processes=INFERENCE_PROCESSES, queue_max=INFERENCE_QUEUE_MAX):
+    from model_config import MODEL_LIST, CURRENT_MODEL
+    from model_registry import ModelRegistry
+
+    # Preloaded weights are shared copy-on-write by all inference processes
+    registry = ModelRegistry(MODEL_LIST)
+    preload = os.environ.get("PRELOAD_MODELS", CURRENT_MODEL)
+    registry.preload([value.strip() for value in preload.split(",") if value.strip()], warm=False)
+    gc.freeze()
+
+    # Socket appears only once models are loaded; until then workers get 503
+    if os.path.exists(address):
+        os.unlink(address)
+    server = _Server(address, _Handler)
+    server.registry = registry
+    server.inflight = multiprocessing.Value("i", 0)
+    server.queue_max = queue_max
+    print(f"Сервер инференса: {address}, процессов: {processes}")
+
+    children = []
+    for index in range(max(1, processes)):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _serve(server, index, max(1, processes))
+            finally:
+                os._exit(1)
+        children.append(pid)
+
+    def stop(*args):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        if os.path.exists(address):
+            os.unlink(address)
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        os.waitpid(pid, 0)
+
+
+# ---------------------------------------------------------------- client side
+
+class InferenceClient:
+    """One pipelined connection per worker process; replies are matched by id."""
+
+    def __init__(self, address=INFERENCE_SOCKET):
+        self.address = address
+        self._pid = None
+        self._sock = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.address)
+        except OSError as e:
+            sock.close()
+            raise ConnectionError(f"Inference server unavailable: {str(e)}")
+        self._sock = sock
+        self._pid = os.getpid()
+        self._pending = {}
+        threading.Thread(target=self._read_loop, args=(sock, self._pending), daemon=True).start()
+
+    def _read_loop(self, sock, pending):
+        while True:
+            try:
+                reply = recv_message(sock)
+            except (OSError, ValueError):
+                reply = None
+            if reply is None:
+                break
+            future = pending.pop(reply.get("id"), None)
+            if future is None:
+                continue
+            if reply.get("busy"):
+                future.set_exception(QueueFullError("Inference queue is full"))
+            elif "error" in reply:
+                error = TimeoutError if reply.get("timeout") else RuntimeError
+                future.set_exception(error(reply["error"]))
+            else:
+                future.set_result(reply["result"])
+
+        # Соединение оборвалось — отдаём ошибку всем ожидающим и переподключаемся при следующем запросе
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+        for future in list(pending.values()):
+            future.set_exception(ConnectionError("Inference server connection lost"))
+        pending.clear()
+
+    def request(self, message):
+        future = Future()
+        with self._lock:
+            if self._sock is None or self._pid != os.getpid():
+                self._connect()
+            message["id"] = next(self._ids)
+            self._pending[message["id"]] = future
+            try:
+                send_message(self._sock, message)
+            except OSError as e:
+                self._pending.pop(message["id"], None)
+                self._sock = None
+                raise ConnectionError(f"Inference server unavailable: {str(e)}")
+        return future
+
+
+class RemoteBatcher:
+    """Same interface as MicroBatcher, but the work happens in the inference processes."""
+
+    def __init__(self, client, model_value):
+        self.client = client
+        self.model_value = model_value
+
+    def submit(self, text, deadline=None, params=None, lane=INTERACTIVE):
+        return self.client.request({"op": "translate", "model": self.model_value, "text": text,
+                                    "deadline": deadline, "params": params, "lane": lane})
+
+    def translate_batch(self, texts, deadline=None, params=None, lane=BULK):
+        future = self.client.request({"op": "batch", "model": self.model_value, "texts": texts,
+                                      "deadline": deadline, "params": params, "lane": lane})
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        return [RuntimeError(r["error"]) if isinstance(r, dict) else r for r in future.result(timeout)]
+
+
+class RemoteRegistry:
+    """ModelRegistry stand-in for HTTP workers: models live in the inference processes."""
+
+    def __init__(self, model_list, client):
+        self.model_list = model_list
+        self.client = client
+        self._models = {model["value"]: model for model in model_list}
+        for model in model_list:
+            model["batcher"] = RemoteBatcher(client, model["value"])
+            model["tokenizer"] = None
+
+    def find(self, model_value):
+        return self._models.get(model_value)
+
+    def get(self, model_value):
+        return self._models.get(model_value)
+
+    def is_loaded(self, model_value):
+        return model_value in self._models
+
+    def loaded_models(self):
+        return list(self._models)
+
+    def preload(self, model_values, warm=True):
+        pass
+
+    def warm_up(self, model_value=None, notify=None):
+        pass
+
+    def model_states(self):
+        # States as seen by one of the inference processes
+        try:
+            return self.client.request({"op": "health"}).result(HEALTH_TIMEOUT)
+        except Exception:
+            return {value: "unavailable" for value in self._models}
+
+
+if __name__ == "__main__":
+    if not INFERENCE_SOCKET:
+        raise SystemExit("INFERENCE_SOCKET is not set")
+    run_server()
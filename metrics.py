@@ -0,0 +1,230 @@
+"""Prometheus-style metrics aggregated across gunicorn workers.
+
+Every process keeps its metrics in memory and periodically dumps them to
+METRICS_DIR/metrics_<pid>.json; /metrics merges all files, so counters and
+histograms cover every worker (including ones that have exited) while gauges
+only count live processes.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(tempfile.gettempdir(), "translation-metrics"))
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+_metrics = {}
+_flusher = {"pid": None}
+
+
+class Metric:
+    def __init__(self, kind, name, help, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets or ())
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        _ensure_flusher()
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        _ensure_flusher()
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def observe(self, value, **labels):
+        _ensure_flusher()
+        key = self._key(labels)
+        with self._lock:
+            # per-bucket counts (non-cumulative), then sum and count
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(key), value if not isinstance(value, list) else list(value)] for key, value in self._values.items()]
+        return {"kind": self.kind, "help": self.help, "labelnames": list(self.labelnames),
+                "buckets": list(self.buckets), "values": values}
+
+
+def counter(name, help, labelnames=()):
+    return Metric("counter", name, help, labelnames)
+
+
+def gauge(name, help, labelnames=()):
+    return Metric("gauge", name, help, labelnames)
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return Metric("histogram", name, help, labelnames, buckets)
+
+
+class timer:
+    """with timer(HISTOGRAM, model=...): ..."""
+
+    def __init__(self, metric, **labels):
+        self.metric = metric
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metric.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def flush():
+    _ensure_flusher()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"metrics_{os.getpid()}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({name: metric.snapshot() for name, metric in _metrics.items()}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except OSError as e:
+            print(f"Ошибка записи метрик: {str(e)}")
+
+
+def _ensure_flusher():
+    # One flusher thread per process (threads do not survive fork), started on first use
+    if _flusher["pid"] != os.getpid():
+        _flusher["pid"] = os.getpid()
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _after_fork_in_child():
+    # A forked worker starts from zero: the master's values are already in the master's
+    # own dump. Locks are replaced too: one held by a master thread at fork time (its
+    # flusher taking a snapshot) would never be released in the child
+    for metric in _metrics.values():
+        metric._lock = threading.Lock()
+        metric._values = {}
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def clear():
+    # Called from the gunicorn master on start so old runs don't leak into the totals
+    if os.path.isdir(METRICS_DIR):
+        for name in os.listdir(METRICS_DIR):
+            if name.startswith("metrics_"):
+                os.unlink(os.path.join(METRICS_DIR, name))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def collect():
+    """Merges the dumps of all processes: {name: snapshot with summed values}."""
+    flush()
+    merged = {}
+    for name in sorted(os.listdir(METRICS_DIR)):
+        if not name.startswith("metrics_") or not name.endswith(".json"):
+            continue
+        pid = int(name[len("metrics_"):-len(".json")])
+        try:
+            with open(os.path.join(METRICS_DIR, name), encoding="utf-8") as f:
+                dump = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = _alive(pid)
+        for metric_name, snapshot in dump.items():
+            if snapshot["kind"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(metric_name, dict(snapshot, values={}))
+            for labels, value in snapshot["values"]:
+                key = tuple(labels)
+                if isinstance(value, list):
+                    current = target["values"].get(key)
+                    target["values"][key] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    target["values"][key] = target["values"].get(key, 0) + value
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render():
+    """Prometheus text exposition format."""
+    lines = []
+    for name, snapshot in sorted(collect().items()):
+        lines.append(f"# HELP {name} {snapshot['help']}")
+        lines.append(f"# TYPE {name} {snapshot['kind']}")
+        names = snapshot["labelnames"]
+        for key, value in sorted(snapshot["values"].items()):
+            if snapshot["kind"] != "histogram":
+                lines.append(f"{name}{_format_labels(names, key)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(snapshot["buckets"], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(names, key, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(names, key, ('le', '+Inf'))} {value[-1]}")
+            lines.append(f"{name}_sum{_format_labels(names, key)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(names, key)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# Метрики приложения
+REQUESTS = counter("translation_http_requests_total", "HTTP requests by endpoint and status", ("endpoint", "status"))
+REQUEST_SECONDS = histogram("translation_http_request_seconds", "HTTP request latency", ("endpoint",))
+QUEUE_WAIT_SECONDS = histogram("translation_queue_wait_seconds", "Time a segment waits in the batch queue", ("model",))
+TOKENIZE_SECONDS = histogram("translation_tokenize_seconds", "Tokenization time per batch", ("model",))
+GENERATE_SECONDS = histogram("translation_generate_seconds", "Generation time per batch", ("model",))
+DETOKENIZE_SECONDS = histogram("translation_detokenize_seconds", "Detokenization time per batch", ("model",))
+BATCH_SIZE = histogram("translation_batch_size", "Segments per model batch", ("model",), SIZE_BUCKETS)
+MODEL_REQUESTS = counter("translation_model_segments_total", "Segments translated per model", ("model",))
+INPUT_TOKENS = counter("translation_input_tokens_total", "Input tokens per model", ("model",))
+OUTPUT_TOKENS = counter("translation_output_tokens_total", "Generated tokens per model", ("model",))
+CACHE_LOOKUPS = counter("translation_cache_lookups_total", "Translation cache lookups by result", ("result",))
+TOKEN_CACHE_LOOKUPS = counter("translation_token_cache_lookups_total", "Encoded segment cache lookups", ("model", "result"))
+COALESCED_REQUESTS = counter("translation_coalesced_requests_total", "Requests served by an identical in-flight request", ("scope",))
+TM_LOOKUPS = counter("translation_memory_lookups_total", "Translation memory lookups by match kind", ("result",))
+MODEL_LOAD_SECONDS = histogram("translation_model_load_seconds", "Model load time", ("model",), (1, 2, 5, 10, 30, 60, 120, 300))
+QUEUE_DEPTH = gauge("translation_queue_depth", "Segments waiting in the batch queues", ("model",))
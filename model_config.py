@@ -0,0 +1,20 @@
+# Доступные модели; app.py и процессы инференса читают список отсюда.
+# Optional per-model keys: "backend" ("torch", "int8", "onnx"; see backends.py) and
+# "generation" (default generation options, e.g. {"num_beams": 2}; see GENERATION_PRESETS)
+CURRENT_MODEL = "Helsinki-NLP/opus-mt-de-en"
+
+MODEL_LIST = [
+   {"name": "Helsinki-NLP/opus-mt-de-en", "value": "Helsinki-NLP/opus-mt-de-en", "description": "German-English", "from": "de", "to": "en", "icon": "🇩🇪🇬🇧"},
+   {"name": "Helsinki-NLP/opus-mt-en-de", "value": "Helsinki-NLP/opus-mt-en-de", "description": "English-German", "from": "en", "to": "de", "icon": "🇬🇧🇩🇪"},
+   {"name": "Helsinki-NLP/opus-mt-fr-en", "value": "Helsinki-NLP/opus-mt-fr-en", "description": "French-English", "from": "fr", "to": "en", "icon": "🇫🇷🇬🇧"},
+   {"name": "Helsinki-NLP/opus-mt-ru-en", "value": "Helsinki-NLP/opus-mt-ru-en", "description": "Russian-English", "from": "ru", "to": "en", "icon": "🇷🇺🇬🇧"},
+   {"name": "Helsinki-NLP/opus-mt-en-ru", "value": "Helsinki-NLP/opus-mt-en-ru", "description": "English-Russian", "from": "en", "to": "ru", "icon": "🇬🇧🇷🇺"}
+]
+
+# Generation presets, selected per request with "mode" (see app.generation_params).
+# fast: greedy search with a tight length budget, for short interactive strings;
+# quality: beam search for text where the translation matters more than latency
+GENERATION_PRESETS = {
+    "fast": {"num_beams": 1, "length_ratio": 1.5, "length_extra": 8},
+    "quality": {"num_beams": 4, "early_stopping": True},
+}
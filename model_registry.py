@@ -0,0 +1,203 @@
+import gc
+import itertools
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import psutil
+import torch
+
+from backends import PARITY_TEXTS, load_pipeline
+from batching import BATCH_MAX_SIZE, MicroBatcher, generation_kwargs
+import metrics
+
+# Бюджет памяти на веса загруженных моделей в МБ; 0 — без ограничения
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get("MODEL_MEMORY_BUDGET_MB", 0))
+# Прогревочные прогоны на модель (одиночный текст и полный батч); 0 — без прогрева
+WARMUP_ROUNDS = int(os.environ.get("WARMUP_ROUNDS", 1))
+
+
+def _packed_tensors(model):
+    # Dynamically quantized (int8) Linear layers keep weight and bias as packed
+    # params, which are neither parameters nor buffers
+    for module in model.modules():
+        packed = getattr(module, "_packed_params", None)
+        if packed is not None and hasattr(packed, "_weight_bias"):
+            yield from (tensor for tensor in packed._weight_bias() if tensor is not None)
+
+
+def model_memory_mb(pipe):
+    # Parameters, buffers and packed weights of a torch model; None for other runtimes (ONNX sessions)
+    try:
+        tensors = itertools.chain(pipe.model.parameters(), pipe.model.buffers(), _packed_tensors(pipe.model))
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors) / (1024 * 1024)
+    except (AttributeError, TypeError):
+        return None
+
+
+class LoadedModel(dict):
+    """A loaded model: the MODEL_LIST entry's settings plus "pipe", "tokenizer",
+    "batcher" and "encoder".
+
+    Requests keep using the object they got from get() even if the model is
+    unloaded meanwhile; its batcher is closed once the last of them lets go.
+    """
+
+
+class ModelRegistry:
+    """Loads translation pipelines on first use and evicts the least recently
+    used ones when the loaded models' weights go over the memory budget.
+    Preloaded models are never evicted: readiness checks expect them resident.
+
+    Every MODEL_LIST entry carries a "state": not_loaded, loading, loaded
+    (weights in memory, not warmed up in this process), warming, ready, failed
+    or unloaded.
+    """
+
+    def __init__(self, model_list, memory_budget_mb=MODEL_MEMORY_BUDGET_MB, loader=load_pipeline,
+                 warmup_rounds=WARMUP_ROUNDS):
+        self.model_list = model_list
+        self.memory_budget_mb = memory_budget_mb
+        self.loader = loader
+        self.warmup_rounds = warmup_rounds
+        self._models = {model["value"]: model for model in model_list}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {value: threading.Lock() for value in self._models}
+        self._pinned = set()
+        for model in model_list:
+            model.setdefault("state", "not_loaded")
+
+    def find(self, model_value):
+        return self._models.get(model_value)
+
+    def is_loaded(self, model_value):
+        return model_value in self._loaded
+
+    def loaded_models(self):
+        return list(self._loaded)
+
+    def model_states(self):
+        return {value: model["state"] for value, model in self._models.items()}
+
+    def get(self, model_value, warm=True):
+        """Returns the LoadedModel for model_value, loading it if needed.
+
+        A model loaded here is warmed up unless warm=False (e.g. in the gunicorn
+        master, which only loads weights to share them with the workers).
+        """
+        model = self._models.get(model_value)
+        if model is None:
+            return None
+        with self._lock:
+            loaded = self._loaded.get(model_value)
+            if loaded is not None:
+                self._loaded.move_to_end(model_value)
+                return loaded
+
+        # Загружаем вне общего лока, чтобы другие модели продолжали обслуживаться
+        with self._load_locks[model_value]:
+            with self._lock:
+                loaded = self._loaded.get(model_value)
+            if loaded is None:
+                start = time.time()
+                rss = psutil.Process().memory_info().rss
+                model["state"] = "loading"
+                try:
+                    pipe = self.loader(model)
+                except Exception:
+                    model["state"] = "failed"
+                    raise
+                batcher = MicroBatcher(pipe, name=model_value)
+                memory_mb = model_memory_mb(pipe)
+                if memory_mb is None:
+                    memory_mb = max(0, psutil.Process().memory_info().rss - rss) / (1024 * 1024)
+                settings = {key: value for key, value in model.items() if key != "state"}
+                loaded = LoadedModel(settings, pipe=pipe, tokenizer=pipe.tokenizer, batcher=batcher,
+                                     encoder=batcher.encoder, load_seconds=time.time() - start, memory_mb=memory_mb)
+                weakref.finalize(loaded, batcher.close)
+                model["state"] = "loaded"
+                metrics.MODEL_LOAD_SECONDS.observe(loaded["load_seconds"], model=model_value)
+                with self._lock:
+                    self._loaded[model_value] = loaded
+                print(f"Модель {model_value} загружена за {loaded['load_seconds']:.1f}s")
+                if warm:
+                    self.warm_up(model_value)
+        with self._lock:
+            if model_value in self._loaded:
+                self._loaded.move_to_end(model_value)
+        self._evict(keep=model_value)
+        return loaded
+
+    def preload(self, model_values, warm=True):
+        self._pinned.update(model_values)
+        for model_value in model_values:
+            try:
+                self.get(model_value, warm=warm)
+            except Exception as e:
+                print(f"Ошибка загрузки модели {model_value}: {str(e)}")
+
+    def warm_up(self, model_value=None, notify=None):
+        """Runs warm-up translations so lazy kernel and allocator initialization
+        happens before real traffic. Without model_value warms every loaded model;
+        notify() is called between models (gunicorn's worker heartbeat)."""
+        values = [model_value] if model_value else self.loaded_models()
+        for value in values:
+            model = self._models[value]
+            with self._lock:
+                loaded = self._loaded.get(value)
+            if loaded is None:
+                continue
+            start = time.time()
+            model["state"] = "warming"
+            texts = PARITY_TEXTS.get(model.get("from"), PARITY_TEXTS["en"])
+            pipe = loaded["pipe"]
+            try:
+                for _ in range(self.warmup_rounds):
+                    # One short input and one full batch, the two shapes that matter most
+                    for batch in (texts[:1], (texts * BATCH_MAX_SIZE)[:BATCH_MAX_SIZE]):
+                        inputs = pipe.tokenizer(batch, return_tensors="pt", padding=True, truncation=True)
+                        with torch.inference_mode():
+                            pipe.model.generate(**inputs, **generation_kwargs(pipe, None, inputs["input_ids"].shape[1]))
+            except Exception as e:
+                # Still usable, but not reported ready: /readyz keeps failing for it
+                print(f"Ошибка прогрева модели {value}: {str(e)}")
+                model["state"] = "loaded"
+            else:
+                loaded["warmup_seconds"] = time.time() - start
+                model["state"] = "ready"
+            if notify is not None:
+                notify()
+
+    def unload(self, model_value):
+        with self._lock:
+            loaded = self._loaded.pop(model_value, None)
+        if loaded is None:
+            return
+        self._models[model_value]["state"] = "unloaded"
+        # In-flight requests may still hold it; the last reference closes the batcher
+        del loaded
+        gc.collect()
+        print(f"Модель {model_value} выгружена")
+
+    def memory_mb(self):
+        # Tracked size of the loaded models, not process RSS: RSS includes pages shared
+        # with the gunicorn master and allocator caches that unloading doesn't return
+        with self._lock:
+            return sum(loaded["memory_mb"] for loaded in self._loaded.values())
+
+    def _evict(self, keep):
+        if not self.memory_budget_mb:
+            return
+        usage = self.memory_mb()
+        while usage > self.memory_budget_mb:
+            with self._lock:
+                victim = next((value for value in self._loaded if value != keep and value not in self._pinned), None)
+            if victim is None:
+                break
+            self.unload(victim)
+            previous, usage = usage, self.memory_mb()
+            if usage >= previous:
+                break
@@ -0,0 +1,104 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+# Лимит на клиента (API-ключ или IP) в входных токенах: скорость пополнения и размер «ведра».
+# RATE_LIMIT_TOKENS_PER_SECOND=0 отключает ограничение
+RATE_LIMIT_TOKENS_PER_SECOND = float(os.environ.get("RATE_LIMIT_TOKENS_PER_SECOND", 1000))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", 20000))
+# Buckets live in a memory-mapped file on tmpfs, shared by all workers on the host
+RATE_LIMIT_FILE = os.environ.get(
+    "RATE_LIMIT_FILE",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "translation-ratelimit"),
+)
+RATE_LIMIT_SLOTS = 4096
+# Linear probing distance; when all slots are taken the least recently used one is reused
+_PROBE = 8
+
+# key hash, tokens, last update
+_SLOT = struct.Struct("<Qdd")
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limit exceeded, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets weighted by input tokens, shared across processes.
+
+    A request costs its estimated input tokens; buckets refill at ``rate``
+    tokens per second up to ``burst``. A request larger than the burst is let
+    through when the bucket is full and leaves it in debt, so big documents are
+    still accepted but delay that client's next requests.
+    """
+
+    def __init__(self, rate=RATE_LIMIT_TOKENS_PER_SECOND, burst=RATE_LIMIT_BURST, path=RATE_LIMIT_FILE,
+                 slots=RATE_LIMIT_SLOTS):
+        self.rate = rate
+        self.burst = burst
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _open(self):
+        # flock is per open file, so every process needs its own descriptor
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * _SLOT.size
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+        self._pid = os.getpid()
+
+    def _slot(self, key_hash):
+        # Index of the key's slot (claimed if new); caller holds the locks
+        start = key_hash % self.slots
+        oldest, oldest_time = start, math.inf
+        for i in range(_PROBE):
+            index = (start + i) % self.slots
+            stored, tokens, updated = _SLOT.unpack_from(self._map, index * _SLOT.size)
+            if stored == key_hash:
+                return index
+            if stored == 0:
+                oldest = index
+                break
+            if updated < oldest_time:
+                oldest, oldest_time = index, updated
+        _SLOT.pack_into(self._map, oldest * _SLOT.size, key_hash, self.burst, time.time())
+        return oldest
+
+    def acquire(self, key, cost):
+        """Takes cost tokens from key's bucket or raises RateLimited."""
+        if not self.enabled:
+            return
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                index = self._slot(key_hash)
+                _, tokens, updated = _SLOT.unpack_from(self._map, index * _SLOT.size)
+                now = time.time()
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                if tokens >= cost or tokens >= self.burst:
+                    _SLOT.pack_into(self._map, index * _SLOT.size, key_hash, tokens - cost, now)
+                    return
+                _SLOT.pack_into(self._map, index * _SLOT.size, key_hash, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        raise RateLimited(max(1, math.ceil((min(cost, self.burst) - tokens) / self.rate)))
@@ -0,0 +1,192 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from batching import BULK, INTERACTIVE
+
+# Языки-посредники для пар без прямой модели (fr→en→de), в порядке предпочтения
+PIVOT_LANGUAGES = [lang.strip() for lang in os.environ.get("PIVOT_LANGUAGES", "en").split(",") if lang.strip()]
+PIVOT_MAX_HOPS = int(os.environ.get("PIVOT_MAX_HOPS", 2))
+# Потоки, передающие сегмент на следующий шаг цепочки: поток батчера предыдущей модели не блокируется
+PIVOT_HANDOFF_THREADS = int(os.environ.get("PIVOT_HANDOFF_THREADS", 4))
+
+_handoff = None
+_handoff_pid = None
+_handoff_lock = threading.Lock()
+
+
+def _handoff_executor():
+    # Threads do not survive fork, so every gunicorn worker creates its own pool
+    global _handoff, _handoff_pid
+    with _handoff_lock:
+        if _handoff_pid != os.getpid():
+            _handoff = ThreadPoolExecutor(PIVOT_HANDOFF_THREADS, thread_name_prefix="pivot-hop")
+            _handoff_pid = os.getpid()
+        return _handoff
+
+
+class PairRouter:
+    """Finds model chains for language pairs without a direct model.
+
+    The pair graph has one edge per MODEL_LIST entry. Among the shortest
+    routes, ones whose models are already loaded win (so a few resident models
+    cover many pairs), then routes through the preferred pivot languages.
+    """
+
+    def __init__(self, registry, cache=None, pivots=PIVOT_LANGUAGES, max_hops=PIVOT_MAX_HOPS):
+        self.registry = registry
+        self.cache = cache
+        self.pivots = pivots
+        self.max_hops = max_hops
+
+    def _edges(self):
+        edges = {}
+        for model in self.registry.model_list:
+            edges.setdefault(model["from"], []).append(model)
+        return edges
+
+    def _score(self, route):
+        unloaded = sum(not self.registry.is_loaded(model["value"]) for model in route)
+        pivots = [model["to"] for model in route[:-1]]
+        rank = sum(self.pivots.index(lang) if lang in self.pivots else len(self.pivots) for lang in pivots)
+        return len(route), unloaded, rank
+
+    def route(self, source, target):
+        """Returns the list of MODEL_LIST entries from source to target, or None."""
+        edges = self._edges()
+        routes = []
+        queue = deque([(source, [])])
+        while queue:
+            lang, path = queue.popleft()
+            if routes and len(path) >= len(routes[0]):
+                # Only routes of the shortest length are compared
+                break
+            if len(path) >= self.max_hops:
+                continue
+            for model in edges.get(lang, []):
+                if any(step["from"] == model["to"] for step in path) or model["to"] == source:
+                    continue
+                if model["to"] == target:
+                    routes.append(path + [model])
+                else:
+                    queue.append((model["to"], path + [model]))
+        return min(routes, key=self._score) if routes else None
+
+    def pairs(self):
+        """All (source, target) pairs reachable within max_hops: {pair: [model values]}."""
+        languages = {model["from"] for model in self.registry.model_list} | {model["to"] for model in self.registry.model_list}
+        pairs = {}
+        for source in sorted(languages):
+            for target in sorted(languages):
+                if source != target:
+                    route = self.route(source, target)
+                    if route:
+                        pairs[f"{source}-{target}"] = [model["value"] for model in route]
+        return pairs
+
+    def chain_model(self, route, store=True):
+        """A MODEL_LIST-like entry for a route, usable wherever a model entry is.
+
+        With store=False hop results are read from the cache but not written to it.
+        """
+        # Every hop is loaded here, in the request thread, not later in a batcher thread
+        models = [self.registry.get(model["value"]) for model in route]
+        if len(models) == 1:
+            return models[0]
+        return {
+            "name": " → ".join(model["name"] for model in route),
+            "value": "+".join(model["value"] for model in route),
+            "from": route[0]["from"],
+            "to": route[-1]["to"],
+            "via": [model["to"] for model in route[:-1]],
+            "route": [model["value"] for model in route],
+            "encoder": models[0].get("encoder"),
+            "batcher": ChainBatcher(self.registry, [model["value"] for model in route], self.cache, store),
+        }
+
+
+class ChainBatcher:
+    """Batcher interface over a chain of models: each hop goes through that
+    model's own batcher, and intermediate results are cached per hop.
+
+    submit() is pipelined: a segment moves to the next hop as soon as its
+    previous hop finishes, without tying up a thread while it waits.
+    """
+
+    def __init__(self, registry, model_values, cache=None, store=True):
+        self.registry = registry
+        self.model_values = model_values
+        self.cache = cache
+        self.store = store
+
+    def _cached(self, model_value, text, params):
+        return self.cache.get(model_value, text, params) if self.cache is not None else None
+
+    def _remember(self, model_value, text, translation, params):
+        if self.cache is not None and self.store:
+            self.cache.set(model_value, text, translation, params)
+
+    def submit(self, text, deadline=None, params=None, lane=INTERACTIVE):
+        future = Future()
+        self._hop(0, text, future, deadline, params, lane)
+        return future
+
+    def _hop(self, index, text, future, deadline, params, lane):
+        if index == len(self.model_values):
+            future.set_result(text)
+            return
+        model_value = self.model_values[index]
+        cached = self._cached(model_value, text, params)
+        if cached is not None:
+            self._hop(index + 1, cached, future, deadline, params, lane)
+            return
+        try:
+            # Models are looked up on every call: a hop model may have been evicted and reloaded
+            step = self.registry.get(model_value)["batcher"].submit(text, deadline, params, lane)
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        def next_hop(step):
+            try:
+                translation = step.result()
+            except Exception as e:
+                future.set_exception(e)
+                return
+            self._remember(model_value, text, translation, params)
+            self._hop(index + 1, translation, future, deadline, params, lane)
+
+        def done(step):
+            # Runs on the previous model's batcher thread: the next hop may load a model
+            # and the cache may write to disk, so both happen on a handoff thread
+            try:
+                _handoff_executor().submit(next_hop, step)
+            except RuntimeError as e:
+                future.set_exception(e)
+
+        step.add_done_callback(done)
+
+    def translate_batch(self, texts, deadline=None, params=None, lane=BULK):
+        # Hop by hop: every hop translates all still-valid items as one batched job
+        results = list(texts)
+        for model_value in self.model_values:
+            pending = {}
+            for i, text in enumerate(results):
+                if isinstance(text, Exception):
+                    continue
+                cached = self._cached(model_value, text, params) if isinstance(text, str) else None
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    pending.setdefault(text, []).append(i)
+            if not pending:
+                continue
+            unique = list(pending)
+            batcher = self.registry.get(model_value)["batcher"]
+            for text, translation in zip(unique, batcher.translate_batch(unique, deadline, params, lane)):
+                if not isinstance(translation, Exception):
+                    self._remember(model_value, text, translation, params)
+                for i in pending[text]:
+                    results[i] = translation
+        return results
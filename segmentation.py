@@ -0,0 +1,132 @@
+import os
+import re
+
+# Marian режет вход на 512 токенах; оставляем запас
+MAX_SEGMENT_TOKENS = int(os.environ.get("MAX_SEGMENT_TOKENS", 400))
+
+# Newline runs, then whitespace after sentence-ending punctuation (and closing quotes/brackets)
+_LINE = re.compile(r"(\s*\n\s*)")
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'»“”)\]]*(\s+)")
+# "3." (dates, ordinals) and short abbreviations ("z. B.", "Dr.") don't end a sentence; two-letter
+# ones must be capitalized, since lowercase words like "es." or "da." often do
+_ABBREVIATION = re.compile(r"(?:^|[\s(])(?:\d+|[^\W\d_]|[A-ZÄÖÜ][a-zäöüß])\.$")
+_CLAUSE = re.compile(r"(?<=[,;:])(\s+)")
+_WORD = re.compile(r"(\s+)")
+
+
+def estimate_tokens(text):
+    # Без токенизатора (модель в другом процессе) считаем с запасом: ~2 токена на слово
+    return 2 * len(text.split())
+
+
+def _token_counters(tokenizer):
+    # (count(text), count_many(texts)). tokenizer: anything with tokenize(text), e.g. the
+    # model's TokenCache. Lines and sentences are counted through it, since most become
+    # segments and are encoded later; the clauses and words of a long sentence are counted
+    # in one call with count(texts) if it has one, without filling its cache
+    if tokenizer is None:
+        return estimate_tokens, lambda texts: [estimate_tokens(text) for text in texts]
+    if hasattr(tokenizer, "count"):
+        count_many = tokenizer.count
+    else:
+        count_many = lambda texts: [len(tokenizer.tokenize(text)) for text in texts]  # noqa: E731
+    return (lambda text: len(tokenizer.tokenize(text))), count_many
+
+
+def _split_sentences(text):
+    # [sentence, whitespace, sentence, ...], like re.split with a capturing group
+    parts, start = [], 0
+    for match in _SENTENCE_END.finditer(text):
+        head = text[start:match.start(1)]
+        following = text[match.end():match.end() + 1]
+        if following.islower() or _ABBREVIATION.search(head):
+            continue
+        parts.extend([head, match.group(1)])
+        start = match.end()
+    parts.append(text[start:])
+    return parts
+
+
+def _split_long(sentence, count_many, max_tokens, tokens):
+    # tokens: the sentence's (estimated) token count
+    if tokens <= max_tokens:
+        return [(True, sentence)]
+    for pattern in (_CLAUSE, _WORD):
+        units = pattern.split(sentence)
+        if len(units) > 1:
+            break
+    else:
+        return [(True, sentence)]
+
+    # Жадно пакуем клаузы (или слова) в куски не длиннее max_tokens; все считаем одним вызовом
+    counts = count_many(units[0::2])
+    pieces = []
+    current, current_tokens = "", 0
+    for j in range(0, len(units), 2):
+        unit = units[j]
+        sep = units[j - 1] if j else ""
+        unit_tokens = counts[j // 2]
+        if current and current_tokens + unit_tokens > max_tokens:
+            pieces.extend(_split_long(current, count_many, max_tokens, current_tokens))
+            pieces.append((False, sep))
+            current, current_tokens = unit, unit_tokens
+        else:
+            current = current + sep + unit if current else unit
+            current_tokens += unit_tokens
+    if current:
+        pieces.extend(_split_long(current, count_many, max_tokens, current_tokens))
+    return pieces
+
+
+def split_text(text, tokenizer=None, max_tokens=MAX_SEGMENT_TOKENS, by_sentence=False):
+    """Splits text into lines, then lines over max_tokens into sentences and token-bounded chunks.
+
+    Returns a list of (is_segment, string) pieces; joining all strings gives
+    back the original text. Only segments need translating, the rest is the
+    original whitespace and newlines between them. Lines always split, so the
+    model never sees a newline; a line that fits stays one segment, since the
+    model translates a whole sentence better than its pieces. With by_sentence
+    every sentence is its own segment, so a stream can show the first one early.
+    """
+    counters = _token_counters(tokenizer)
+    pieces = []
+    _append(pieces, text, counters, max_tokens, (_LINE.split, _split_sentences), 2 if by_sentence else 1)
+    return pieces
+
+
+def _append(pieces, text, counters, max_tokens, splitters, forced):
+    # Splits text with the first splitter if it is one of the `forced` ones or the text
+    # is too long, and each part further as needed
+    stripped = text.strip()
+    if not stripped:
+        if text:
+            pieces.append((False, text))
+        return
+    start = text.find(stripped)
+    if start:
+        pieces.append((False, text[:start]))
+    count, count_many = counters
+    tokens = None if forced else count(stripped)
+    if tokens is not None and tokens <= max_tokens:
+        pieces.append((True, stripped))
+    elif not splitters:
+        pieces.extend(_split_long(stripped, count_many, max_tokens, tokens))
+    else:
+        parts = splitters[0](stripped)
+        for i, part in enumerate(parts):
+            if i % 2:
+                pieces.append((False, part))
+            else:
+                _append(pieces, part, counters, max_tokens, splitters[1:], max(forced - 1, 0))
+    if start + len(stripped) < len(text):
+        pieces.append((False, text[start + len(stripped):]))
+
+
+def segments(pieces):
+    return [piece for is_segment, piece in pieces if is_segment]
+
+
+def join_pieces(pieces, translations):
+    """Puts translations (one per segment, in order) back between the original whitespace."""
+    translations = iter(translations)
+    return "".join(next(translations) if is_segment else piece for is_segment, piece in pieces)
@@ -0,0 +1,143 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+# Одинаковые запросы, пришедшие одновременно (в этот воркер или в соседние), ждут одного вычисления
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT", "1") == "1"
+# Lock files on tmpfs: one per stripe of the key space, holding the stripe's last result
+SINGLE_FLIGHT_DIR = os.environ.get(
+    "SINGLE_FLIGHT_DIR",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "translation-singleflight"),
+)
+SINGLE_FLIGHT_STRIPES = int(os.environ.get("SINGLE_FLIGHT_STRIPES", 4096))
+# Ожидание блокировки соседнего процесса: первая пауза, дальше вдвое дольше, но не больше MAX
+SINGLE_FLIGHT_POLL_SECONDS = float(os.environ.get("SINGLE_FLIGHT_POLL_SECONDS", 0.002))
+SINGLE_FLIGHT_POLL_MAX_SECONDS = float(os.environ.get("SINGLE_FLIGHT_POLL_MAX_SECONDS", 0.05))
+
+
+class SingleFlight:
+    """Coalesces concurrent identical computations.
+
+    Within a process the first caller of a key computes and later callers wait
+    on its future. Across processes the computing caller holds an flock on the
+    key's stripe file, writes its key into it right away and the result before
+    unlocking; a process that found the lock taken reads the key without the
+    lock and waits only if it is its own (a different key means a stripe
+    collision, and it computes itself straight away). A waiter whose leader gave up on its own, shorter deadline
+    computes under its own deadline instead of failing with it.
+    """
+
+    def __init__(self, directory=SINGLE_FLIGHT_DIR, stripes=SINGLE_FLIGHT_STRIPES, enabled=SINGLE_FLIGHT_ENABLED):
+        self.directory = directory
+        self.stripes = stripes
+        self.enabled = enabled
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, compute, deadline=None):
+        """Returns (compute() or the result of an identical in-flight call, coalesced).
+
+        key is a hex digest (translation_cache.make_key); compute must return
+        something JSON-serializable.
+        """
+        if not self.enabled:
+            return compute(), False
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+            if leader:
+                break
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                value = future.result(timeout)
+            except TimeoutError:
+                if deadline is not None and time.time() >= deadline:
+                    raise
+                # The leader's deadline was shorter than ours: try again, as leader if need be
+                continue
+            metrics.COALESCED_REQUESTS.inc(scope="worker")
+            return value, True
+
+        try:
+            value, coalesced = self._run_shared(key, compute, deadline)
+        except BaseException as e:
+            # Removed before the waiters wake up, so a retrying waiter doesn't find it again
+            self._done(key)
+            future.set_exception(e)
+            raise
+        self._done(key)
+        future.set_result(value)
+        return value, coalesced
+
+    def _done(self, key):
+        with self._lock:
+            del self._inflight[key]
+
+    def _run_shared(self, key, compute, deadline):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{int(key[:12], 16) % self.stripes}.lock")
+        with open(path, "a+b") as f:
+            waited = False
+            delay = SINGLE_FLIGHT_POLL_SECONDS
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                    owner = self._owner(f)
+                    if owner is not None and owner != key:
+                        # Another key on this stripe: nothing to share, don't queue behind it
+                        return compute(), False
+                    # flock can't time out, so the wait is polled with a growing, bounded sleep
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("Deadline exceeded")
+                    time.sleep(delay if remaining is None else min(delay, remaining))
+                    delay = min(delay * 2, SINGLE_FLIGHT_POLL_MAX_SECONDS)
+            try:
+                if waited:
+                    value = self._read(f, key)
+                    if value is not None:
+                        metrics.COALESCED_REQUESTS.inc(scope="host")
+                        return value, True
+                # Marks the stripe as computing this key, for the processes that find it locked
+                self._write(f, {"key": key})
+                value = compute()
+                self._write(f, {"key": key, "value": value})
+                return value, False
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _entry(self, f):
+        f.seek(0)
+        try:
+            entry = json.loads(f.read() or b"{}")
+        except ValueError:
+            # Read while the owner was rewriting it
+            return None
+        return entry if isinstance(entry, dict) else None
+
+    def _owner(self, f):
+        # Key the stripe's lock holder is computing (read without the lock), None if unknown
+        entry = self._entry(f)
+        return entry.get("key") if entry else None
+
+    def _read(self, f, key):
+        entry = self._entry(f) or {}
+        return entry.get("value") if entry.get("key") == key else None
+
+    def _write(self, f, entry):
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        f.flush()
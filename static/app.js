@@ -0,0 +1,214 @@
+let startTime;
+let translationHistory = [];
+let historyChart;
+
+// Инициализация графика (static/chart.js, без внешних библиотек)
+function initChart() {
+    historyChart = new ScatterChart(document.getElementById('historyChart'), {
+        xLabel: 'Text Length (symbols)',
+        yLabel: 'Time per Symbol (seconds)',
+        color: 'rgba(75, 115, 255, 0.6)',
+        borderColor: 'rgba(75, 115, 255, 1)',
+        tooltip: point => `Length: ${point.x} symbols, Time/Symbol: ${point.y.toFixed(3)}s`
+    });
+}
+
+// Обновление графика
+function updateChart(textLength, timePerSymbol) {
+    translationHistory.push({
+        x: textLength,
+        y: timePerSymbol
+    });
+
+    historyChart.setData(translationHistory);
+}
+
+let lastTranslation = null;
+
+function translateText() {
+    const deText = document.getElementById('de-text').value;
+    if (!deText.trim()) return;
+
+    const select = document.getElementById('model-select');
+    const option = select.options[select.selectedIndex];
+    const fromLang = option.getAttribute('data-from');
+    const toLang = option.getAttribute('data-to');
+
+    startTime = Date.now();
+    let firstChunkTime = null;
+    document.getElementById('translation-time').innerText = '';
+
+    // Streamed translation: the output fills in sentence by sentence
+    fetch('/translate/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            text: deText,
+            source_language: fromLang,
+            target_language: toLang,
+            model: select.value
+        })
+    })
+    .then(async response => {
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error);
+        }
+        const output = document.getElementById('en-text');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let translatedText = '';
+        output.value = '';
+        while (true) {
+            const {done, value} = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, {stream: true});
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const chunk = JSON.parse(line);
+                if (chunk.error) throw new Error(chunk.error);
+                if (firstChunkTime === null) firstChunkTime = Date.now();
+                translatedText += chunk.text;
+                output.value = translatedText;
+            }
+        }
+        return translatedText;
+    })
+    .then(translatedText => {
+        const endTime = Date.now();
+        const seconds = ((endTime - startTime) / 1000).toFixed(2);
+        const inputSymbols = deText.length;
+        const outputSymbols = translatedText.length;
+        const timePerSymbol = seconds / outputSymbols;
+
+        const firstSeconds = ((firstChunkTime || endTime) - startTime) / 1000;
+        const timeInfo = `(${seconds}s | first: ${firstSeconds.toFixed(2)}s | ${timePerSymbol.toFixed(3)}s per symbol | ` +
+            `in: ${inputSymbols} symbols | out: ${outputSymbols} symbols)`;
+        document.getElementById('translation-time').innerText = timeInfo;
+
+        // Сохраняем данные последнего перевода
+        lastTranslation = {
+            model: document.getElementById('model-select').value,
+            input_text: deText,
+            translated_text: translatedText,
+            seconds: parseFloat(seconds),
+            time_per_symbol: timePerSymbol,
+            input_symbols: inputSymbols,
+            output_symbols: outputSymbols,
+            timestamp: new Date().toISOString()
+        };
+
+        updateChart(outputSymbols, timePerSymbol);
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('An error occurred during translation');
+        document.getElementById('translation-time').innerText = '';
+    });
+}
+
+function saveFeedback(isLike) {
+    if (!lastTranslation) {
+        alert('Please translate something first');
+        return;
+    }
+
+    const feedbackData = {
+        ...lastTranslation,
+        feedback: isLike ? 'like' : 'dislike'
+    };
+
+    fetch('/save_feedback', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(feedbackData)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            throw new Error(data.error);
+        }
+        alert(isLike ? 'Thanks for the like!' : 'Thanks for the feedback!');
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('Failed to save feedback');
+    });
+}
+
+// Добавляем обработчик события keydown для текстового поля
+document.getElementById('de-text').addEventListener('keydown', function(e) {
+    // Проверяем, была ли нажата клавиша Enter без Shift
+    if (e.key === 'Enter' && !e.shiftKey) {
+        e.preventDefault(); // Предотвращаем добавление новой строки
+        translateText(); // Вызываем функцию перевода
+    }
+});
+
+// Функция обновления системной информации
+function updateSystemInfo() {
+    fetch('/get_cpu_info')
+        .then(response => response.json())
+        .then(data => {
+            const systemInfo = document.getElementById('system-info');
+            systemInfo.textContent = `CPU: ${data.cpu_percent.toFixed(1)}% | RAM: ${data.memory_percent.toFixed(1)}%`;
+            document.title = `Translation App (CPU: ${data.cpu_percent.toFixed(1)}% | RAM: ${data.memory_percent.toFixed(1)}%)`;
+        })
+        .catch(error => console.error('Error:', error));
+}
+
+// Снимок обновляется сервером раз в секунду, чаще спрашивать незачем
+setInterval(updateSystemInfo, 1000);
+
+// Начальное обновление
+updateSystemInfo();
+
+// Обработчик клавиш
+document.addEventListener('keydown', function(e) {
+    if (lastTranslation) {
+        if (e.key === 'ArrowUp') {
+            e.preventDefault();
+            saveFeedback(true);
+        } else if (e.key === 'ArrowDown') {
+            e.preventDefault();
+            saveFeedback(false);
+        }
+    }
+});
+
+const COUNTRY_NAMES = {
+    'de': 'German (Deutschland)',
+    'en': 'English (United Kingdom)',
+    'fr': 'French (France)',
+    'ru': 'Russian (Россия)'
+};
+
+function updateLanguageLabels() {
+    const select = document.getElementById('model-select');
+    const option = select.options[select.selectedIndex];
+    const fromLang = option.getAttribute('data-from');
+    const toLang = option.getAttribute('data-to');
+
+    document.getElementById('from-label').textContent = COUNTRY_NAMES[fromLang];
+    document.getElementById('to-label').innerHTML =
+        `${COUNTRY_NAMES[toLang]} <span id="translation-time"></span>`;
+
+    // Update placeholders
+    document.getElementById('de-text').placeholder =
+        `Enter text in ${COUNTRY_NAMES[fromLang]}`;
+    document.getElementById('en-text').placeholder =
+        `Translation in ${COUNTRY_NAMES[toLang]}`;
+}
+
+// Initialize labels on page load
+document.addEventListener('DOMContentLoaded', function() {
+    updateLanguageLabels();
+    initChart();
+});
@@ -0,0 +1,156 @@
+// Minimal scatter chart on a canvas: axes with ticks, axis titles, hover tooltip.
+// Bundled with the app instead of Chart.js, so the UI works without internet access.
+class ScatterChart {
+    constructor(canvas, options) {
+        this.canvas = canvas;
+        this.options = Object.assign({
+            color: 'rgba(75, 115, 255, 0.6)',
+            borderColor: 'rgba(75, 115, 255, 1)',
+            pointRadius: 6,
+            hoverRadius: 8,
+            tooltip: point => `${point.x}, ${point.y}`
+        }, options);
+        this.data = [];
+        this.hover = null;
+        this.padding = {left: 70, right: 20, top: 20, bottom: 50};
+        canvas.addEventListener('mousemove', event => this.onMove(event));
+        canvas.addEventListener('mouseleave', () => { this.hover = null; this.draw(); });
+        window.addEventListener('resize', () => this.draw());
+        this.draw();
+    }
+
+    setData(points) {
+        this.data = points.slice();
+        this.draw();
+    }
+
+    // Round tick step (1, 2 or 5 times a power of ten) for about `count` ticks
+    static ticks(min, max, count) {
+        const span = max - min || Math.abs(max) || 1;
+        const raw = span / count;
+        const power = Math.pow(10, Math.floor(Math.log10(raw)));
+        const step = [1, 2, 5, 10].map(m => m * power).find(s => s >= raw);
+        const start = Math.floor(min / step) * step;
+        const end = Math.ceil(max / step) * step || step;
+        const ticks = [];
+        for (let value = start; value <= end + step / 2; value += step) {
+            ticks.push(Number(value.toPrecision(12)));
+        }
+        return ticks;
+    }
+
+    layout() {
+        const xs = this.data.map(p => p.x);
+        const ys = this.data.map(p => p.y);
+        const xTicks = ScatterChart.ticks(Math.min(0, ...xs), Math.max(1, ...xs), 8);
+        const yTicks = ScatterChart.ticks(Math.min(0, ...ys), Math.max(0, ...ys), 6);
+        const {left, right, top, bottom} = this.padding;
+        const width = this.width - left - right;
+        const height = this.height - top - bottom;
+        const [x0, x1] = [xTicks[0], xTicks[xTicks.length - 1]];
+        const [y0, y1] = [yTicks[0], yTicks[yTicks.length - 1]];
+        return {
+            xTicks, yTicks,
+            px: x => left + (x - x0) / (x1 - x0 || 1) * width,
+            py: y => top + height - (y - y0) / (y1 - y0 || 1) * height
+        };
+    }
+
+    draw() {
+        const canvas = this.canvas;
+        const ratio = window.devicePixelRatio || 1;
+        this.width = canvas.clientWidth;
+        this.height = canvas.clientHeight;
+        canvas.width = this.width * ratio;
+        canvas.height = this.height * ratio;
+        const ctx = canvas.getContext('2d');
+        ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+        ctx.clearRect(0, 0, this.width, this.height);
+
+        const {xTicks, yTicks, px, py} = this.layout();
+        const {left, right, top, bottom} = this.padding;
+        ctx.font = '12px Arial, sans-serif';
+        ctx.lineWidth = 1;
+
+        // Grid and tick labels
+        ctx.strokeStyle = 'rgba(0, 0, 0, 0.1)';
+        ctx.fillStyle = '#666';
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'top';
+        for (const tick of xTicks) {
+            ctx.beginPath();
+            ctx.moveTo(px(tick), top);
+            ctx.lineTo(px(tick), this.height - bottom);
+            ctx.stroke();
+            ctx.fillText(String(tick), px(tick), this.height - bottom + 6);
+        }
+        ctx.textAlign = 'right';
+        ctx.textBaseline = 'middle';
+        for (const tick of yTicks) {
+            ctx.beginPath();
+            ctx.moveTo(left, py(tick));
+            ctx.lineTo(this.width - right, py(tick));
+            ctx.stroke();
+            ctx.fillText(String(tick), left - 6, py(tick));
+        }
+
+        // Axis titles
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'bottom';
+        ctx.fillText(this.options.xLabel || '', left + (this.width - left - right) / 2, this.height - 4);
+        ctx.save();
+        ctx.translate(14, top + (this.height - top - bottom) / 2);
+        ctx.rotate(-Math.PI / 2);
+        ctx.textBaseline = 'middle';
+        ctx.fillText(this.options.yLabel || '', 0, 0);
+        ctx.restore();
+
+        // Points
+        ctx.fillStyle = this.options.color;
+        ctx.strokeStyle = this.options.borderColor;
+        this.data.forEach((point, i) => {
+            const radius = i === this.hover ? this.options.hoverRadius : this.options.pointRadius;
+            ctx.beginPath();
+            ctx.arc(px(point.x), py(point.y), radius, 0, 2 * Math.PI);
+            ctx.fill();
+            ctx.stroke();
+        });
+
+        if (this.hover !== null) {
+            this.drawTooltip(ctx, this.data[this.hover], px, py);
+        }
+    }
+
+    drawTooltip(ctx, point, px, py) {
+        const text = this.options.tooltip(point);
+        const width = ctx.measureText(text).width + 16;
+        const x = Math.min(px(point.x) + 10, this.width - width - 4);
+        const y = Math.max(py(point.y) - 34, 4);
+        ctx.fillStyle = 'rgba(0, 0, 0, 0.8)';
+        ctx.fillRect(x, y, width, 24);
+        ctx.fillStyle = 'white';
+        ctx.textAlign = 'left';
+        ctx.textBaseline = 'middle';
+        ctx.fillText(text, x + 8, y + 12);
+    }
+
+    onMove(event) {
+        const rect = this.canvas.getBoundingClientRect();
+        const mx = event.clientX - rect.left;
+        const my = event.clientY - rect.top;
+        const {px, py} = this.layout();
+        let hover = null;
+        let best = this.options.hoverRadius * this.options.hoverRadius;
+        this.data.forEach((point, i) => {
+            const distance = (px(point.x) - mx) ** 2 + (py(point.y) - my) ** 2;
+            if (distance <= best) {
+                best = distance;
+                hover = i;
+            }
+        });
+        if (hover !== this.hover) {
+            this.hover = hover;
+            this.draw();
+        }
+    }
+}
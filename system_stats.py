@@ -0,0 +1,130 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+import psutil
+
+import metrics
+
+# Один сэмплер на всю машину: воркер, захвативший лок, раз в STATS_INTERVAL пишет
+# снимок в STATS_FILE, остальные воркеры только читают файл
+STATS_FILE = os.environ.get("STATS_FILE", os.path.join(tempfile.gettempdir(), "translation-stats.json"))
+STATS_INTERVAL = float(os.environ.get("STATS_INTERVAL", 1.0))
+STATS_HISTORY = int(os.environ.get("STATS_HISTORY", 300))
+
+
+def _queue_depth():
+    snapshot = metrics.collect().get("translation_queue_depth")
+    return int(sum(snapshot["values"].values())) if snapshot else 0
+
+
+def _server_processes():
+    # Under gunicorn: the master and all its workers; otherwise just this process
+    current = psutil.Process()
+    try:
+        parent = current.parent()
+        if parent is not None and "gunicorn" in " ".join(parent.cmdline()):
+            return [parent] + parent.children()
+    except psutil.Error:
+        pass
+    return [current]
+
+
+class SystemSampler:
+    """Samples CPU, per-process RSS and queue depth into a ring buffer shared through a file."""
+
+    def __init__(self, path=STATS_FILE, interval=STATS_INTERVAL, history=STATS_HISTORY):
+        self.path = path
+        self.interval = interval
+        self.history_size = history
+        self._pid = None
+        self._lock = threading.Lock()
+        self._cached = (None, {})
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="stats-sampler", daemon=True).start()
+
+    def _run(self):
+        lock = open(self.path + ".lock", "a")
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Someone else is sampling; take over if that worker goes away
+                time.sleep(self.interval * 5)
+                continue
+            try:
+                self._lead()
+            except Exception as e:
+                print(f"Ошибка сбора статистики: {str(e)}")
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                time.sleep(self.interval)
+
+    def _lead(self):
+        ring = deque(self._read().get("history", []), maxlen=self.history_size)
+        processes = {}
+        psutil.cpu_percent(interval=None)
+        while True:
+            time.sleep(self.interval)
+            ring.append(self._sample(processes))
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"latest": ring[-1], "history": list(ring)}, f)
+            os.replace(tmp_path, self.path)
+
+    def _sample(self, processes):
+        workers = []
+        alive = set()
+        for process in _server_processes():
+            # Keep Process objects between samples so cpu_percent() measures the interval
+            process = processes.setdefault(process.pid, process)
+            alive.add(process.pid)
+            try:
+                workers.append({
+                    "pid": process.pid,
+                    "rss_mb": round(process.memory_info().rss / (1024 * 1024), 1),
+                    "cpu_percent": process.cpu_percent(interval=None),
+                })
+            except psutil.Error:
+                continue
+        for pid in list(processes):
+            if pid not in alive:
+                del processes[pid]
+        return {
+            "time": time.time(),
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": psutil.virtual_memory().percent,
+            "workers": workers,
+            "queue_depth": _queue_depth(),
+        }
+
+    def _read(self):
+        # Parse the file only when it has changed
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return {}
+        if self._cached[0] != mtime:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._cached = (mtime, json.load(f))
+            except (OSError, ValueError):
+                return self._cached[1]
+        return self._cached[1]
+
+    def snapshot(self):
+        self._ensure_started()
+        return self._read().get("latest")
+
+    def history(self):
+        self._ensure_started()
+        return self._read().get("history", [])
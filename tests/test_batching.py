@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+import batching
+from batching import BULK, INTERACTIVE, MicroBatcher, QueueFullError
+
+
+class StubTokenizer:
+    pad_token_id = 0
+
+    def __call__(self, texts, truncation=True):
+        return {"input_ids": [[1] * len(text.split()) + [2] for text in texts]}
+
+
+class StubPipe:
+    tokenizer = StubTokenizer()
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    # generate_batch blocks until the gate opens, so items pile up in the queue
+    opened = threading.Event()
+
+    def generate_batch(pipe, texts, name="", params=None, encoder=None):
+        opened.wait(5)
+        return [text.upper() for text in texts]
+
+    monkeypatch.setattr(batching, "generate_batch", generate_batch)
+    return opened
+
+
+def test_bulk_work_does_not_fill_the_interactive_queue(gate):
+    batcher = MicroBatcher(StubPipe(), max_wait_ms=0, queue_max=4, bulk_queue_max=8)
+    results = {}
+    job = threading.Thread(target=lambda: results.update(bulk=batcher.translate_batch([f"text {i}" for i in range(40)])))
+    job.start()
+    time.sleep(0.2)
+    # The job is throttled at its own cap instead of taking the interactive slots
+    assert batcher._depth[BULK] <= 8
+    futures = [batcher.submit(f"hello {i}", lane=INTERACTIVE) for i in range(4)]
+    with pytest.raises(QueueFullError):
+        batcher.submit("one too many", lane=INTERACTIVE)
+    gate.set()
+    assert [future.result(5) for future in futures] == [f"HELLO {i}" for i in range(4)]
+    job.join(5)
+    assert results["bulk"] == [f"TEXT {i}" for i in range(40)]
+
+
+def test_bulk_submit_times_out_waiting_for_room(gate):
+    batcher = MicroBatcher(StubPipe(), max_wait_ms=0, bulk_queue_max=1)
+    batcher.submit("first", lane=BULK)
+    time.sleep(0.1)  # taken by the loop, which blocks on the gate
+    batcher.submit("second", lane=BULK)
+    future = batcher.submit("third", deadline=time.time() + 0.1, lane=BULK)
+    with pytest.raises(TimeoutError):
+        future.result(1)
+    gate.set()
@@ -0,0 +1,44 @@
+import time
+
+from feedback_store import FeedbackStore
+from translation_memory import TranslationMemory
+
+
+def feedback(text, verdict, timestamp):
+    return {"model": "de-en", "input_text": text, "translated_text": text.upper(),
+            "feedback": verdict, "timestamp": timestamp}
+
+
+def test_compact_keeps_latest_feedback_per_translation(tmp_path):
+    store = FeedbackStore(tmp_path / "history.jsonl")
+    for timestamp, verdict in enumerate(["like", "dislike", "like"]):
+        store.append(feedback("Hallo", verdict, timestamp))
+    store.append(feedback("Welt", "like", 3))
+    store.compact()
+    items, total = store.read(0, 10)
+    assert total == 2
+    assert [(item["input_text"], item["timestamp"]) for item in items] == [("Hallo", 2), ("Welt", 3)]
+
+
+def test_translation_memory_rereads_after_compaction(tmp_path):
+    store = FeedbackStore(tmp_path / "history.jsonl")
+    store.append(feedback("Eins", "like", 0))
+    store.append(feedback("Eins", "like", 1))
+    memory = TranslationMemory(store, enabled=True)
+    assert memory.lookup("de-en", "Eins")[0] == "EINS"
+    # Compaction renumbers records, then a new one lands at the number memory has already seen
+    store.compact()
+    store.append(feedback("Zwei", "like", 2))
+    memory.refresh()
+    assert memory.lookup("de-en", "Zwei")[0] == "ZWEI"
+
+
+def test_compactor_compacts_once_enough_records_were_added(tmp_path):
+    store = FeedbackStore(tmp_path / "history.jsonl")
+    for timestamp in range(3):
+        store.append(feedback("Hallo", "like", timestamp))
+    store.ensure_compactor(interval=0.01, min_new=3)
+    end = time.time() + 2
+    while store.count() != 1 and time.time() < end:
+        time.sleep(0.01)
+    assert store.count() == 1
@@ -0,0 +1,71 @@
+import io
+import json
+
+from file_jobs import JobManager
+
+
+def test_malformed_jsonl_line_fails_only_that_unit(tmp_path, monkeypatch):
+    jobs = JobManager(lambda options, texts: [text.upper() for text in texts], directory=str(tmp_path))
+    # No runner thread: the test runs the job itself
+    monkeypatch.setattr(jobs, "ensure_started", lambda: None)
+    body = '{"text": "eins"}\n{broken\n{"text": "zwei"}\n'
+    state = jobs.create(io.BytesIO(body.encode("utf-8")), "input.jsonl", {})
+    jobs._run_pending()
+    state = jobs.get(state["id"])
+    assert state["status"] == "done"
+    assert (state["translated_units"], state["failed_units"]) == (2, 1)
+    assert state["errors"][0]["unit"] == 1
+    with open(jobs.output_path(state["id"]), encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert [json.loads(lines[0])["translated_text"], lines[1], json.loads(lines[2])["translated_text"]] == [
+        "EINS", "{broken", "ZWEI"]
+
+
+def test_retryable_error_resumes_from_checkpoint(tmp_path, monkeypatch):
+    calls = []
+
+    def translate(options, texts):
+        calls.append(texts)
+        if len(calls) == 2:
+            raise ConnectionError("Inference server unavailable")
+        return [text.upper() for text in texts]
+
+    jobs = JobManager(translate, directory=str(tmp_path), retry_errors=(ConnectionError,), chunk_units=1)
+    monkeypatch.setattr(jobs, "ensure_started", lambda: None)
+    state = jobs.create(io.BytesIO("eins\nzwei\n".encode("utf-8")), "input.txt", {})
+    jobs._run_pending()
+    state = jobs.get(state["id"])
+    assert (state["status"], state["done_units"], state["retry_error"]) == ("running", 1, "Inference server unavailable")
+
+    jobs._run_pending()
+    state = jobs.get(state["id"])
+    assert state["status"] == "done" and "retry_error" not in state
+    assert calls == [["eins"], ["zwei"], ["zwei"]]
+    with open(jobs.output_path(state["id"]), encoding="utf-8") as f:
+        assert f.read() == "EINS\nZWEI\n"
+
+
+def test_sweep_deletes_only_jobs_past_retention(tmp_path, monkeypatch):
+    jobs = JobManager(lambda options, texts: texts, directory=str(tmp_path), retention=60)
+    monkeypatch.setattr(jobs, "ensure_started", lambda: None)
+    old = jobs.create(io.BytesIO(b"eins\n"), "old.txt", {})
+    recent = jobs.create(io.BytesIO(b"zwei\n"), "recent.txt", {})
+    queued = jobs.create(io.BytesIO(b"drei\n"), "queued.txt", {})
+    for job in (old, recent):
+        jobs._process(job["id"])
+    state = jobs.get(old["id"])
+    state["finished"] -= 120
+    jobs._write_state(old["id"], state)
+    jobs._sweep()
+    assert jobs.get(old["id"]) is None
+    assert jobs.get(recent["id"])["status"] == "done"
+    assert jobs.get(queued["id"])["status"] == "queued"
+
+
+def test_cancelled_queued_job_without_units_is_cancelled(tmp_path, monkeypatch):
+    jobs = JobManager(lambda options, texts: texts, directory=str(tmp_path))
+    monkeypatch.setattr(jobs, "ensure_started", lambda: None)
+    state = jobs.create(io.BytesIO(b""), "empty.txt", {})
+    assert jobs.cancel(state["id"])["status"] == "cancelling"
+    jobs._run_pending()
+    assert jobs.get(state["id"])["status"] == "cancelled"
@@ -0,0 +1,70 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from batching import QueueFullError
+from inference_pool import InferenceClient, RemoteRegistry, _Handler, _Server
+
+
+class EchoBatcher:
+    def submit(self, text, deadline=None, params=None, lane=None):
+        future = Future()
+        future.set_result(text.upper())
+        return future
+
+    def translate_batch(self, texts, deadline=None, params=None, lane=None):
+        return [ValueError("Empty text") if not text else text.upper() for text in texts]
+
+
+class StubRegistry:
+    def get(self, model_value):
+        return {"batcher": EchoBatcher()} if model_value == "de-en" else None
+
+    def model_states(self):
+        return {"de-en": "ready"}
+
+
+@pytest.fixture
+def server_address(tmp_path):
+    # An inference server in this process, as one of run_server()'s children would run it
+    def start(queue_max=8):
+        address = str(tmp_path / f"inference-{queue_max}.sock")
+        server = _Server(address, _Handler)
+        server.registry = StubRegistry()
+        server.inflight = multiprocessing.Value("i", 0)
+        server.queue_max = queue_max
+        server.jobs = ThreadPoolExecutor(max_workers=2)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return address
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_remote_batcher_translates_through_the_socket(server_address):
+    registry = RemoteRegistry([{"value": "de-en"}], InferenceClient(server_address()))
+    batcher = registry.get("de-en")["batcher"]
+    assert batcher.submit("hallo").result(5) == "HALLO"
+    results = batcher.translate_batch(["eins", ""])
+    assert results[0] == "EINS" and isinstance(results[1], RuntimeError)
+    assert registry.model_states() == {"de-en": "ready"}
+
+
+def test_full_server_answers_busy(server_address):
+    client = InferenceClient(server_address(queue_max=0))
+    with pytest.raises(QueueFullError):
+        client.request({"op": "translate", "model": "de-en", "text": "hallo"}).result(5)
+
+
+def test_missing_server_is_a_connection_error(tmp_path):
+    client = InferenceClient(str(tmp_path / "missing.sock"))
+    with pytest.raises(ConnectionError):
+        client.request({"op": "health"})
+    registry = RemoteRegistry([{"value": "de-en"}], client)
+    assert registry.model_states() == {"de-en": "unavailable"}
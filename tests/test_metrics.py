@@ -0,0 +1,43 @@
+import json
+import os
+import signal
+
+import metrics
+
+
+def test_forked_child_starts_from_zero_with_free_locks(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    histogram = metrics.histogram("test_fork_seconds", "Test histogram")
+    histogram.observe(0.1)
+    # As if the parent's flusher was taking a snapshot at fork time
+    with histogram._lock:
+        pid = os.fork()
+        if pid == 0:
+            # A deadlocked child is killed instead of hanging the test
+            signal.alarm(5)
+            histogram.observe(0.2)
+            os._exit(0 if histogram.snapshot()["values"][0][1][-1] == 1 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def test_render_merges_process_dumps(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    requests = metrics.counter("test_requests_total", "Test counter", ("endpoint",))
+    latency = metrics.histogram("test_latency_seconds", "Test histogram", buckets=(0.1, 1))
+    depth = metrics.gauge("test_depth", "Test gauge")
+    requests.inc(endpoint="translate")
+    latency.observe(0.05)
+    latency.observe(0.5)
+    depth.set(3)
+    # A worker that has exited: its counters still count, its gauges don't
+    dead = {"test_requests_total": dict(requests.snapshot(), values=[[["translate"], 2]]),
+            "test_depth": dict(depth.snapshot(), values=[[[], 7]])}
+    with open(tmp_path / "metrics_999999999.json", "w", encoding="utf-8") as f:
+        json.dump(dead, f)
+    text = metrics.render()
+    assert 'test_requests_total{endpoint="translate"} 3' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 2' in text
+    assert 'test_latency_seconds_count 2' in text
+    assert "test_depth 3" in text
@@ -0,0 +1,26 @@
+import types
+
+import torch
+
+from model_registry import ModelRegistry, model_memory_mb
+
+
+def test_model_memory_counts_quantized_weights():
+    model = torch.nn.Sequential(torch.nn.Linear(1024, 1024), torch.nn.Linear(1024, 1024))
+    assert round(model_memory_mb(types.SimpleNamespace(model=model))) == 8
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    assert round(model_memory_mb(types.SimpleNamespace(model=quantized))) == 2
+
+
+def test_model_memory_is_unknown_without_a_torch_model():
+    assert model_memory_mb(types.SimpleNamespace(model=object())) is None
+
+
+def test_failed_warm_up_is_not_ready():
+    def tokenizer(*args, **kwargs):
+        raise RuntimeError("broken tokenizer")
+
+    registry = ModelRegistry([{"value": "m", "from": "de"}], warmup_rounds=1)
+    registry._loaded["m"] = {"pipe": types.SimpleNamespace(tokenizer=tokenizer)}
+    registry.warm_up("m")
+    assert registry.model_states() == {"m": "loaded"}
@@ -0,0 +1,36 @@
+import pytest
+
+from rate_limit import RateLimited, TokenBucketLimiter
+
+
+def make_limiter(tmp_path, rate=10, burst=100):
+    return TokenBucketLimiter(rate=rate, burst=burst, path=str(tmp_path / "buckets"))
+
+
+def test_bucket_empties_per_client(tmp_path):
+    limiter = make_limiter(tmp_path)
+    limiter.acquire("alice", 60)
+    with pytest.raises(RateLimited) as raised:
+        limiter.acquire("alice", 60)
+    # 20 of the missing tokens at 10 per second
+    assert raised.value.retry_after == 2
+    limiter.acquire("bob", 60)
+
+
+def test_request_over_the_burst_passes_once_and_leaves_debt(tmp_path):
+    limiter = make_limiter(tmp_path)
+    limiter.acquire("alice", 500)
+    with pytest.raises(RateLimited):
+        limiter.acquire("alice", 1)
+
+
+def test_buckets_are_shared_between_limiters_on_one_file(tmp_path):
+    make_limiter(tmp_path).acquire("alice", 100)
+    with pytest.raises(RateLimited):
+        make_limiter(tmp_path).acquire("alice", 50)
+
+
+def test_zero_rate_disables_the_limit(tmp_path):
+    limiter = make_limiter(tmp_path, rate=0)
+    for _ in range(3):
+        limiter.acquire("alice", 1000)
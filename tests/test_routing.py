@@ -0,0 +1,84 @@
+from concurrent.futures import Future
+
+from routing import ChainBatcher, PairRouter
+
+
+def model(source, target):
+    return {"name": f"{source}-{target}", "value": f"opus-mt-{source}-{target}", "from": source, "to": target}
+
+
+class HopBatcher:
+    """Appends the target language, so a chain's result shows every hop."""
+
+    def __init__(self, target, calls):
+        self.target = target
+        self.calls = calls
+
+    def submit(self, text, deadline=None, params=None, lane=None):
+        self.calls.append(text)
+        future = Future()
+        future.set_result(f"{text}>{self.target}")
+        return future
+
+    def translate_batch(self, texts, deadline=None, params=None, lane=None):
+        self.calls.extend(texts)
+        return [f"{text}>{self.target}" for text in texts]
+
+
+class StubRegistry:
+    def __init__(self, models, loaded=()):
+        self.model_list = models
+        self.loaded = set(loaded)
+        self.calls = []
+        self.models = {m["value"]: dict(m, batcher=HopBatcher(m["to"], self.calls)) for m in models}
+
+    def is_loaded(self, value):
+        return value in self.loaded
+
+    def get(self, value):
+        return self.models[value]
+
+
+class DictCache:
+    def __init__(self):
+        self.values = {}
+
+    def get(self, model_value, text, params=None):
+        return self.values.get((model_value, text))
+
+    def set(self, model_value, text, translation, params=None):
+        self.values[(model_value, text)] = translation
+
+
+def test_route_prefers_loaded_models_then_pivot_order():
+    models = [model("fr", "en"), model("en", "de"), model("fr", "es"), model("es", "de")]
+    router = PairRouter(StubRegistry(models), pivots=["en", "es"])
+    assert [m["value"] for m in router.route("fr", "de")] == ["opus-mt-fr-en", "opus-mt-en-de"]
+    router = PairRouter(StubRegistry(models, loaded={"opus-mt-fr-es", "opus-mt-es-de"}), pivots=["en", "es"])
+    assert [m["value"] for m in router.route("fr", "de")] == ["opus-mt-fr-es", "opus-mt-es-de"]
+
+
+def test_route_respects_max_hops():
+    models = [model("fr", "en"), model("en", "es"), model("es", "de")]
+    assert PairRouter(StubRegistry(models), max_hops=2).route("fr", "de") is None
+    assert len(PairRouter(StubRegistry(models), max_hops=3).route("fr", "de")) == 3
+
+
+def test_chain_translates_hop_by_hop_and_caches_each_hop():
+    registry = StubRegistry([model("fr", "en"), model("en", "de")])
+    cache = DictCache()
+    chain = PairRouter(registry, cache).chain_model(PairRouter(registry).route("fr", "de"))
+    assert chain["via"] == ["en"]
+    assert chain["batcher"].submit("bonjour").result(5) == "bonjour>en>de"
+    assert chain["batcher"].translate_batch(["bonjour", "salut"]) == ["bonjour>en>de", "salut>en>de"]
+    # "bonjour" came from the per-hop cache the second time
+    assert registry.calls == ["bonjour", "bonjour>en", "salut", "salut>en"]
+
+
+def test_chain_without_store_reads_but_does_not_write_the_cache():
+    registry = StubRegistry([model("fr", "en"), model("en", "de")])
+    cache = DictCache()
+    batcher = ChainBatcher(registry, ["opus-mt-fr-en", "opus-mt-en-de"], cache, store=False)
+    cache.set("opus-mt-fr-en", "bonjour", "hello")
+    assert batcher.translate_batch(["bonjour", "salut"]) == ["hello>de", "salut>en>de"]
+    assert list(cache.values) == [("opus-mt-fr-en", "bonjour")]
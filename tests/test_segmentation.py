@@ -0,0 +1,71 @@
+from segmentation import join_pieces, segments, split_text
+
+
+def test_text_that_fits_stays_one_segment():
+    text = "Hallo Welt. Am 3. Oktober."
+    assert split_text(text) == [(True, text)]
+
+
+def test_surrounding_whitespace_is_kept():
+    pieces = split_text("  Hallo\n\nWelt.  ")
+    assert pieces == [(False, "  "), (True, "Hallo"), (False, "\n\n"), (True, "Welt."), (False, "  ")]
+
+
+def test_short_text_still_splits_at_lines():
+    text = "Erster Absatz. Er hat zwei Sätze.\n\nZweiter Absatz mit einer Zeile.\nDritte Zeile."
+    pieces = split_text(text)
+    assert segments(pieces) == [
+        "Erster Absatz. Er hat zwei Sätze.",
+        "Zweiter Absatz mit einer Zeile.",
+        "Dritte Zeile.",
+    ]
+    assert join_pieces(pieces, segments(pieces)) == text
+
+
+def test_long_text_splits_at_sentence_ends_only():
+    text = ("Hallo Welt, wie geht es. Am 3. Oktober kommen wir zurück. Er kommt z. B. morgen. "
+            "Dr. Müller ist da! Wirklich? ja.")
+    pieces = split_text(text, max_tokens=12)
+    assert segments(pieces) == [
+        "Hallo Welt, wie geht es.",
+        "Am 3. Oktober kommen wir zurück.",
+        "Er kommt z. B. morgen.",
+        "Dr. Müller ist da!",
+        "Wirklich? ja.",
+    ]
+    assert join_pieces(pieces, segments(pieces)) == text
+
+
+def test_long_text_splits_at_lines_first():
+    text = "Erste Zeile. Noch ein Satz.\nZweite Zeile"
+    assert segments(split_text(text, max_tokens=8)) == ["Erste Zeile.", "Noch ein Satz.", "Zweite Zeile"]
+
+
+def test_by_sentence_splits_text_that_fits():
+    text = "Hallo Welt. Am 3. Oktober kommen wir zurück.\nWirklich?"
+    pieces = split_text(text, by_sentence=True)
+    assert segments(pieces) == ["Hallo Welt.", "Am 3. Oktober kommen wir zurück.", "Wirklich?"]
+    assert join_pieces(pieces, segments(pieces)) == text
+
+
+class CountingTokenizer:
+    # One token per word plus EOS, like the model tokenizers
+    def __init__(self):
+        self.calls = []
+
+    def tokenize(self, text):
+        self.calls.append(("tokenize", text))
+        return [0] * (len(text.split()) + 1)
+
+    def count(self, texts):
+        self.calls.append(("count", list(texts)))
+        return [len(text.split()) + 1 for text in texts]
+
+
+def test_long_sentence_fragments_are_counted_in_one_call():
+    tokenizer = CountingTokenizer()
+    text = "eins zwei drei vier fünf sechs sieben acht"
+    pieces = split_text(text, tokenizer, max_tokens=6)
+    assert segments(pieces) == ["eins zwei drei", "vier fünf sechs", "sieben acht"]
+    # Counted as a line, then as a sentence (a TokenCache hit), then its words in one call
+    assert tokenizer.calls == [("tokenize", text), ("tokenize", text), ("count", text.split())]
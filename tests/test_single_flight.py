@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+KEY = "0123456789abcdef0123456789abcdef01234567"
+
+
+def slow(deadline, value="done", seconds=0.2):
+    def compute():
+        time.sleep(min(seconds, max(0.0, deadline - time.time())))
+        if time.time() >= deadline:
+            raise TimeoutError("Deadline exceeded")
+        return value
+    return compute
+
+
+def test_waiters_share_the_leaders_result(tmp_path):
+    flight = SingleFlight(directory=str(tmp_path))
+    results = []
+    deadline = time.time() + 5
+    threads = [threading.Thread(target=lambda: results.append(flight.run(KEY, slow(deadline), deadline)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [("done", False), ("done", True), ("done", True)]
+
+
+def test_waiter_outlives_a_leader_with_a_shorter_deadline(tmp_path):
+    flight = SingleFlight(directory=str(tmp_path))
+    short = time.time() + 0.05
+    errors = []
+
+    def leader():
+        try:
+            flight.run(KEY, slow(short), short)
+        except TimeoutError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    time.sleep(0.01)
+    long = time.time() + 5
+    assert flight.run(KEY, slow(long), long) == ("done", False)
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_waiter_fails_at_its_own_deadline(tmp_path):
+    flight = SingleFlight(directory=str(tmp_path))
+    long = time.time() + 5
+    thread = threading.Thread(target=lambda: flight.run(KEY, slow(long, seconds=0.5), long))
+    thread.start()
+    time.sleep(0.01)
+    with pytest.raises(TimeoutError):
+        flight.run(KEY, slow(long), time.time() + 0.05)
+    thread.join()
+
+
+def test_other_key_on_the_same_stripe_does_not_wait(tmp_path):
+    flight = SingleFlight(directory=str(tmp_path), stripes=1)
+    long = time.time() + 5
+    thread = threading.Thread(target=lambda: flight.run(KEY, slow(long, seconds=0.5), long))
+    thread.start()
+    time.sleep(0.05)
+    start = time.time()
+    assert flight.run("f" + KEY[1:], lambda: "other", long) == ("other", False)
+    assert time.time() - start < 0.2
+    thread.join()
@@ -0,0 +1,51 @@
+import sqlite3
+
+from translation_cache import TranslationCache
+
+
+def test_normalized_hit_keeps_the_requests_whitespace():
+    cache = TranslationCache(db_path="")
+    cache.set("de-en", "Guten  Morgen", "Good morning")
+    assert cache.get("de-en", "Guten  Morgen") == "Good morning"
+    assert cache.get("de-en", "  Guten Morgen\n") == "  Good morning\n"
+
+
+def test_entries_are_kept_per_model_and_params():
+    cache = TranslationCache(db_path="")
+    cache.set("de-en", "Hallo", "Hello", {"num_beams": 1})
+    assert cache.get("de-en", "Hallo", {"num_beams": 4}) is None
+    assert cache.get("de-fr", "Hallo", {"num_beams": 1}) is None
+    assert cache.get("de-en", "Hallo", {"num_beams": 1}) == "Hello"
+
+
+def test_oldest_entries_are_evicted():
+    # Every set() stores an exact and a normalized key
+    cache = TranslationCache(max_entries=4, db_path="")
+    for text, translation in (("eins", "one"), ("zwei", "two"), ("drei", "three")):
+        cache.set("de-en", text, translation)
+    assert cache.get("de-en", "eins") is None
+    assert [cache.get("de-en", text) for text in ("zwei", "drei")] == ["two", "three"]
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = TranslationCache(ttl=-1, db_path=str(tmp_path / "cache.db"))
+    cache.set("de-en", "Hallo", "Hello")
+    assert cache.get("de-en", "Hallo") is None
+
+
+def test_sqlite_backend_is_shared_between_caches(tmp_path):
+    path = str(tmp_path / "cache.db")
+    TranslationCache(db_path=path).set("de-en", "Hallo", "Hello")
+    assert TranslationCache(db_path=path).get("de-en", "Hallo") == "Hello"
+
+
+def test_failed_purge_does_not_fail_the_write(tmp_path):
+    cache = TranslationCache(db_path=str(tmp_path / "cache.db"))
+
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    cache.backend.purge_expired = locked
+    cache._writes = 999
+    cache.set("de-en", "Hallo", "Hello")
+    assert cache.get("de-en", "Hallo") == "Hello"
@@ -0,0 +1,78 @@
+from translation_memory import TranslationMemory
+
+MODEL = "de-en"
+
+
+def make_memory(**kwargs):
+    memory = TranslationMemory(enabled=True, **kwargs)
+    memory.add(MODEL, "Der Server ist jetzt erreichbar und funktioniert ohne Probleme.",
+               "The server is now reachable and works without problems.")
+    memory.add(MODEL, "Die Lieferung kommt bis Freitag bei Ihnen an.",
+               "The delivery will reach you by Friday.", liked=True)
+    memory.add(MODEL, "Bestellung 1234 wurde am 12.05.2024 versendet.",
+               "Order 1234 was shipped on 12.05.2024.")
+    return memory
+
+
+def test_exact_match():
+    memory = make_memory()
+    assert memory.lookup(MODEL, "Die Lieferung kommt bis Freitag bei Ihnen an.") == (
+        "The delivery will reach you by Friday.", "exact")
+
+
+def test_placeholders_are_opt_in_and_only_from_liked_entries():
+    memory = make_memory()
+    memory.add(MODEL, "Es wurden 5 Dateien gelöscht.", "5 files were deleted.", liked=True)
+    assert memory.lookup(MODEL, "Es wurden 7 Dateien gelöscht.") == (None, None)
+    memory = make_memory(placeholders=True)
+    memory.add(MODEL, "Es wurden 5 Dateien gelöscht.", "5 files were deleted.", liked=True)
+    assert memory.lookup(MODEL, "Es wurden 7 Dateien gelöscht.") == ("7 files were deleted.", "placeholder")
+    # Model output is never a placeholder source
+    assert memory.lookup(MODEL, "Bestellung 98 wurde am 12.05.2024 versendet.") == (None, None)
+
+
+def test_placeholders_keep_the_plural_class_and_skip_formatted_numbers():
+    memory = TranslationMemory(enabled=True, placeholders=True)
+    memory.add(MODEL, "5 Dateien gelöscht", "5 файлов удалено", liked=True)
+    assert memory.lookup(MODEL, "2 Dateien gelöscht") == (None, None)
+    assert memory.lookup(MODEL, "1 Dateien gelöscht") == (None, None)
+    assert memory.lookup(MODEL, "6 Dateien gelöscht") == ("6 файлов удалено", "placeholder")
+    memory.add(MODEL, "Version 1,2 installiert", "Version 1.2 installed", liked=True)
+    assert memory.lookup(MODEL, "Version 3,4 installiert") == (None, None)
+
+
+def test_negation_is_not_served():
+    memory = make_memory()
+    text = "Der Server ist jetzt nicht erreichbar und funktioniert ohne Probleme."
+    assert memory.lookup(MODEL, text) == (None, None)
+
+
+def test_changed_word_is_not_served():
+    memory = make_memory()
+    assert memory.lookup(MODEL, "Die Lieferung kommt bis Montag bei Ihnen an.") == (None, None)
+
+
+def test_fuzzy_opt_in_uses_only_liked_entries():
+    memory = make_memory(fuzzy=True, threshold=0.9)
+    # Model output is never a fuzzy source, even with fuzzy matching enabled
+    text = "Der Server ist jetzt nicht erreichbar und funktioniert ohne Probleme."
+    assert memory.lookup(MODEL, text) == (None, None)
+    translation, kind = memory.lookup(MODEL, "Die Lieferung kommt bis Freitag bei Ihnen an!")
+    assert kind == "fuzzy"
+    assert translation == "The delivery will reach you by Friday!"
+
+
+def test_results_are_kept_per_generation_params():
+    memory = TranslationMemory(enabled=True)
+    fast, quality = {"num_beams": 1}, {"num_beams": 4, "early_stopping": True}
+    memory.add(MODEL, "Guten Morgen.", "Good morning.", params=fast)
+    assert memory.lookup(MODEL, "Guten Morgen.", quality) == (None, None)
+    assert memory.lookup(MODEL, "Guten Morgen.", dict(fast)) == ("Good morning.", "exact")
+
+
+def test_entry_cap_covers_all_generation_params():
+    memory = TranslationMemory(enabled=True, max_entries=2)
+    for beams in (1, 2, 3):
+        memory.add(MODEL, "Guten Morgen.", f"Good morning {beams}.", params={"num_beams": beams})
+    assert memory.lookup(MODEL, "Guten Morgen.", {"num_beams": 1}) == (None, None)
+    assert memory.lookup(MODEL, "Guten Morgen.", {"num_beams": 3}) == ("Good morning 3.", "exact")
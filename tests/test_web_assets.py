@@ -0,0 +1,42 @@
+import gzip
+
+import jinja2
+from flask import Flask, request
+
+from web_assets import AssetBundle
+
+app = Flask(__name__)
+
+
+def make_bundle(tmp_path):
+    static = tmp_path / "static"
+    static.mkdir()
+    (static / "app.js").write_text("console.log('hallo');\n" * 50)
+    env = jinja2.Environment(loader=jinja2.DictLoader({
+        "index.html": "{% for model in models %}<option>{{ model.name }}</option>{% endfor %}"
+                      "<script src=\"{{ asset_url('app.js') }}\"></script>",
+    }))
+    return AssetBundle(env, directory=str(static))
+
+
+def test_index_is_rendered_once_with_versioned_asset_urls(tmp_path):
+    bundle = make_bundle(tmp_path)
+    index = bundle.render_index([{"name": "Deutsch → English"}])
+    html = index.body.decode("utf-8")
+    assert "<option>Deutsch → English</option>" in html
+    assert f"/static/app.js?v={bundle.get('app.js').version}" in html
+
+
+def test_gzip_and_conditional_responses(tmp_path):
+    asset = make_bundle(tmp_path).get("app.js")
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = asset.response(request)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.get_data()) == asset.body
+    etag = response.headers["ETag"]
+    with app.test_request_context(headers={"Accept-Encoding": "gzip", "If-None-Match": etag}):
+        assert asset.response(request).status_code == 304
+    # The plain representation has an ETag of its own
+    with app.test_request_context(headers={"If-None-Match": etag}):
+        response = asset.response(request)
+    assert response.status_code == 200 and response.get_data() == asset.body
@@ -0,0 +1,49 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask
+
+import wire_format
+from wire_format import read_payload, respond
+
+app = Flask(__name__)
+
+
+def test_json_is_the_default_and_small_bodies_stay_uncompressed():
+    with app.test_request_context(headers={"Accept": "*/*", "Accept-Encoding": "gzip"}):
+        response = respond({"translated_text": "Hello", "time": 1})
+    assert response.content_type == "application/json"
+    assert "Content-Encoding" not in response.headers
+    assert json.loads(response.get_data()) == {"translated_text": "Hello", "time": 1}
+
+
+def test_large_bodies_are_gzipped_when_accepted(monkeypatch):
+    monkeypatch.setattr(wire_format, "zstandard", None)
+    payload = {"translated_text": "Hello " * 2000}
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        response = respond(payload)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.get_data())) == payload
+
+
+def test_msgpack_when_accepted_without_the_timestamp():
+    msgpack = pytest.importorskip("msgpack")
+    with app.test_request_context(headers={"Accept": "application/msgpack"}):
+        response = respond({"translated_text": "Hello", "time": 1})
+    assert response.content_type == "application/msgpack"
+    assert msgpack.unpackb(response.get_data(), raw=False) == {"translated_text": "Hello"}
+
+
+def test_msgpack_body_is_read():
+    msgpack = pytest.importorskip("msgpack")
+    body = msgpack.packb({"text": "Hallo"})
+    with app.test_request_context(method="POST", data=body, content_type="application/msgpack"):
+        assert read_payload() == {"text": "Hallo"}
+
+
+def test_silent_parse_failure_is_not_cached():
+    with app.test_request_context(method="POST", data="{broken", content_type="application/json"):
+        assert read_payload(silent=True) is None
+        with pytest.raises(Exception):
+            read_payload()
@@ -0,0 +1,84 @@
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+
+import metrics
+
+# Кэш токенизированных сегментов на модель: повторные строки не проходят через токенизатор
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 20000))
+
+
+class TokenCache:
+    """LRU cache of encoded segments in front of a tokenizer.
+
+    encode_batch() returns padded input_ids/attention_mask tensors ready for
+    model.generate(); only segments not seen before go through the tokenizer,
+    in one call. tokenize() and count() make it usable as the token counter in
+    segmentation.split_text, so segments counted there are encoded only once.
+    """
+
+    def __init__(self, tokenizer, max_entries=TOKEN_CACHE_SIZE, name=""):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, texts):
+        found = {}
+        with self._lock:
+            for text in texts:
+                ids = self._entries.get(text)
+                if ids is not None:
+                    self._entries.move_to_end(text)
+                    found[text] = ids
+        return found
+
+    def encode(self, texts):
+        """Returns the list of token ids (with EOS, truncated to the model maximum) per text."""
+        found = self._lookup(texts)
+        missing = list(dict.fromkeys(text for text in texts if text not in found))
+        if found:
+            metrics.TOKEN_CACHE_LOOKUPS.inc(len(texts) - len(missing), result="hit", model=self.name)
+        if missing:
+            metrics.TOKEN_CACHE_LOOKUPS.inc(len(missing), result="miss", model=self.name)
+            encoded = self.tokenizer(missing, truncation=True)["input_ids"]
+            with self._lock:
+                for text, ids in zip(missing, encoded):
+                    found[text] = ids
+                    if self.max_entries:
+                        self._entries[text] = ids
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return [found[text] for text in texts]
+
+    def tokenize(self, text):
+        return self.encode([text])[0]
+
+    def count(self, texts):
+        """Token counts per text in one tokenizer call; unlike encode() nothing is
+        added to the cache, so fragments counted while splitting don't evict segments."""
+        found = self._lookup(texts)
+        missing = list(dict.fromkeys(text for text in texts if text not in found))
+        if missing:
+            for text, ids in zip(missing, self.tokenizer(missing, truncation=True)["input_ids"]):
+                found[text] = ids
+        return [len(found[text]) for text in texts]
+
+    def encode_batch(self, texts):
+        ids = self.encode(texts)
+        length = max(len(item) for item in ids)
+        pad_id = self.tokenizer.pad_token_id or 0
+        input_ids = torch.full((len(ids), length), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(ids), length), dtype=torch.long)
+        left = getattr(self.tokenizer, "padding_side", "right") == "left"
+        for row, item in enumerate(ids):
+            if left:
+                input_ids[row, length - len(item):] = torch.tensor(item)
+                attention_mask[row, length - len(item):] = 1
+            else:
+                input_ids[row, :len(item)] = torch.tensor(item)
+                attention_mask[row, :len(item)] = 1
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Кэш переводов: в памяти процесса и (опционально) общий SQLite для всех воркеров
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 10000))
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 24 * 3600))
+CACHE_DB = os.environ.get("TRANSLATION_CACHE_DB", "")
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def params_key(params):
+    return json.dumps(params or {}, sort_keys=True)
+
+
+def make_key(model_value, text, params=None, normalized=False):
+    if normalized:
+        text = normalize_text(text)
+    raw = json.dumps([model_value, text, params or {}, normalized], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SQLiteCacheBackend:
+    """Cache shared by all workers on the host through a local SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+        )
+
+    def _connect(self):
+        # One connection per thread and per process (connections don't survive fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value, expires FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def set(self, key, value, ttl):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl),
+        )
+
+    def purge_expired(self):
+        self._connect().execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+
+
+class TranslationCache:
+    """LRU/TTL translation cache keyed on model, source text and generation params.
+
+    Lookups try the exact text first and then the whitespace-normalized text;
+    a normalized hit keeps the request's own leading/trailing whitespace.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS, db_path=CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.backend = SQLiteCacheBackend(db_path) if db_path else None
+        self._writes = 0
+
+    def _get_key(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires >= now:
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+        if self.backend is not None:
+            try:
+                value = self.backend.get(key)
+            except sqlite3.Error as e:
+                print(f"Ошибка чтения кэша: {str(e)}")
+                return None
+            if value is not None:
+                self._set_local(key, value)
+                return value
+        return None
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, model_value, text, params=None):
+        value = self._get_key(make_key(model_value, text, params))
+        if value is None:
+            value = self._get_key(make_key(model_value, text, params, normalized=True))
+            if value is not None:
+                stripped = text.strip()
+                start = text.find(stripped)
+                value = text[:start] + value.strip() + text[start + len(stripped):]
+        metrics.CACHE_LOOKUPS.inc(result="miss" if value is None else "hit")
+        return value
+
+    def set(self, model_value, text, translation, params=None):
+        keys = [
+            make_key(model_value, text, params),
+            make_key(model_value, text, params, normalized=True),
+        ]
+        for key in keys:
+            self._set_local(key, translation)
+            if self.backend is not None:
+                try:
+                    self.backend.set(key, translation, self.ttl)
+                except sqlite3.Error as e:
+                    print(f"Ошибка записи в кэш: {str(e)}")
+        self._writes += 1
+        if self.backend is not None and self._writes % 1000 == 0:
+            try:
+                self.backend.purge_expired()
+            except sqlite3.Error as e:
+                print(f"Ошибка очистки кэша: {str(e)}")
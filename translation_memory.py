@@ -0,0 +1,283 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from difflib import SequenceMatcher
+
+import metrics
+from segmentation import split_text, segments
+from translation_cache import normalize_text, params_key
+
+# Память переводов: понравившиеся переводы из истории отзывов и прошлые результаты модели.
+# Точные совпадения отдаются без инференса
+TM_ENABLED = os.environ.get("TM_ENABLED", "1") == "1"
+# Placeholder matches reuse a translation for other numbers/URLs, which can still be wrong
+# (an inflected noun, a number format), so they are opt-in and only come from liked feedback
+TM_PLACEHOLDERS = os.environ.get("TM_PLACEHOLDERS", "0") == "1"
+# Fuzzy matches return the translation of a *different* sentence ("nicht", another
+# weekday, ...), so they are opt-in and only ever come from liked feedback
+TM_FUZZY = os.environ.get("TM_FUZZY", "0") == "1"
+TM_THRESHOLD = float(os.environ.get("TM_THRESHOLD", 0.92))
+TM_MAX_ENTRIES = int(os.environ.get("TM_MAX_ENTRIES", 50000))
+TM_REFRESH_SECONDS = float(os.environ.get("TM_REFRESH_SECONDS", 5))
+# Fuzzy candidates checked with the edit-distance ratio per lookup
+TM_CANDIDATES = 3
+# Words that occur in more entries than this are not used to find candidates
+TM_MAX_POSTINGS = 2000
+
+# URLs, e-mail addresses and plain integers are carried over verbatim from source to translation.
+# Decimals, dates and times ("1,2", "12.05.2024", "10:30") are formatted per language, so
+# they stay part of the text and only ever match exactly
+_PLACEHOLDER = re.compile(r"https?://\S+|[\w.+-]+@[\w-]+\.[\w.]+|(?<![\w.,:])\d+(?![\w]|[.,:]\d)")
+_END_PUNCTUATION = re.compile(r"[.!?…:;]+$")
+_WORD = re.compile(r"\w+|\x00")
+
+
+def mask(text):
+    """Returns (template, values): placeholders replaced with \\x00, values in order."""
+    values = _PLACEHOLDER.findall(text)
+    return _PLACEHOLDER.sub("\x00", normalize_text(text)), values
+
+
+def _words(template):
+    return frozenset(_WORD.findall(template.lower()))
+
+
+def _plural_class(value):
+    # Integers in one class take the same noun form in English, German, French and the
+    # Slavic languages ("1 file", "2 файла", "5 файлов", "21 файл", "22 soubory")
+    if not value.isdigit():
+        return None
+    n = int(value)
+    if n % 10 == 1 and n % 100 != 11:
+        slavic = "one"
+    elif 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        slavic = "few"
+    else:
+        slavic = "many"
+    # 0, 1, 2-4 and 5+ differ in English/French (0 and 1) and Czech (2-4 vs 22)
+    size = n if n < 2 else 2 if n < 5 else 5
+    return size, slavic
+
+
+def _substitute(translation, old_values, new_values):
+    # Every old value has to appear in the translation exactly once to be replaced safely
+    if len(old_values) != len(new_values):
+        return None
+    if old_values == new_values:
+        return translation
+    if any(_plural_class(old) != _plural_class(new) for old, new in zip(old_values, new_values)):
+        return None
+    matches = list(_PLACEHOLDER.finditer(translation))
+    found = [m.group() for m in matches]
+    if sorted(found) != sorted(old_values) or len(set(old_values)) != len(old_values):
+        return None
+    replacement = dict(zip(old_values, new_values))
+    return _PLACEHOLDER.sub(lambda m: replacement[m.group()], translation)
+
+
+def _fix_punctuation(translation, old_source, new_source):
+    # "Datei gespeichert." vs "Datei gespeichert!" — carry the new ending over
+    old_end = _END_PUNCTUATION.search(old_source.rstrip())
+    new_end = _END_PUNCTUATION.search(new_source.rstrip())
+    old_end = old_end.group() if old_end else ""
+    new_end = new_end.group() if new_end else ""
+    if old_end == new_end:
+        return translation
+    stripped = translation.rstrip()
+    if old_end and stripped.endswith(old_end):
+        stripped = stripped[:-len(old_end)]
+    elif old_end:
+        return translation
+    return stripped + new_end + translation[len(translation.rstrip()):]
+
+
+class _Entry:
+    __slots__ = ("source", "template", "values", "translation", "words", "liked", "key")
+
+    def __init__(self, source, translation, liked, params=None):
+        self.source = normalize_text(source)
+        self.template, self.values = mask(source)
+        self.translation = translation
+        self.words = _words(self.template)
+        self.liked = liked
+        # Generation params the translation was made with, and the template
+        self.key = (params_key(params), self.template)
+
+
+class _ModelMemory:
+    """Entries of one model: exact template lookup plus an inverted word index.
+
+    Entries are keyed by (params key, template), so all generation params of
+    the model share one LRU and one max_entries cap.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (params key, template) -> _Entry, LRU order
+        self.postings = {}  # word -> set of entry keys
+
+    def add(self, entry):
+        current = self.entries.get(entry.key)
+        if current is not None:
+            # Liked translations are not replaced by plain model output
+            if current.liked and not entry.liked:
+                self.entries.move_to_end(entry.key)
+                return
+            self._remove(entry.key)
+        self.entries[entry.key] = entry
+        for word in entry.words:
+            self.postings.setdefault(word, set()).add(entry.key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        for word in entry.words:
+            bucket = self.postings.get(word)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.postings[word]
+
+    def best(self, template, params, threshold, fuzzy=False):
+        # (entry, similarity) of the closest template made with the same params, or (None, 0.0);
+        # with fuzzy=False only the exact template, with fuzzy=True also near duplicates among liked entries
+        pkey = params_key(params)
+        entry = self.entries.get((pkey, template))
+        if entry is not None:
+            self.entries.move_to_end(entry.key)
+            return entry, 1.0
+        if not fuzzy:
+            return None, 0.0
+
+        # A near duplicate differs in only a few words, so it shares at least one of
+        # the query's rarest words; candidates are ranked by shared words and only
+        # the top few are compared by edit distance
+        words = sorted(_words(template), key=lambda word: len(self.postings.get(word, ())))
+        prefix = math.ceil(len(words) * (1 - threshold) * 2) + 1
+        shared = Counter()
+        for word in words[:prefix]:
+            postings = self.postings.get(word, ())
+            if len(postings) > TM_MAX_POSTINGS:
+                # Only stop-word-like words left: not selective enough to be worth scanning
+                break
+            shared.update(postings)
+        best, best_ratio = None, 0.0
+        liked = Counter({candidate: count for candidate, count in shared.items()
+                         if candidate[0] == pkey and self.entries[candidate].liked})
+        for candidate, _ in liked.most_common(TM_CANDIDATES):
+            matcher = SequenceMatcher(None, template, candidate[1], autojunk=False)
+            if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio = self.entries[candidate], ratio
+        if best is not None and best_ratio >= threshold:
+            self.entries.move_to_end(best.key)
+            return best, best_ratio
+        return None, best_ratio
+
+
+class TranslationMemory:
+    """Translation memory over liked feedback and earlier model results.
+
+    lookup() returns a translation for a segment when a stored source matches
+    exactly. With placeholders=True a liked entry that differs only in
+    integers (of the same plural class), URLs or e-mails matches too, with the
+    values substituted; with fuzzy=True a liked entry at least ``threshold``
+    similar by edit distance matches as well. Liked feedback is picked up from the feedback log,
+    also when another worker wrote it.
+    """
+
+    def __init__(self, feedback_store=None, threshold=TM_THRESHOLD, max_entries=TM_MAX_ENTRIES,
+                 enabled=TM_ENABLED, fuzzy=TM_FUZZY, placeholders=TM_PLACEHOLDERS):
+        self.feedback_store = feedback_store
+        self.fuzzy = fuzzy
+        self.placeholders = placeholders
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._models = {}
+        self._lock = threading.Lock()
+        self._feedback_generation = 0
+        self._feedback_seen = 0
+        self._refreshed = 0.0
+        self.refresh()
+
+    def _memory(self, model_value):
+        memory = self._models.get(model_value)
+        if memory is None:
+            memory = self._models[model_value] = _ModelMemory(self.max_entries)
+        return memory
+
+    def add(self, model_value, source, translation, liked=False, params=None):
+        # params: the generation options the translation was made with; it is only
+        # served to requests with the same options (greedy output is no beam result)
+        if not self.enabled or not source.strip() or not translation.strip():
+            return
+        entry = _Entry(source.strip(), translation.strip(), liked, params)
+        with self._lock:
+            self._memory(model_value).add(entry)
+
+    def add_feedback(self, item):
+        # Liked translations are added as a whole and, for texts long enough to be split, per segment
+        # when the segment counts match
+        if not isinstance(item, dict) or item.get("feedback") != "like":
+            return
+        model_value, source, translation = item.get("model"), item.get("input_text"), item.get("translated_text")
+        if not model_value or not isinstance(source, str) or not isinstance(translation, str):
+            return
+        params = item.get("params") if isinstance(item.get("params"), dict) else None
+        self.add(model_value, source, translation, liked=True, params=params)
+        source_segments = segments(split_text(source))
+        target_segments = segments(split_text(translation))
+        if len(source_segments) > 1 and len(source_segments) == len(target_segments):
+            for segment, translated in zip(source_segments, target_segments):
+                self.add(model_value, segment, translated, liked=True, params=params)
+
+    def refresh(self):
+        # Reads feedback records appended since the last refresh (by any worker)
+        if not self.enabled or self.feedback_store is None:
+            return
+        self._refreshed = time.time()
+        try:
+            # After a compaction (new generation) everything is re-read; adding an entry twice is harmless
+            items, generation, total = self.feedback_store.read_new(self._feedback_generation, self._feedback_seen)
+        except Exception as e:
+            print(f"Ошибка загрузки памяти переводов: {str(e)}")
+            return
+        for item in items:
+            self.add_feedback(item)
+        self._feedback_generation, self._feedback_seen = generation, total
+
+    def lookup(self, model_value, text, params=None):
+        """Returns (translation, kind) with kind "exact", "placeholder" or "fuzzy", or (None, None).
+
+        Only translations made with the same generation params are considered.
+        """
+        if not self.enabled or not text.strip():
+            return None, None
+        if time.time() - self._refreshed > TM_REFRESH_SECONDS:
+            self.refresh()
+        template, values = mask(text)
+        with self._lock:
+            memory = self._models.get(model_value)
+            entry, ratio = memory.best(template, params, self.threshold, self.fuzzy) if memory else (None, 0.0)
+        translation = kind = None
+        if entry is not None and (entry.values == values or self.placeholders and entry.liked):
+            translation = _substitute(entry.translation, entry.values, values)
+        if translation is not None:
+            if ratio < 1.0:
+                kind = "fuzzy"
+                translation = _fix_punctuation(translation, entry.source, text)
+            else:
+                kind = "exact" if entry.values == values else "placeholder"
+            # Keep the request's own surrounding whitespace
+            stripped = text.strip()
+            start = text.find(stripped)
+            translation = text[:start] + translation + text[start + len(stripped):]
+        metrics.TM_LOOKUPS.inc(result=kind or "miss")
+        return translation, kind
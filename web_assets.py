@@ -0,0 +1,73 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response
+
+# Веб-интерфейс: шаблон и статика рендерятся и сжимаются один раз при старте процесса
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# Asset URLs carry a content hash, so they can be cached for good
+STATIC_CACHE_CONTROL = os.environ.get("STATIC_CACHE_CONTROL", "public, max-age=31536000, immutable")
+# The page itself is revalidated with its ETag on every load (a 304 while it hasn't changed)
+INDEX_CACHE_CONTROL = os.environ.get("INDEX_CACHE_CONTROL", "no-cache")
+
+
+class Asset:
+    """A response body kept in memory together with its gzip version and ETag."""
+
+    def __init__(self, body, mimetype, cache_control):
+        self.body = body
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.version = hashlib.blake2b(body, digest_size=8).hexdigest()
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        self.gzipped = compressed if len(compressed) < len(body) else None
+
+    def response(self, request):
+        gzipped = self.gzipped is not None and request.accept_encodings["gzip"] > 0
+        # Each encoding is a different representation, so it gets its own ETag
+        etag = f"{self.version}-gz" if gzipped else self.version
+        headers = {"Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if request.if_none_match.contains(etag):
+            response = Response(status=304, headers=headers)
+        else:
+            response = Response(self.gzipped if gzipped else self.body, content_type=self.mimetype, headers=headers)
+            if gzipped:
+                response.headers["Content-Encoding"] = "gzip"
+        response.set_etag(etag)
+        return response
+
+
+class AssetBundle:
+    """Static files and the pre-rendered index page, served from memory.
+
+    Nothing is read, rendered or compressed per request: a page load is a
+    lookup plus, for a repeat visit, a 304.
+    """
+
+    def __init__(self, jinja_env, directory=STATIC_DIR):
+        self.jinja_env = jinja_env
+        self.assets = {}
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, directory).replace(os.sep, "/")
+                mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                if mimetype.startswith("text/") or mimetype == "application/javascript":
+                    mimetype += "; charset=utf-8"
+                with open(path, "rb") as f:
+                    self.assets[name] = Asset(f.read(), mimetype, STATIC_CACHE_CONTROL)
+        self.index = None
+
+    def url(self, name):
+        return f"/static/{name}?v={self.assets[name].version}"
+
+    def get(self, name):
+        return self.assets.get(name)
+
+    def render_index(self, models):
+        """Renders templates/index.html for the given MODEL_LIST; call again when the list changes."""
+        html = self.jinja_env.get_template("index.html").render(models=models, asset_url=self.url)
+        self.index = Asset(html.encode("utf-8"), "text/html; charset=utf-8", INDEX_CACHE_CONTROL)
+        return self.index
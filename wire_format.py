@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+import threading
+
+from flask import Response, g, request
+
+# Необязательные зависимости: без них доступны только JSON и gzip
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Ответы больше этого размера сжимаются (zstd, если клиент его принимает, иначе gzip)
+WIRE_COMPRESS_MIN_BYTES = int(os.environ.get("WIRE_COMPRESS_MIN_BYTES", 4096))
+WIRE_GZIP_LEVEL = int(os.environ.get("WIRE_GZIP_LEVEL", 5))
+WIRE_ZSTD_LEVEL = int(os.environ.get("WIRE_ZSTD_LEVEL", 3))
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# ZstdCompressor objects must not be shared between threads
+_local = threading.local()
+
+
+def _zstd_compress(body):
+    compressor = getattr(_local, "zstd", None)
+    if compressor is None:
+        compressor = _local.zstd = zstandard.ZstdCompressor(level=WIRE_ZSTD_LEVEL)
+    return compressor.compress(body)
+
+
+def read_payload(silent=False):
+    """Request body as a dict: MessagePack when Content-Type says so, JSON otherwise.
+
+    Parsed once per request; with silent=True a malformed body gives None, and a
+    later strict read still reports the parse error.
+    """
+    if "wire_payload" in g:
+        return g.wire_payload
+    if request.mimetype in MSGPACK_TYPES:
+        try:
+            if msgpack is None:
+                raise ValueError("MessagePack is not supported by this server")
+            payload = msgpack.unpackb(request.get_data(), raw=False)
+        except Exception as e:
+            if silent:
+                return None
+            raise ValueError(f"Invalid MessagePack body: {str(e) or type(e).__name__}")
+    else:
+        payload = request.get_json(silent=silent)
+        if payload is None and silent:
+            return None
+    g.wire_payload = payload
+    return payload
+
+
+def _wants_msgpack():
+    if msgpack is None:
+        return False
+    accept = request.headers.get("Accept", "")
+    # Cheap checks first: this runs on every response of the hot endpoints
+    if "msgpack" not in accept:
+        return False
+    if accept in MSGPACK_TYPES:
+        return True
+    # JSON stays the default for "*/*" and for clients that don't send Accept
+    best = request.accept_mimetypes.best_match(("application/json",) + MSGPACK_TYPES)
+    return best in MSGPACK_TYPES
+
+
+def respond(payload, status=200, headers=None):
+    """Encodes payload as JSON or MessagePack per Accept, compressed per Accept-Encoding.
+
+    MessagePack responses leave out the "time" timestamp, which JSON responses
+    keep only for compatibility.
+    """
+    if _wants_msgpack():
+        body = msgpack.packb({key: value for key, value in payload.items() if key != "time"}, use_bin_type=True)
+        content_type = "application/msgpack"
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        content_type = "application/json"
+
+    response = Response(body, status=status, content_type=content_type, headers=headers)
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    if len(body) >= WIRE_COMPRESS_MIN_BYTES:
+        encodings = request.accept_encodings
+        if zstandard is not None and encodings["zstd"] > 0:
+            response.set_data(_zstd_compress(body))
+            response.headers["Content-Encoding"] = "zstd"
+        elif encodings["gzip"] > 0:
+            response.set_data(gzip.compress(body, compresslevel=WIRE_GZIP_LEVEL, mtime=0))
+            response.headers["Content-Encoding"] = "gzip"
+    return response
@@ -0,0 +1,87 @@
+"""Pipelined requests over one WebSocket connection.
+
+Every message is a request object with an "id"; it is handled on a small
+per-connection thread pool and its response, tagged with the same id, is sent
+as soon as it is ready, so responses may arrive out of order. Text frames carry
+JSON, binary frames MessagePack (answered in kind).
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from wire_format import msgpack
+
+# Необязательная зависимость: без flask-sock эндпоинт /ws не регистрируется
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
+    ConnectionClosed = None
+
+# Requests handled concurrently per connection; reading stops while all are busy
+WS_MAX_IN_FLIGHT = int(os.environ.get("WS_MAX_IN_FLIGHT", 16))
+# Открытых соединений на воркер: с gthread каждое занимает поток запросов на всё время жизни,
+# поэтому по умолчанию не больше четверти GUNICORN_THREADS; для gevent лимит можно поднять
+WS_MAX_CONNECTIONS = int(os.environ.get("WS_MAX_CONNECTIONS", max(1, int(os.environ.get("GUNICORN_THREADS", 8)) // 4)))
+
+
+class PipelinedConnection:
+    """Serves one connection: handle(request) returns (payload, status) for a decoded request."""
+
+    def __init__(self, ws, handle, max_in_flight=WS_MAX_IN_FLIGHT):
+        self.ws = ws
+        self.handle = handle
+        self.max_in_flight = max_in_flight
+        self._send_lock = threading.Lock()
+
+    def _decode(self, message):
+        if isinstance(message, bytes):
+            if msgpack is None:
+                raise ValueError("MessagePack is not supported by this server")
+            data = msgpack.unpackb(message, raw=False)
+        else:
+            data = json.loads(message)
+        if not isinstance(data, dict):
+            raise ValueError("Request must be an object")
+        return data
+
+    def send(self, payload, binary):
+        if binary:
+            message = msgpack.packb(payload, use_bin_type=True)
+        else:
+            message = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        with self._send_lock:
+            self.ws.send(message)
+
+    def _process(self, data, binary):
+        try:
+            payload, status = self.handle(data)
+        except Exception as e:
+            payload, status = {"error": str(e)}, 500
+        try:
+            self.send({"id": data.get("id"), "status": status, **payload}, binary)
+        except ConnectionClosed:
+            pass
+
+    def run(self):
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        executor = ThreadPoolExecutor(self.max_in_flight, thread_name_prefix="ws")
+        try:
+            while True:
+                message = self.ws.receive()
+                # Without msgpack a binary frame can't be decoded, nor answered in kind
+                binary = isinstance(message, bytes) and msgpack is not None
+                try:
+                    data = self._decode(message)
+                except Exception as e:
+                    self.send({"id": None, "status": 400, "error": f"Invalid message: {str(e)}"}, binary)
+                    continue
+                slots.acquire()
+                future = executor.submit(self._process, data, binary)
+                future.add_done_callback(lambda _: slots.release())
+        except ConnectionClosed:
+            pass
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)